@@ -0,0 +1,55 @@
+import json
+import time
+
+
+class HashCache:
+    """ Maps the stat information of a file to the checksum of its content.
+
+    A file is identified by (device, inode, size, mtime_ns, ctime_ns). If any of these values changes the cached
+    checksum is not used anymore and the file is hashed again.
+    """
+    VERSION = 1
+    # Files modified within this window are not cached, because a later modification could happen within the same
+    # timestamp granularity of the file system and would not be detected.
+    RACY_WINDOW_NS = 2 * 10**9
+
+    def __init__(self, entries=None):
+        self.entries = dict() if entries is None else entries
+        self.new_entries = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(file_stat):
+        return (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ctime_ns)
+
+    def get(self, file_stat):
+        key = HashCache.key(file_stat)
+        checksum = self.new_entries.get(key) or self.entries.get(key)
+        if checksum is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.new_entries[key] = checksum
+        return checksum
+
+    def set(self, file_stat, checksum):
+        now_ns = int(time.time() * 10**9)
+        if file_stat.st_mtime_ns >= now_ns - self.RACY_WINDOW_NS:
+            return
+        self.new_entries[HashCache.key(file_stat)] = checksum
+
+    def to_json(self):
+        """ Serializes only the entries that were used or added since the cache was loaded, so entries of deleted or
+        modified files are dropped.
+        """
+        return json.dumps(dict(version=self.VERSION,
+                               entries=[list(key) + [checksum] for key, checksum in self.new_entries.items()]))
+
+    @staticmethod
+    def from_json(json_str):
+        cache_dict = json.loads(json_str)
+        if cache_dict.get('version') != HashCache.VERSION:
+            return HashCache()
+        return HashCache({tuple(entry[:5]): entry[5] for entry in cache_dict['entries']})
@@ -1,32 +1,65 @@
 from datetime import datetime
+import fnmatch
 import json
 import os
 import re
 import stat
+import sys
 
-import xxhash
-
+from . import serialization
+from .hashing import FileHasher, ParallelFileHasher, DEFAULT_HASH_ALGORITHM, get_hash_algorithm
+from .ignore import IgnoreMatcher
+from .scanning import ParallelScanner
 from .utils import datetime_from_iso_format
 
 
+# names containing wildcards of fnmatch
+WILDCARDS = re.compile('[*?[]')
+
+# the int objects of all permissions, shared by the nodes instead of one int object per node
+PERMISSIONS = tuple(range(0o10000))
+
+
 class TreeNode:
+    """ A node of a checkpoint tree.
+
+    Checkpoints may have millions of nodes, so nodes have no __dict__, their names are interned, as the same names
+    appear in many directories, and their checksums are kept as raw digests, which the checksum property converts
+    from and to hex strings.
+    """
+    __slots__ = ('name', 'digest', 'permissions')
+
     def __init__(self, name, checksum, permissions):
-        self.name = name
+        self.name = sys.intern(name)
         self.checksum = checksum
-        self.permissions = permissions
+        self.permissions = PERMISSIONS[permissions]
+
+    @property
+    def checksum(self):
+        return None if self.digest is None else self.digest.hex()
+
+    @checksum.setter
+    def checksum(self, checksum):
+        self.digest = None if checksum is None else bytes.fromhex(checksum)
 
     def to_dict(self):
         raise NotImplementedError()
 
     @staticmethod
-    def build_node(path, name):
-        if os.path.islink(path):
-            return SymlinkNode.build_node(path, name)
-        elif os.path.isfile(path):
-            return FileNode.build_node(path, name)
-        elif os.path.isdir(path):
-            return DirectoryNode.build_node(path, name)
-        
+    def build_node(path, name, hasher=None, ignore=None):
+        """
+        :param ignore: the IgnoreMatcher of the directory at path, nothing is ignored if None
+        """
+        if hasher is None:
+            hasher = FileHasher()
+        path_stat = os.lstat(path)
+        if stat.S_ISLNK(path_stat.st_mode):
+            return SymlinkNode.build_node(path, name, path_stat, hasher.hash_algorithm)
+        elif stat.S_ISREG(path_stat.st_mode):
+            return FileNode.build_node(path, name, hasher, path_stat)
+        elif stat.S_ISDIR(path_stat.st_mode):
+            return DirectoryNode.build_node(path, name, hasher, path_stat, ignore)
+
         print('Could not backup: ' + path)
 
     @staticmethod
@@ -42,9 +75,13 @@ class TreeNode:
 
 
 class DirectoryNode(TreeNode):
+    __slots__ = ('children', 'tree_key')
+
     def __init__(self, name, checksum, permissions, children):
         super().__init__(name, checksum, permissions)
         self.children = children
+        # the key of the tree object of the directory (see bakker.trees), None until it is computed
+        self.tree_key = None
 
     def to_dict(self):
         return {
@@ -56,33 +93,158 @@ class DirectoryNode(TreeNode):
                }
 
     @staticmethod
-    def build_node(path, name):
-        assert os.path.isdir(path)
+    def build_node(path, name, hasher=None, dir_stat=None, ignore=None):
+        """ Builds the directory node by a single os.scandir pass over the directory.
+
+        The type of each entry comes from the DirEntry and the permissions from its lstat result, which is the only
+        stat call per entry. Only symlinks are additionally followed, to ignore broken ones. Ignored entries are
+        skipped before they are stat'ed, ignored directories are not listed at all.
+
+        :param ignore: the IgnoreMatcher of the directory, nothing is ignored if None
+        """
+        if dir_stat is None:
+            dir_stat = os.lstat(path)
+        assert stat.S_ISDIR(dir_stat.st_mode)
+        if hasher is None:
+            hasher = FileHasher()
 
-        permissions = stat.S_IMODE(os.lstat(path).st_mode)
+        permissions = stat.S_IMODE(dir_stat.st_mode)
+
+        entries = os.scandir(path)
+        if ignore is not None:
+            entries = list(entries)
+            ignore = ignore.enter(path, entries)
 
         children = dict()
-        for child_name in os.listdir(path):
-            child_path = os.path.join(path, child_name)
-            if not os.path.isfile(child_path) and not os.path.isdir(child_path):
-                print("Ignored: " + child_path)
+        for entry in entries:
+            if ignore is not None and ignore.is_ignored(entry.name, entry.is_dir(follow_symlinks=False)):
                 continue
-            children[child_name] = TreeNode.build_node(child_path, child_name)
+            child = DirectoryNode.build_child(entry, hasher, ignore=ignore)
+            if child is not None:
+                # keyed by the interned name of the node
+                children[child.name] = child
 
-        child_checksums = [children[child_name].checksum for child_name in sorted(children.keys())]
-        message = xxhash.xxh64()
-        for child_digest in child_checksums:
-            message.update(child_digest)
-        checksum = message.hexdigest()
+        node = DirectoryNode(name, None, permissions, children)
+        # the checksums of the children may still be pending in a ParallelFileHasher
+        if all(child.digest is not None for child in children.values()):
+            node.update_checksum(hasher.hash_algorithm)
+        return node
 
-        return DirectoryNode(name, checksum, permissions, children)
+    @staticmethod
+    def build_child(entry, hasher, recursive=True, ignore=None):
+        """ Builds the node of a DirEntry, or returns None if the entry is ignored.
+
+        :param recursive: build the nodes below a directory, otherwise its node is returned without children
+        :param ignore: the IgnoreMatcher of the directory of the entry, see build_node
+        """
+        if entry.is_symlink():
+            if not entry.is_file() and not entry.is_dir():
+                print("Ignored: " + entry.path)
+                return None
+            return SymlinkNode.build_node(entry.path, entry.name, entry.stat(follow_symlinks=False),
+                                          hasher.hash_algorithm)
+        elif entry.is_file(follow_symlinks=False):
+            return FileNode.build_node(entry.path, entry.name, hasher, entry.stat(follow_symlinks=False))
+        elif entry.is_dir(follow_symlinks=False):
+            if not recursive:
+                return DirectoryNode(entry.name, None, stat.S_IMODE(entry.stat(follow_symlinks=False).st_mode),
+                                     dict())
+            return DirectoryNode.build_node(entry.path, entry.name, hasher, entry.stat(follow_symlinks=False),
+                                            None if ignore is None else ignore.descend(entry.name))
+        print("Ignored: " + entry.path)
+        return None
+
+    def update_checksum(self, hash_algorithm=None):
+        """ Computes the checksum of the directory from the checksums of its children, updating pending
+        checksums of subdirectories first.
+
+        :param hash_algorithm: the HashAlgorithm of the checkpoint, DEFAULT_HASH_ALGORITHM if None
+        """
+        hash_algorithm = DEFAULT_HASH_ALGORITHM if hash_algorithm is None else hash_algorithm
+        message = hash_algorithm.new()
+        for child_name in sorted(self.children.keys()):
+            child = self.children[child_name]
+            if child.digest is None and isinstance(child, DirectoryNode):
+                child.update_checksum(hash_algorithm)
+            message.update(child.checksum.encode())
+        self.checksum = message.hexdigest()
+
+    def get_child(self, name):
+        """ Returns the child with the given name or None. """
+        return self.children.get(name)
 
     @staticmethod
     def from_dict(d):
-        return DirectoryNode(d['name'], d['checksum'], d['permissions'], {child['name']: TreeNode.from_dict(child) for child in d['children']})
+        children = (TreeNode.from_dict(child) for child in d['children'])
+        return DirectoryNode(d['name'], d['checksum'], d['permissions'], {child.name: child for child in children})
+
+
+class LazyDirectoryNode(DirectoryNode):
+    """ A directory node of a loaded binary checkpoint whose children are decoded when they are first accessed.
+
+    :param tree_buffer: the TreeBuffer the node was decoded from
+    :param table_position: the position of the child offset table in the buffer
+    :param tree_key: the tree key of the directory
+    """
+    __slots__ = ('_tree_buffer', '_table_position', '_child_count', '_children')
+
+    def __init__(self, name, checksum, permissions, tree_buffer, table_position, child_count, tree_key):
+        TreeNode.__init__(self, name, checksum, permissions)
+        self.tree_key = tree_key
+        self._tree_buffer = tree_buffer
+        self._table_position = table_position
+        self._child_count = child_count
+        self._children = None
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = dict()
+            for child_offset in self._tree_buffer.child_offsets(self._table_position, self._child_count):
+                child = self._tree_buffer.node(child_offset)
+                self._children[child.name] = child
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    def get_child(self, name):
+        if self._children is not None:
+            return self._children.get(name)
+        child_offset = self._tree_buffer.find_child(self._table_position, self._child_count, name)
+        return None if child_offset is None else self._tree_buffer.node(child_offset)
+
+
+class StoredDirectoryNode(DirectoryNode):
+    """ A directory node of a checkpoint stored as tree objects, see bakker.trees. Its children are loaded from its
+    tree object when they are first accessed.
+
+    :param tree_key: the key of the tree object of the directory
+    :param load_children: function returning the children of the tree object with the given key
+    """
+    __slots__ = ('_load_children', '_children')
+
+    def __init__(self, name, checksum, permissions, tree_key, load_children):
+        TreeNode.__init__(self, name, checksum, permissions)
+        self.tree_key = tree_key
+        self._load_children = load_children
+        self._children = None
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = self._load_children(self.tree_key)
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
 
 
 class FileNode(TreeNode):
+    __slots__ = ()
+
     def to_dict(self):
         return {
                 'name': self.name,
@@ -92,23 +254,18 @@ class FileNode(TreeNode):
                }
 
     @staticmethod
-    def build_node(path, name):
-        assert os.path.isfile(path)
-        assert not os.path.islink(path)
-
-        permissions = stat.S_IMODE(os.lstat(path).st_mode)
-
-        BLOCKSIZE = 65536
+    def build_node(path, name, hasher=None, file_stat=None):
+        if file_stat is None:
+            file_stat = os.lstat(path)
+        assert stat.S_ISREG(file_stat.st_mode)
+        if hasher is None:
+            hasher = FileHasher()
 
-        message = xxhash.xxh64()
-        with open(path, 'rb') as f:
-            file_buffer = f.read(BLOCKSIZE)
-            while len(file_buffer) > 0:
-                message.update(file_buffer)
-                file_buffer = f.read(BLOCKSIZE)
-        checksum = message.hexdigest()
+        permissions = stat.S_IMODE(file_stat.st_mode)
 
-        return FileNode(name, checksum, permissions)
+        node = FileNode(name, None, permissions)
+        hasher.submit(node, path, file_stat)
+        return node
 
     @staticmethod
     def from_dict(d):
@@ -116,6 +273,8 @@ class FileNode(TreeNode):
 
 
 class SymlinkNode(TreeNode):
+    __slots__ = ()
+
     def to_dict(self):
         return {
                 'name': self.name,
@@ -125,16 +284,20 @@ class SymlinkNode(TreeNode):
                }
 
     @staticmethod
-    def build_node(path, name):
-        assert os.path.islink(path)
-
-        permissions = stat.S_IMODE(os.lstat(path).st_mode)
+    def build_node(path, name, link_stat=None, hash_algorithm=None):
+        if link_stat is None:
+            link_stat = os.lstat(path)
+        assert stat.S_ISLNK(link_stat.st_mode)
+        if hash_algorithm is None:
+            hash_algorithm = DEFAULT_HASH_ALGORITHM
 
-        message = xxhash.xxh64()
-        message.update(os.readlink(path))
-        checksum = message.hexdigest()
+        permissions = stat.S_IMODE(link_stat.st_mode)
+        return SymlinkNode(name, SymlinkNode.link_checksum(path, hash_algorithm), permissions)
 
-        return SymlinkNode(name, checksum, permissions)
+    @staticmethod
+    def link_checksum(path, hash_algorithm):
+        """ Returns the checksum of a symlink, the checksum of its target path. """
+        return hash_algorithm.hexdigest(os.fsencode(os.readlink(path)))
 
     @staticmethod
     def from_dict(d):
@@ -142,19 +305,57 @@ class SymlinkNode(TreeNode):
 
 
 class Checkpoint:
-    def __init__(self, root, time=None, name=None):
+    def __init__(self, root, time=None, name=None, hash_algorithm=None, ignore_patterns=None):
+        """
+        :param hash_algorithm: the HashAlgorithm all checksums of the checkpoint were computed with,
+            DEFAULT_HASH_ALGORITHM if None
+        :param ignore_patterns: the config patterns of paths that were ignored when the checkpoint was built (see
+            bakker.ignore), the .bakkerignore files are part of the checkpoint themselves
+        """
         assert name is None or re.match('^[a-zA-Z0-9_\-.]+$', name)
 
         self.root = root
         self.time = datetime.now() if time is None else time
         self.name = name
+        self.hash_algorithm = DEFAULT_HASH_ALGORITHM if hash_algorithm is None else hash_algorithm
+        self.ignore_patterns = [] if ignore_patterns is None else list(ignore_patterns)
 
     @property
     def meta(self):
         return CheckpointMeta(self.root.checksum, self.time, self.name)
 
     def to_json(self):
-        return json.dumps(dict(root=self.root.to_dict(), time=self.time.isoformat(), name=self.name), indent=2)
+        return json.dumps(dict(root=self.root.to_dict(), time=self.time.isoformat(), name=self.name,
+                               hash=self.hash_algorithm.name, ignore=self.ignore_patterns), indent=2)
+
+    def dump_json(self, f):
+        """ Writes the checkpoint like to_json to the text file object f, but node by node instead of building a
+        dict and a string of the whole checkpoint first.
+        """
+        f.write('{"time": ' + json.dumps(self.time.isoformat()) + ', "name": ' + json.dumps(self.name) +
+                ', "hash": ' + json.dumps(self.hash_algorithm.name) + ', "ignore": ' + json.dumps(self.ignore_patterns) +
+                ', "root": ')
+        # nodes still to be written and the separators and brackets between them
+        stack = [self.root]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                f.write(item)
+            elif isinstance(item, DirectoryNode):
+                record = dict(name=item.name, checksum=item.checksum, permissions=item.permissions, type='directory')
+                f.write(json.dumps(record)[:-1] + ', "children": [')
+                stack.append(']}')
+                for i, child in enumerate(reversed(list(item.children.values()))):
+                    if i:
+                        stack.append(', ')
+                    stack.append(child)
+            else:
+                f.write(json.dumps(item.to_dict()))
+        f.write('}')
+
+    def dump(self, f, codec=None, level=None):
+        """ Writes the checkpoint in the binary format to the binary file object f, see bakker.serialization. """
+        serialization.dump(self, f, codec, level)
 
     def iter(self):
         stack = [(self.root, '')]
@@ -166,16 +367,181 @@ class Checkpoint:
                 for child_name, child_node in current_node.children.items():
                     stack.append((child_node, os.path.join(current_path, child_name)))
 
+    def lookup(self, path):
+        """ Returns the node at the path relative to the root of the checkpoint, or None if it does not exist.
+
+        Only the directories on the path are decoded for a loaded binary checkpoint.
+        """
+        node = self.root
+        for name in path.split(os.sep):
+            if name in ('', '.'):
+                continue
+            if not isinstance(node, DirectoryNode):
+                return None
+            node = node.get_child(name)
+            if node is None:
+                return None
+        return node
+
+    def glob(self, pattern):
+        """ Yields the (node, relative path) pairs of the nodes whose paths match the pattern, a path relative to the
+        root of the checkpoint whose names may contain the wildcards of fnmatch. A name ** matches zero or more
+        directories.
+
+        Only the directories on the paths are visited, names without wildcards are looked up like by lookup().
+        """
+        names = [name for name in pattern.replace(os.sep, '/').split('/') if name not in ('', '.')]
+        visited = set()
+        # (node, relative path, index of the next name of the pattern)
+        stack = [(self.root, '', 0)]
+        while stack:
+            node, path, i = stack.pop()
+            if i == len(names):
+                if path not in visited:
+                    visited.add(path)
+                    yield node, path
+                continue
+            if not isinstance(node, DirectoryNode):
+                continue
+            name = names[i]
+            if name == '**':
+                stack.append((node, path, i + 1))
+                stack.extend((child, os.path.join(path, child_name), i)
+                             for child_name, child in node.children.items() if isinstance(child, DirectoryNode))
+            elif not WILDCARDS.search(name):
+                child = node.get_child(name)
+                if child is not None:
+                    stack.append((child, os.path.join(path, name), i + 1))
+            else:
+                stack.extend((child, os.path.join(path, child_name), i + 1)
+                             for child_name, child in node.children.items() if fnmatch.fnmatchcase(child_name, name))
+
     @staticmethod
-    def build_checkpoint(path, name=None):
-        root = TreeNode.build_node(path, '')
-        return Checkpoint(root, name=name)
+    def build_checkpoint(path, name=None, hash_cache=None, workers=None, use_processes=False, hash_function=None,
+                         hash_algorithm=None, scan_processes=None, ignore_patterns=None):
+        """ Builds the checkpoint of the directory at path.
+
+        :param hash_cache: HashCache that is used to skip hashing of unchanged files
+        :param workers: number of threads (or processes) hashing files concurrently, files are hashed serially if None
+        :param use_processes: hash files in a process pool instead of a thread pool
+        :param hash_function: function returning the checksum of a file, see FileHasher
+        :param hash_algorithm: the HashAlgorithm of the checksums, DEFAULT_HASH_ALGORITHM if None
+        :param scan_processes: number of processes walking the directory tree (see bakker.scanning), it is walked
+            in this process if None
+        :param ignore_patterns: patterns of paths that are ignored in addition to the ones of the .bakkerignore files,
+            see bakker.ignore
+        """
+        if workers is None:
+            hasher = FileHasher(hash_cache, hash_function, hash_algorithm)
+        else:
+            hasher = ParallelFileHasher(workers, hash_cache, use_processes, hash_function=hash_function,
+                                        hash_algorithm=hash_algorithm)
+
+        try:
+            ignore = IgnoreMatcher.from_patterns(ignore_patterns)
+            if scan_processes is None:
+                root = TreeNode.build_node(path, '', hasher, ignore)
+            else:
+                root = ParallelScanner(scan_processes).build_node(path, hasher, ignore)
+        finally:
+            hasher.join()
+        if isinstance(root, DirectoryNode) and root.digest is None:
+            root.update_checksum(hasher.hash_algorithm)
+        return Checkpoint(root, name=name, hash_algorithm=hasher.hash_algorithm, ignore_patterns=ignore_patterns)
+
+    @staticmethod
+    def build_nodes(path, hasher, ignore=None):
+        """ Builds the nodes of the directory at path and yields them with their paths relative to it in post-order,
+        every node with its checksum, every directory after its children and the root last.
+
+        Only the directories that are not complete yet and their children are kept in memory. Once a directory was
+        yielded and the generator is resumed, its children are dropped, its checksum and tree key remain.
+
+        :param ignore: the IgnoreMatcher of the directory at path, nothing is ignored if None
+        """
+        path_stat = os.lstat(path)
+        if not stat.S_ISDIR(path_stat.st_mode):
+            node = TreeNode.build_node(path, '', hasher)
+            hasher.complete([node])
+            yield node, ''
+            return
+
+        def open_directory(node, relative_path, dir_path, ignore):
+            entries = list(os.scandir(dir_path))
+            if ignore is not None:
+                ignore = ignore.enter(dir_path, entries)
+            return node, relative_path, dir_path, entries, ignore
+
+        root = DirectoryNode('', None, stat.S_IMODE(path_stat.st_mode), dict())
+        # (directory node, relative path, path, entries still to be built, IgnoreMatcher of the entries)
+        stack = [open_directory(root, '', path, ignore)]
+        while stack:
+            directory, relative_path, dir_path, entries, ignore = stack[-1]
+            if entries:
+                entry = entries.pop()
+                if ignore is not None and ignore.is_ignored(entry.name, entry.is_dir(follow_symlinks=False)):
+                    continue
+                child = DirectoryNode.build_child(entry, hasher, recursive=False)
+                if child is None:
+                    continue
+                directory.children[child.name] = child
+                if isinstance(child, DirectoryNode):
+                    stack.append(open_directory(child, os.path.join(relative_path, child.name), entry.path,
+                                                None if ignore is None else ignore.descend(child.name)))
+                continue
+
+            stack.pop()
+            leaves = [child for child in directory.children.values() if not isinstance(child, DirectoryNode)]
+            hasher.complete(leaves)
+            for leaf in leaves:
+                yield leaf, os.path.join(relative_path, leaf.name)
+            directory.update_checksum(hasher.hash_algorithm)
+            yield directory, relative_path
+            directory.children = dict()
+
+    @staticmethod
+    def write_checkpoint(path, f, name=None, hash_cache=None, workers=None, use_processes=False, hash_function=None,
+                         hash_algorithm=None, codec=None, level=None, process_nodes=None, ignore_patterns=None):
+        """ Builds the checkpoint of the directory at path and writes it to the binary file object f while it is
+        built, see build_nodes and serialization.CheckpointWriter. The memory used depends on the depth and the
+        width of the directory tree, not on its size. The parameters are the ones of build_checkpoint and dump.
+
+        :param process_nodes: function returning an iterator over the (node, relative path) pairs of the given one,
+            through which the nodes pass before they are written, e.g. Storage.store_nodes
+        :returns: the CheckpointMeta of the checkpoint
+        """
+        if workers is None:
+            hasher = FileHasher(hash_cache, hash_function, hash_algorithm)
+        else:
+            hasher = ParallelFileHasher(workers, hash_cache, use_processes, hash_function=hash_function,
+                                        hash_algorithm=hash_algorithm)
+
+        time = datetime.now()
+        writer = serialization.CheckpointWriter(f, time, name, hasher.hash_algorithm, codec=codec, level=level,
+                                                ignore_patterns=ignore_patterns)
+        nodes = Checkpoint.build_nodes(path, hasher, IgnoreMatcher.from_patterns(ignore_patterns))
+        if process_nodes is not None:
+            nodes = process_nodes(nodes)
+        root = None
+        try:
+            for root, _ in nodes:
+                writer.add(root)
+        finally:
+            hasher.join()
+        writer.close()
+        return CheckpointMeta(root.checksum, time, name)
 
     @staticmethod
     def from_json(json_str):
         tree_dict = json.loads(json_str)
 
-        return Checkpoint(TreeNode.from_dict(tree_dict['root']), time=datetime_from_iso_format(tree_dict['time']), name=tree_dict['name'])
+        return Checkpoint(TreeNode.from_dict(tree_dict['root']), time=datetime_from_iso_format(tree_dict['time']), name=tree_dict['name'],
+                          hash_algorithm=get_hash_algorithm(tree_dict.get('hash', DEFAULT_HASH_ALGORITHM.name)),
+                          ignore_patterns=tree_dict.get('ignore'))
+
+    @staticmethod
+    def load(f):
+        return serialization.load(f)
 
 
 class CheckpointMeta:
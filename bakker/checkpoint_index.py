@@ -0,0 +1,210 @@
+import bisect
+import os
+
+from .checkpoint import CheckpointMeta
+
+
+class CheckpointIndex:
+    """ Persistent index of the checkpoint files of a storage.
+
+    The index file is a header line followed by one checkpoint file name per line, new checkpoints are appended. In
+    memory the checkpoints are kept sorted by time and by checksum, so checksum prefixes and time ranges are found by
+    binary searches, and by name in a dict.
+
+    The index is rebuilt from the checkpoint directory if it is missing or cannot be parsed, e.g. after a crash during
+    an append, and if the checkpoint directory was modified after the index, e.g. by a version without the index.
+
+    :param index_file_path: the index file
+    :param tree_path: the directory containing the checkpoint files
+    :param tree_file_exts: the checkpoint file extensions, in the order of preference if a checkpoint exists in more
+        than one format
+    """
+    HEADER = 'bakker checkpoint index 1\n'
+    TMP_FILE_EXT = '.tmp'
+
+    def __init__(self, index_file_path, tree_path, tree_file_exts):
+        self.index_file_path = index_file_path
+        self.tree_path = tree_path
+        self.tree_file_exts = tree_file_exts
+
+        self._index_stat_key = None
+        self._tree_file_names = dict()
+        self._by_time = []
+        self._by_checksum = []
+        self._by_name = dict()
+
+    def _split_tree_file_name(self, tree_file_name):
+        """ Returns the checkpoint meta string and file extension, or None if the file is no checkpoint. """
+        for tree_file_ext in self.tree_file_exts:
+            if tree_file_name.endswith(tree_file_ext):
+                return tree_file_name[:-len(tree_file_ext)], tree_file_ext
+        return None
+
+    @staticmethod
+    def _stat_key(path):
+        try:
+            path_stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return path_stat.st_mtime_ns, path_stat.st_size, path_stat.st_ino
+
+    def refresh(self):
+        """ Loads the index file if it changed since it was loaded and rebuilds it if it is invalid or stale. """
+        index_stat_key = CheckpointIndex._stat_key(self.index_file_path)
+        tree_stat_key = CheckpointIndex._stat_key(self.tree_path)
+        if index_stat_key is not None and (tree_stat_key is None or tree_stat_key[0] <= index_stat_key[0]):
+            if index_stat_key == self._index_stat_key:
+                return
+            if self._load():
+                self._index_stat_key = index_stat_key
+                return
+        self.rebuild()
+
+    def _load(self):
+        try:
+            with open(self.index_file_path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                if f.readline() != self.HEADER:
+                    return False
+                tree_file_names = f.read()
+        except OSError:
+            return False
+        if tree_file_names and not tree_file_names.endswith('\n'):
+            # an interrupted append
+            return False
+
+        self._clear()
+        try:
+            for tree_file_name in tree_file_names.splitlines():
+                self._add(tree_file_name, keep_sorted=False)
+        except ValueError:
+            return False
+        self._sort()
+        return True
+
+    def _clear(self):
+        self._tree_file_names.clear()
+        self._by_time.clear()
+        self._by_checksum.clear()
+        self._by_name.clear()
+
+    def _sort(self):
+        self._by_time.sort()
+        self._by_checksum.sort()
+
+    def _add(self, tree_file_name, keep_sorted=True):
+        split = self._split_tree_file_name(tree_file_name)
+        if split is None:
+            raise ValueError('Not a checkpoint file: ' + tree_file_name)
+        meta_string, tree_file_ext = split
+
+        previous_tree_file_name = self._tree_file_names.get(meta_string)
+        if previous_tree_file_name is not None:
+            previous_tree_file_ext = self._split_tree_file_name(previous_tree_file_name)[1]
+            if self.tree_file_exts.index(tree_file_ext) < self.tree_file_exts.index(previous_tree_file_ext):
+                self._tree_file_names[meta_string] = tree_file_name
+            return
+
+        try:
+            meta = CheckpointMeta.from_string(meta_string)
+        except IndexError:
+            meta = None
+        if meta is None or meta.time is None:
+            raise ValueError('Invalid checkpoint file name: ' + tree_file_name)
+        self._tree_file_names[meta_string] = tree_file_name
+        # the meta strings are unique, so the metas themselves are never compared
+        if keep_sorted:
+            bisect.insort(self._by_time, (meta.time, meta_string, meta))
+            bisect.insort(self._by_checksum, (meta.checksum, meta_string, meta))
+        else:
+            self._by_time.append((meta.time, meta_string, meta))
+            self._by_checksum.append((meta.checksum, meta_string, meta))
+        if meta.name is not None:
+            self._by_name.setdefault(meta.name, []).append(meta)
+
+    def rebuild(self):
+        """ Rebuilds the index from the checkpoint directory. The index file is only rewritten if the storage is
+        writable, the index of a read-only storage is kept in memory and rebuilt by every refresh().
+        """
+        self._clear()
+        tree_file_names = []
+        if os.path.isdir(self.tree_path):
+            for tree_file_name in sorted(os.listdir(self.tree_path)):
+                if self._split_tree_file_name(tree_file_name) is None:
+                    continue
+                try:
+                    self._add(tree_file_name, keep_sorted=False)
+                except ValueError:
+                    continue
+                tree_file_names.append(tree_file_name)
+        self._sort()
+
+        index_dir_path = os.path.dirname(self.index_file_path)
+        if not os.path.isdir(index_dir_path):
+            self._index_stat_key = None
+            return
+        tmp_index_file_path = self.index_file_path + self.TMP_FILE_EXT
+        try:
+            with open(tmp_index_file_path, 'w', encoding='utf-8', errors='surrogateescape') as f:
+                f.write(self.HEADER)
+                f.writelines(tree_file_name + '\n' for tree_file_name in tree_file_names)
+            os.replace(tmp_index_file_path, self.index_file_path)
+        except OSError:
+            # e.g. a read-only storage
+            if os.path.exists(tmp_index_file_path):
+                try:
+                    os.remove(tmp_index_file_path)
+                except OSError:
+                    pass
+            self._index_stat_key = None
+            return
+        self._index_stat_key = CheckpointIndex._stat_key(self.index_file_path)
+
+    def add(self, tree_file_name):
+        """ Appends a checkpoint file that was just written to the checkpoint directory.
+
+        refresh() has to be called before the checkpoint file is written, otherwise the new file makes the index stale.
+        """
+        if self._index_stat_key is None:
+            self.rebuild()
+            return
+
+        self._add(tree_file_name)
+        with open(self.index_file_path, 'a', encoding='utf-8', errors='surrogateescape') as f:
+            f.write(tree_file_name + '\n')
+        self._index_stat_key = CheckpointIndex._stat_key(self.index_file_path)
+
+    def tree_file_name(self, checkpoint_meta):
+        """ Returns the name of the checkpoint file or None if the checkpoint does not exist. """
+        self.refresh()
+        return self._tree_file_names.get(checkpoint_meta.to_string())
+
+    def metas(self):
+        """ Returns the metas of all checkpoints, sorted by time. """
+        self.refresh()
+        return [meta for _, _, meta in self._by_time]
+
+    def find_by_checksum(self, checksum):
+        """ Returns the metas of the checkpoints whose checksum starts with the given checksum. """
+        self.refresh()
+        i = bisect.bisect_left(self._by_checksum, (checksum,))
+        metas = []
+        while i < len(self._by_checksum) and self._by_checksum[i][0].startswith(checksum):
+            metas.append(self._by_checksum[i][2])
+            i += 1
+        return metas
+
+    def find_by_name(self, name):
+        """ Returns the metas of the checkpoints with the given name. """
+        self.refresh()
+        return list(self._by_name.get(name, []))
+
+    def find_by_time(self, start=None, end=None):
+        """ Returns the metas of the checkpoints created at or after start and before end, sorted by time.
+
+        :param start: a datetime, unbounded if None
+        :param end: a datetime, unbounded if None
+        """
+        self.refresh()
+        low = 0 if start is None else bisect.bisect_left(self._by_time, (start,))
+        high = len(self._by_time) if end is None else bisect.bisect_left(self._by_time, (end,))
+        return [meta for _, _, meta in self._by_time[low:high]]
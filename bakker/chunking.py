@@ -0,0 +1,78 @@
+import random
+
+
+def _gear_table():
+    generator = random.Random(0x62616B6B6572)
+    return [generator.getrandbits(64) for _ in range(256)]
+
+
+GEAR = _gear_table()
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+
+class Chunker:
+    """ Splits a stream into content defined chunks with the FastCDC gear hash.
+
+    Chunk boundaries only depend on the bytes preceding them within the chunk, so inserting or removing data only
+    changes the chunks around the edit. Normalized chunking uses a stricter mask below the average chunk size and a
+    looser one above it, which keeps chunk sizes close to the average.
+    """
+    READ_SIZE = 1 << 20
+
+    def __init__(self, min_size=256 * 1024, avg_size=1024 * 1024, max_size=4 * 1024 * 1024):
+        assert 0 < min_size <= avg_size <= max_size
+
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+
+        bits = avg_size.bit_length() - 1
+        self.mask_small = Chunker._mask(bits + 1)
+        self.mask_large = Chunker._mask(bits - 1)
+
+    @staticmethod
+    def _mask(bits):
+        # the upper bits of the gear hash depend on the most bytes of the window
+        return ((1 << bits) - 1) << (64 - bits)
+
+    def cut_point(self, data, start, end):
+        """ Returns the end of the chunk starting at data[start], data[end] being the end of the available data. """
+        length = end - start
+        if length <= self.min_size:
+            return end
+        if length > self.max_size:
+            end = start + self.max_size
+        normal = min(start + self.avg_size, end)
+
+        # iterating over a memoryview is considerably faster than indexing the buffer in pure Python
+        gear = GEAR
+        h = 0
+        offset = start + self.min_size
+        for mask, region_end in ((self.mask_small, normal), (self.mask_large, end)):
+            for i, byte in enumerate(memoryview(data)[offset:region_end], offset):
+                h = ((h << 1) + gear[byte]) & MASK_64
+                if not h & mask:
+                    return i + 1
+            offset = max(offset, region_end)
+        return end
+
+    def chunks(self, f):
+        """ Yields the chunks of the binary file object f as bytes. """
+        buffer = bytearray()
+        start = 0
+        eof = False
+        while True:
+            if not eof and len(buffer) - start <= self.max_size:
+                del buffer[:start]
+                start = 0
+                block = f.read(self.READ_SIZE)
+                if block:
+                    buffer += block
+                    continue
+                eof = True
+            if start == len(buffer):
+                return
+
+            end = self.cut_point(buffer, start, len(buffer))
+            yield bytes(buffer[start:end])
+            start = end
@@ -1,12 +1,20 @@
 import os
+import shutil
 import sys
 
 import click
 
-from bakker.checkpoint import Checkpoint
+from bakker.checkpoint import Checkpoint, DirectoryNode
+from bakker.diff import diff, ADDED, REMOVED, MODIFIED, PERMISSIONS_CHANGED
+from bakker.restore import NoMatchError, RestoreError
 from bakker.storage import FileSystemStorage, NoUniqueMatchError
+from bakker.verify import Verifier
+from bakker.view import CheckpointView, PathNotFoundError
 
-from bakker.config import Config, DEFAULT_STORAGE_KEY, DEFAULT_STORAGE_CHOICES, STORAGE_FILE_SYSTEM_PATH
+from bakker.config import Config, DEFAULT_STORAGE_KEY, DEFAULT_STORAGE_CHOICES, STORAGE_FILE_SYSTEM_PATH, \
+    STORAGE_FILE_SYSTEM_CHUNKING, STORAGE_FILE_SYSTEM_FAN_OUT, STORAGE_FILE_SYSTEM_PACKING, \
+    STORAGE_FILE_SYSTEM_COMPRESSION, STORAGE_FILE_SYSTEM_COMPRESSION_LEVEL, STORAGE_FILE_SYSTEM_CHECKPOINT_FORMAT, \
+    STORAGE_FILE_SYSTEM_HASH_ALGORITHM, CREATE_IGNORE_PATTERNS
 
 
 config = Config()
@@ -59,32 +67,42 @@ def cli_config_unset(key):
 
 
 @cli.group('list', invoke_without_command=True)
+@click.option('--since', type=click.DateTime(), help='Only list checkpoints created at or after this time.')
+@click.option('--until', type=click.DateTime(), help='Only list checkpoints created before this time.')
 @click.pass_context
-def cli_list(ctx):
+def cli_list(ctx, since, until):
     """
     List the checkpoints.
     """
     if ctx.invoked_subcommand is None:
         storage_choice = get_storage_choice()
         if storage_choice == 'fs':
-            list_fs()
+            list_fs(since=since, until=until)
+    elif since is not None or until is not None:
+        click.echo(ctx.get_help())
+        sys.exit(-1)
 
 
 @cli_list.command('fs')
 @click.option('--path', default=None)
-def cli_list_fs(path):
-    list_fs(path)
+@click.option('--since', type=click.DateTime(), help='Only list checkpoints created at or after this time.')
+@click.option('--until', type=click.DateTime(), help='Only list checkpoints created before this time.')
+def cli_list_fs(path, since, until):
+    list_fs(path, since, until)
 
 
 @cli.group('create', invoke_without_command=True)
 @click.option('--name', '-n', 'checkpoint_name')
+@click.option('--workers', '-w', type=int, help='Number of files hashed concurrently.')
+@click.option('--processes', is_flag=True, help='Hash files in worker processes instead of threads.')
+@click.option('--scan-processes', type=int, help='Number of processes walking the directory tree.')
 @click.pass_context
-def cli_create(ctx, checkpoint_name):
+def cli_create(ctx, checkpoint_name, workers, processes, scan_processes):
     if ctx.invoked_subcommand is None:
         storage_choice = get_storage_choice()
         if storage_choice == 'fs':
-            create_fs(checkpoint_name, None)
-    elif checkpoint_name is not None:
+            create_fs(checkpoint_name, None, workers, processes, scan_processes)
+    elif checkpoint_name is not None or workers is not None or processes or scan_processes is not None:
         click.echo(ctx.get_help())
         sys.exit(-1)
 
@@ -92,21 +110,30 @@ def cli_create(ctx, checkpoint_name):
 @cli_create.command('fs')
 @click.option('--path', 'path')
 @click.option('--name', '-n', 'checkpoint_name')
-def cli_create_fs(path, checkpoint_name):
-    create_fs(checkpoint_name, path)
+@click.option('--workers', '-w', type=int, help='Number of files hashed concurrently.')
+@click.option('--processes', is_flag=True, help='Hash files in worker processes instead of threads.')
+@click.option('--scan-processes', type=int, help='Number of processes walking the directory tree.')
+def cli_create_fs(path, checkpoint_name, workers, processes, scan_processes):
+    create_fs(checkpoint_name, path, workers, processes, scan_processes)
 
 
 @cli.group('restore', invoke_without_command=True)
 @click.option('--identifier', '-i', 'identifier')
+@click.option('--incremental', is_flag=True, help='Only retrieve the files that differ from the working directory.')
+@click.option('--delete', is_flag=True, help='Delete files that are not part of the checkpoint, with --incremental.')
+@click.option('--workers', '-w', type=int, help='Number of files restored concurrently.')
+@click.option('--hardlinks', is_flag=True, help='Restore read-only files as hardlinks to the stored files.')
+@click.option('--checkpoint-path', '-p', 'paths', multiple=True,
+              help='Only restore this path or glob pattern of the checkpoint, may be given several times.')
 @click.pass_context
-def cli_restore(ctx, identifier):
+def cli_restore(ctx, identifier, incremental, delete, workers, hardlinks, paths):
     if ctx.invoked_subcommand is None:
         if identifier is None:
             ctx.fail('Missing option "--identifier" / "-i".')
         storage_choice = get_storage_choice()
         if storage_choice == 'fs':
-            restore_fs(None, identifier)
-    elif identifier is not None:
+            restore_fs(identifier, None, incremental, delete, workers, hardlinks, paths)
+    elif identifier is not None or incremental or delete or workers is not None or hardlinks or paths:
         click.echo(ctx.get_help())
         sys.exit(-1)
 
@@ -114,8 +141,119 @@ def cli_restore(ctx, identifier):
 @cli_restore.command('fs')
 @click.option('--path')
 @click.option('--identifier', '-i', 'identifier', required=True)
-def cli_restore_fs(path, identifier):
-    restore_fs(identifier, path)
+@click.option('--incremental', is_flag=True, help='Only retrieve the files that differ from the working directory.')
+@click.option('--delete', is_flag=True, help='Delete files that are not part of the checkpoint, with --incremental.')
+@click.option('--workers', '-w', type=int, help='Number of files restored concurrently.')
+@click.option('--hardlinks', is_flag=True, help='Restore read-only files as hardlinks to the stored files.')
+@click.option('--checkpoint-path', '-p', 'paths', multiple=True,
+              help='Only restore this path or glob pattern of the checkpoint, may be given several times.')
+def cli_restore_fs(path, identifier, incremental, delete, workers, hardlinks, paths):
+    restore_fs(identifier, path, incremental, delete, workers, hardlinks, paths)
+
+
+@cli.group('export', invoke_without_command=True)
+@click.option('--identifier', '-i', 'identifier')
+@click.option('--output', '-o', 'output', type=click.Path(dir_okay=False), help='File the JSON is written to.')
+@click.pass_context
+def cli_export(ctx, identifier, output):
+    """
+    Export a checkpoint as JSON.
+    """
+    if ctx.invoked_subcommand is None:
+        if identifier is None:
+            ctx.fail('Missing option "--identifier" / "-i".')
+        storage_choice = get_storage_choice()
+        if storage_choice == 'fs':
+            export_fs(identifier, output)
+    elif identifier is not None or output is not None:
+        click.echo(ctx.get_help())
+        sys.exit(-1)
+
+
+@cli_export.command('fs')
+@click.option('--path')
+@click.option('--identifier', '-i', 'identifier', required=True)
+@click.option('--output', '-o', 'output', type=click.Path(dir_okay=False), help='File the JSON is written to.')
+def cli_export_fs(path, identifier, output):
+    export_fs(identifier, output, path)
+
+
+@cli.command('diff')
+@click.argument('old_identifier')
+@click.argument('new_identifier')
+@click.option('--path', help='Path of the file system storage.')
+def cli_diff(old_identifier, new_identifier, path):
+    """
+    List the paths that differ between two checkpoints.
+    """
+    storage_choice = get_storage_choice()
+    if storage_choice == 'fs':
+        diff_fs(old_identifier, new_identifier, path)
+
+
+@cli.command('cat')
+@click.argument('identifier')
+@click.argument('checkpoint_path')
+@click.option('--path', help='Path of the file system storage.')
+def cli_cat(identifier, checkpoint_path, path):
+    """
+    Write a file of a checkpoint to stdout.
+    """
+    storage_choice = get_storage_choice()
+    if storage_choice == 'fs':
+        cat_fs(identifier, checkpoint_path, path)
+
+
+@cli.group('verify', invoke_without_command=True)
+@click.option('--workers', '-w', type=int, help='Number of files verified concurrently.')
+@click.option('--rate', type=float, help='Maximum MiB per second read from the storage.')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming an interrupted verification.')
+@click.option('--quarantine', is_flag=True, help='Remove corrupt files, so the next checkpoint stores them again.')
+@click.pass_context
+def cli_verify(ctx, workers, rate, restart, quarantine):
+    """
+    Verify the stored files against their checksums.
+    """
+    if ctx.invoked_subcommand is None:
+        storage_choice = get_storage_choice()
+        if storage_choice == 'fs':
+            verify_fs(workers, rate, restart, quarantine)
+    elif workers is not None or rate is not None or restart or quarantine:
+        click.echo(ctx.get_help())
+        sys.exit(-1)
+
+
+@cli_verify.command('fs')
+@click.option('--path')
+@click.option('--workers', '-w', type=int, help='Number of files verified concurrently.')
+@click.option('--rate', type=float, help='Maximum MiB per second read from the storage.')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming an interrupted verification.')
+@click.option('--quarantine', is_flag=True, help='Remove corrupt files, so the next checkpoint stores them again.')
+def cli_verify_fs(path, workers, rate, restart, quarantine):
+    verify_fs(workers, rate, restart, quarantine, path)
+
+
+@cli.group('migrate', invoke_without_command=True)
+@click.option('--fan-out', type=int, help='Number of directory levels objects are sharded into.')
+@click.pass_context
+def cli_migrate(ctx, fan_out):
+    """
+    Convert the storage layout.
+    """
+    if ctx.invoked_subcommand is None:
+        storage_choice = get_storage_choice()
+        if storage_choice == 'fs':
+            migrate_fs(fan_out)
+    elif fan_out is not None:
+        click.echo(ctx.get_help())
+        sys.exit(-1)
+
+
+@cli_migrate.command('fs')
+@click.option('--path')
+@click.option('--fan-out', type=int, help='Number of directory levels objects are sharded into.')
+def cli_migrate_fs(path, fan_out):
+    migrate_fs(fan_out, path)
 
 
 def get_storage_choice():
@@ -147,11 +285,35 @@ def get_fs_path():
     return config[STORAGE_FILE_SYSTEM_PATH]
 
 
-def list_fs(path=None):
+def get_fs_storage(path):
+    chunking = STORAGE_FILE_SYSTEM_CHUNKING in config and config[STORAGE_FILE_SYSTEM_CHUNKING] == 'true'
+    packing = STORAGE_FILE_SYSTEM_PACKING in config and config[STORAGE_FILE_SYSTEM_PACKING] == 'true'
+    fan_out = get_fs_fan_out()
+    compression = config[STORAGE_FILE_SYSTEM_COMPRESSION] if STORAGE_FILE_SYSTEM_COMPRESSION in config else None
+    compression_level = None
+    if STORAGE_FILE_SYSTEM_COMPRESSION_LEVEL in config:
+        compression_level = int(config[STORAGE_FILE_SYSTEM_COMPRESSION_LEVEL])
+    checkpoint_format = 'binary'
+    if STORAGE_FILE_SYSTEM_CHECKPOINT_FORMAT in config:
+        checkpoint_format = config[STORAGE_FILE_SYSTEM_CHECKPOINT_FORMAT]
+    # only used when a new storage is created
+    hash_algorithm = config[STORAGE_FILE_SYSTEM_HASH_ALGORITHM] if STORAGE_FILE_SYSTEM_HASH_ALGORITHM in config else None
+    return FileSystemStorage(path, chunking=chunking, fan_out=fan_out, packing=packing, compression=compression,
+                             compression_level=compression_level, checkpoint_format=checkpoint_format,
+                             hash_algorithm=hash_algorithm)
+
+
+def get_fs_fan_out():
+    if STORAGE_FILE_SYSTEM_FAN_OUT in config:
+        return int(config[STORAGE_FILE_SYSTEM_FAN_OUT])
+    return FileSystemStorage.DEFAULT_FAN_OUT
+
+
+def list_fs(path=None, since=None, until=None):
     if path is None:
         path = get_fs_path()
-    storage = FileSystemStorage(path)
-    checkpoint_metas = storage.retrieve_checkpoint_metas()
+    storage = get_fs_storage(path)
+    checkpoint_metas = storage.find_checkpoint_metas_by_time(since, until)
     if not checkpoint_metas:
         click.echo('No checkpoints found.')
     else:
@@ -166,29 +328,168 @@ def echo_checkpoint_meta(checkpoint_meta):
     click.echo()
 
 
-def create_fs(checkpoint_name=None, path=None):
+def get_ignore_patterns():
+    if CREATE_IGNORE_PATTERNS not in config:
+        return None
+    return [pattern.strip() for pattern in config[CREATE_IGNORE_PATTERNS].split(',') if pattern.strip()]
+
+
+def create_fs(checkpoint_name=None, path=None, workers=None, use_processes=False, scan_processes=None):
     if path is None:
         path = get_fs_path()
     src_path = os.getcwd()
-    checkpoint = Checkpoint.build_checkpoint(src_path, checkpoint_name)
+    storage = get_fs_storage(path)
+    ignore_patterns = get_ignore_patterns()
+
+    hash_cache = storage.retrieve_hash_cache(src_path)
+    if use_processes:
+        # worker processes only hash the files, which are read again to be stored
+        checkpoint = Checkpoint.build_checkpoint(src_path, checkpoint_name, hash_cache, workers, use_processes,
+                                                 hash_algorithm=storage.hash_algorithm,
+                                                 scan_processes=scan_processes, ignore_patterns=ignore_patterns)
+        storage.store(src_path, checkpoint)
+    else:
+        storage.create(src_path, checkpoint_name, hash_cache, workers, scan_processes, ignore_patterns)
+    storage.store_hash_cache(src_path, hash_cache)
 
-    storage = FileSystemStorage(path)
-    storage.store(src_path, checkpoint)
+    click.echo('Hash cache hits: {}, misses: {}'.format(hash_cache.hits, hash_cache.misses))
+    if storage.store_stats.files:
+        click.echo('Transferred: ' + storage.store_stats.summary())
 
 
-def restore_fs(identifier, path=None):
+def restore_fs(identifier, path=None, incremental=False, delete=False, workers=None, hardlinks=False, paths=()):
     if path is None:
         path = get_fs_path()
     dst_path = os.getcwd()
-    storage = FileSystemStorage(path)
+    storage = get_fs_storage(path)
+    storage.hardlink_restore = hardlinks
+    if delete and not incremental:
+        click.echo('--delete requires --incremental.')
+        sys.exit(-1)
+    if paths and incremental:
+        click.echo('Paths can not be restored incrementally.')
+        sys.exit(-1)
+    checkpoint_meta = find_checkpoint_meta(storage, identifier)
+    try:
+        if incremental:
+            stats = storage.retrieve_incremental(dst_path, checkpoint_meta, delete, workers)
+        else:
+            stats = storage.retrieve(dst_path, checkpoint_meta, workers, paths or None)
+    except NoMatchError as e:
+        click.echo('No paths of the checkpoint matching: ' + e.pattern)
+        sys.exit(-1)
+    except RestoreError as e:
+        for error_path, error in e.errors:
+            click.echo('Could not restore {}: {}'.format(error_path, error))
+        sys.exit(-1)
+
+    click.echo('Files written: {}, bytes written: {}'.format(stats.files_written, stats.bytes_written))
+    if storage.retrieve_stats.files:
+        click.echo('Transferred: ' + storage.retrieve_stats.summary())
+    if incremental:
+        click.echo('Bytes skipped: {}'.format(stats.bytes_skipped))
+    if delete:
+        click.echo('Paths deleted: {}, bytes deleted: {}'.format(stats.paths_deleted, stats.bytes_deleted))
+
+
+def find_checkpoint_meta(storage, identifier):
     try:
-        storage.retrieve_by_checksum(dst_path, identifier)
+        return storage.find_by_identifier(identifier)
     except FileNotFoundError:
-        try:
-            storage.retrieve_by_name(dst_path, identifier)
-        except FileNotFoundError:
-            click.echo('No checkpoints matching identifier: ' + identifier)
-        except NoUniqueMatchError:
-            click.echo('Multiple checkpoints matching identifier: ' + identifier)
+        click.echo('No checkpoints matching identifier: ' + identifier)
     except NoUniqueMatchError:
         click.echo('Multiple checkpoints matching identifier: ' + identifier)
+    sys.exit(-1)
+
+
+def export_fs(identifier, output=None, path=None):
+    if path is None:
+        path = get_fs_path()
+    storage = get_fs_storage(path)
+    checkpoint = storage.retrieve_checkpoint(find_checkpoint_meta(storage, identifier))
+    if output is None:
+        click.echo(checkpoint.to_json())
+    else:
+        with open(output, 'w') as f:
+            f.write(checkpoint.to_json())
+
+
+def cat_fs(identifier, checkpoint_path, path=None):
+    if path is None:
+        path = get_fs_path()
+    storage = get_fs_storage(path)
+    view = CheckpointView(storage, storage.retrieve_checkpoint(find_checkpoint_meta(storage, identifier)))
+    try:
+        f = view.open(checkpoint_path)
+    except IsADirectoryError:
+        click.echo('Is a directory: ' + checkpoint_path)
+        sys.exit(-1)
+    except (PathNotFoundError, NotADirectoryError):
+        click.echo('No such file in the checkpoint: ' + checkpoint_path)
+        sys.exit(-1)
+    with f:
+        shutil.copyfileobj(f, click.get_binary_stream('stdout'))
+
+
+CHANGE_MARKERS = {ADDED: 'A', REMOVED: 'D', MODIFIED: 'M', PERMISSIONS_CHANGED: 'P'}
+
+
+def diff_fs(old_identifier, new_identifier, path=None):
+    if path is None:
+        path = get_fs_path()
+    storage = get_fs_storage(path)
+    old_checkpoint = storage.retrieve_checkpoint(find_checkpoint_meta(storage, old_identifier))
+    new_checkpoint = storage.retrieve_checkpoint(find_checkpoint_meta(storage, new_identifier))
+    try:
+        changes = diff(old_checkpoint, new_checkpoint)
+    except ValueError as e:
+        click.echo(str(e))
+        sys.exit(-1)
+    for change in changes:
+        node = change.old_node if change.new_node is None else change.new_node
+        line = CHANGE_MARKERS[change.kind] + ' ' + change.path + ('/' if isinstance(node, DirectoryNode) else '')
+        if change.kind == PERMISSIONS_CHANGED:
+            line += ' ({:o} -> {:o})'.format(change.old_node.permissions, change.new_node.permissions)
+        click.echo(line)
+
+
+def verify_fs(workers=None, rate=None, restart=False, quarantine=False, path=None):
+    if path is None:
+        path = get_fs_path()
+    storage = get_fs_storage(path)
+    verifier = Verifier(storage, workers, None if rate is None else rate * 1024 * 1024,
+                        storage.verify_state_file_path, quarantine)
+    if restart:
+        verifier.reset()
+    try:
+        report = verifier.verify()
+    except KeyboardInterrupt:
+        click.echo('Interrupted, run verify again to resume.')
+        sys.exit(-1)
+
+    click.echo('Files verified: {}, bytes read: {}'.format(report.files, report.size))
+    references = verifier.find_references(report.corrupt + report.missing)
+    for description, checksums in [('Corrupt', report.corrupt), ('Missing', report.missing)]:
+        for checksum in checksums:
+            click.echo('{}: {}'.format(description, checksum))
+            for checkpoint, checkpoint_path in references.get(checksum, []):
+                click.echo('\t{} {}'.format(checkpoint, checkpoint_path))
+    if quarantine and report.corrupt:
+        click.echo('Corrupt files found by this run were quarantined, they are stored again by the next checkpoint.')
+    for checkpoint, error in report.checkpoint_errors:
+        click.echo('Could not read checkpoint {}: {}'.format(checkpoint, error))
+    if report.corrupt or report.missing or report.checkpoint_errors:
+        sys.exit(-1)
+
+
+def migrate_fs(fan_out=None, path=None):
+    if path is None:
+        path = get_fs_path()
+    if fan_out is None:
+        fan_out = get_fs_fan_out()
+    storage = get_fs_storage(path)
+    try:
+        storage.migrate(fan_out)
+    except ValueError as e:
+        click.echo(str(e))
+        sys.exit(-1)
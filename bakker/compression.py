@@ -0,0 +1,137 @@
+import zlib
+
+
+class Codec:
+    """ A streaming compression codec. Objects compressed with a codec are identified by its file extension. """
+    BLOCKSIZE = 65536
+    # data that does not shrink below this ratio is stored uncompressed
+    MAX_RATIO = 0.9
+
+    def __init__(self, name, codec_id, file_ext, default_level):
+        self.name = name
+        self.codec_id = codec_id
+        self.file_ext = file_ext
+        self.default_level = default_level
+
+    def compressor(self, level=None):
+        """ Returns an object with compress(data) and flush() methods, like zlib.compressobj(). """
+        raise NotImplementedError()
+
+    def decompressor(self):
+        """ Returns an object with a decompress(data) method, like zlib.decompressobj(). """
+        raise NotImplementedError()
+
+    def compress(self, data, level=None):
+        compressor = self.compressor(level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        return self.decompressor().decompress(data)
+
+    def is_compressible(self, sample, level=None):
+        if not sample:
+            return False
+        return len(self.compress(sample, level)) <= len(sample) * self.MAX_RATIO
+
+    def compress_file(self, src_file, dst_file, level=None, first_block=b''):
+        compressor = self.compressor(level)
+        file_buffer = first_block or src_file.read(self.BLOCKSIZE)
+        while len(file_buffer) > 0:
+            dst_file.write(compressor.compress(file_buffer))
+            file_buffer = src_file.read(self.BLOCKSIZE)
+        dst_file.write(compressor.flush())
+
+    def decompress_file(self, src_file, dst_file):
+        for block in self.decompress_blocks(src_file):
+            dst_file.write(block)
+
+    def decompress_blocks(self, src_file):
+        """ Yields the decompressed data of the binary file object in blocks. """
+        decompressor = self.decompressor()
+        file_buffer = src_file.read(self.BLOCKSIZE)
+        while len(file_buffer) > 0:
+            yield decompressor.decompress(file_buffer)
+            file_buffer = src_file.read(self.BLOCKSIZE)
+        if hasattr(decompressor, 'flush'):
+            yield decompressor.flush()
+
+
+class ZlibCodec(Codec):
+    def __init__(self):
+        super().__init__('zlib', 1, '.zz', 6)
+
+    def compressor(self, level=None):
+        return zlib.compressobj(self.default_level if level is None else level)
+
+    def decompressor(self):
+        return zlib.decompressobj()
+
+
+class ZstdCodec(Codec):
+    def __init__(self):
+        super().__init__('zstd', 2, '.zst', 3)
+
+    @staticmethod
+    def _zstandard():
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('The zstd codec requires the zstandard package.')
+        return zstandard
+
+    def compressor(self, level=None):
+        zstandard = self._zstandard()
+        return zstandard.ZstdCompressor(level=self.default_level if level is None else level).compressobj()
+
+    def decompressor(self):
+        return self._zstandard().ZstdDecompressor().decompressobj()
+
+
+class Lz4Codec(Codec):
+    def __init__(self):
+        super().__init__('lz4', 3, '.lz4', 0)
+
+    @staticmethod
+    def _lz4_frame():
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError('The lz4 codec requires the lz4 package.')
+        return lz4.frame
+
+    def compressor(self, level=None):
+        compressor = self._lz4_frame().LZ4FrameCompressor(
+                compression_level=self.default_level if level is None else level)
+        return _Lz4Compressor(compressor)
+
+    def decompressor(self):
+        return self._lz4_frame().LZ4FrameDecompressor()
+
+
+class _Lz4Compressor:
+    """ Adapts the LZ4FrameCompressor to the zlib.compressobj() interface. """
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.started = False
+
+    def compress(self, data):
+        header = b''
+        if not self.started:
+            header = self.compressor.begin()
+            self.started = True
+        return header + self.compressor.compress(data)
+
+    def flush(self):
+        return self.compress(b'') + self.compressor.flush()
+
+
+CODECS = {codec.name: codec for codec in [ZlibCodec(), ZstdCodec(), Lz4Codec()]}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError('Unknown compression codec: ' + name)
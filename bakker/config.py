@@ -74,3 +74,12 @@ class Config:
 DEFAULT_STORAGE_KEY = 'default.storage'
 DEFAULT_STORAGE_CHOICES = ['fs']
 STORAGE_FILE_SYSTEM_PATH = 'storage.file_system.path'
+STORAGE_FILE_SYSTEM_CHUNKING = 'storage.file_system.chunking'
+STORAGE_FILE_SYSTEM_FAN_OUT = 'storage.file_system.fan_out'
+STORAGE_FILE_SYSTEM_PACKING = 'storage.file_system.packing'
+STORAGE_FILE_SYSTEM_COMPRESSION = 'storage.file_system.compression'
+STORAGE_FILE_SYSTEM_COMPRESSION_LEVEL = 'storage.file_system.compression_level'
+STORAGE_FILE_SYSTEM_CHECKPOINT_FORMAT = 'storage.file_system.checkpoint_format'
+STORAGE_FILE_SYSTEM_HASH_ALGORITHM = 'storage.file_system.hash_algorithm'
+# comma separated patterns of paths that are not backed up, in addition to the ones of .bakkerignore files
+CREATE_IGNORE_PATTERNS = 'create.ignore_patterns'
@@ -0,0 +1,99 @@
+import os
+
+from .checkpoint import DirectoryNode, SymlinkNode
+from . import trees
+
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+PERMISSIONS_CHANGED = 'permissions_changed'
+
+
+class Change:
+    """ A difference between two checkpoints.
+
+    :param kind: ADDED, REMOVED, MODIFIED (other content or type) or PERMISSIONS_CHANGED
+    :param path: the path relative to the checkpoint roots
+    :param old_node: the node in the old checkpoint, None if the path was added
+    :param new_node: the node in the new checkpoint, None if the path was removed
+    """
+
+    def __init__(self, kind, path, old_node, new_node):
+        self.kind = kind
+        self.path = path
+        self.old_node = old_node
+        self.new_node = new_node
+
+    def __eq__(self, other):
+        return isinstance(other, Change) and (self.kind, self.path) == (other.kind, other.path)
+
+    def __repr__(self):
+        return 'Change({!r}, {!r})'.format(self.kind, self.path)
+
+
+def _node_kind(node):
+    if isinstance(node, DirectoryNode):
+        return 'directory'
+    elif isinstance(node, SymlinkNode):
+        return 'symlink'
+    return 'file'
+
+
+def diff_trees(old_root, new_root, hash_algorithm=None):
+    """ Yields the Changes between two trees, ordered by path.
+
+    Subtrees with equal tree keys are identical and skipped without being visited, so only the directories on the
+    paths to the changes are decoded. The tree keys of loaded binary and tree checkpoints are stored with them, they
+    are computed once for other trees. Added and removed directories are reported as a single Change, not for each
+    path below them.
+
+    :param hash_algorithm: the HashAlgorithm of both trees, DEFAULT_HASH_ALGORITHM if None
+    """
+    # Changes and (old node, new node, path) tuples of nodes that are still to be compared, popped in path order
+    stack = [(old_root, new_root, '')]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Change):
+            yield item
+            continue
+
+        old_node, new_node, path = item
+        old_kind, new_kind = _node_kind(old_node), _node_kind(new_node)
+        if old_kind != new_kind:
+            yield Change(MODIFIED, path, old_node, new_node)
+            continue
+        if old_kind != 'directory':
+            if old_node.digest != new_node.digest:
+                yield Change(MODIFIED, path, old_node, new_node)
+            if old_node.permissions != new_node.permissions:
+                yield Change(PERMISSIONS_CHANGED, path, old_node, new_node)
+            continue
+
+        # the permissions of a directory are part of the tree object of its parent, not of its own
+        if old_node.permissions != new_node.permissions:
+            yield Change(PERMISSIONS_CHANGED, path, old_node, new_node)
+        if trees.update_tree_keys(old_node, hash_algorithm) == trees.update_tree_keys(new_node, hash_algorithm):
+            continue
+
+        old_children, new_children = old_node.children, new_node.children
+        for name in sorted(set(old_children) | set(new_children), reverse=True):
+            child_path = os.path.join(path, name)
+            old_child, new_child = old_children.get(name), new_children.get(name)
+            if old_child is None:
+                stack.append(Change(ADDED, child_path, None, new_child))
+            elif new_child is None:
+                stack.append(Change(REMOVED, child_path, old_child, None))
+            else:
+                stack.append((old_child, new_child, child_path))
+
+
+def diff(old_checkpoint, new_checkpoint):
+    """ Yields the Changes from the old to the new checkpoint, see diff_trees.
+
+    :raises ValueError: If the checksums of the checkpoints were computed with different hash algorithms.
+    """
+    if old_checkpoint.hash_algorithm is not new_checkpoint.hash_algorithm:
+        raise ValueError('Checkpoints hashed with {} and {} cannot be compared.'.format(
+                old_checkpoint.hash_algorithm.name, new_checkpoint.hash_algorithm.name))
+    return diff_trees(old_checkpoint.root, new_checkpoint.root, old_checkpoint.hash_algorithm)
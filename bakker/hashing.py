@@ -0,0 +1,257 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import mmap
+import os
+import threading
+
+import xxhash
+
+from .cache import HashCache
+
+# read buffers reused by the files hashed in a thread
+_buffers = threading.local()
+
+
+def fadvise(fd, advice, offset=0, length=0):
+    """ Gives the kernel a hint how the file is accessed, e.g. 'POSIX_FADV_SEQUENTIAL'. Does nothing on platforms
+    without posix_fadvise.
+    """
+    if hasattr(os, 'posix_fadvise') and hasattr(os, advice):
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice))
+        except OSError:
+            pass
+
+
+def read_buffer(size):
+    """ Returns a memoryview of at least size bytes, the same buffer for all calls in a thread. """
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None or len(buffer) < size:
+        buffer = _buffers.buffer = memoryview(bytearray(size))
+    return buffer
+
+
+class HashAlgorithm:
+    """ A hash function the checksums of files, directories and objects are computed with.
+
+    A storage computes all checksums with the same algorithm, and checkpoints record the algorithm by its id.
+
+    Files are read with readinto into a buffer reused by the thread, in blocks that grow with the file size from
+    the block size of the file system to MAX_BLOCKSIZE. Files of at least MMAP_MIN_SIZE are hashed from a memory map
+    instead, which is up to a fifth faster for files of several MiB, see benchmarks/file_hashing.py. It is disabled by
+    default: a file that is truncated while it is mapped kills the process with SIGBUS.
+    """
+    MIN_BLOCKSIZE = 64 * 1024
+    MAX_BLOCKSIZE = 1024 * 1024
+    MMAP_MIN_SIZE = None
+    # file_checksum(drop_cache=True) only drops larger files from the page cache
+    DROP_CACHE_MIN_SIZE = 1024 * 1024
+
+    def __init__(self, name, algorithm_id, digest_size):
+        self.name = name
+        self.algorithm_id = algorithm_id
+        self.digest_size = digest_size
+
+    def new(self):
+        """ Returns a hash object with update(data) and hexdigest() methods. """
+        raise NotImplementedError()
+
+    def hexdigest(self, data):
+        message = self.new()
+        message.update(data)
+        return message.hexdigest()
+
+    def block_size(self, file_stat):
+        block_size = max(self.MIN_BLOCKSIZE, getattr(file_stat, 'st_blksize', 0))
+        while block_size < self.MAX_BLOCKSIZE and block_size < file_stat.st_size:
+            block_size *= 2
+        return min(block_size, self.MAX_BLOCKSIZE)
+
+    def file_checksum(self, path, drop_cache=False):
+        """ Returns the checksum of the content of the file.
+
+        :param drop_cache: drop the pages of the file from the page cache after hashing it, for files that are not
+            read again soon, so they do not evict more useful pages
+        """
+        with open(path, 'rb', buffering=0) as f:
+            file_stat = os.fstat(f.fileno())
+            fadvise(f.fileno(), 'POSIX_FADV_SEQUENTIAL')
+            if self.MMAP_MIN_SIZE is not None and file_stat.st_size >= self.MMAP_MIN_SIZE:
+                checksum = self._mmap_checksum(f)
+            else:
+                checksum = self._readinto_checksum(f, self.block_size(file_stat))
+            if drop_cache and file_stat.st_size >= self.DROP_CACHE_MIN_SIZE:
+                fadvise(f.fileno(), 'POSIX_FADV_DONTNEED')
+        return checksum
+
+    def _readinto_checksum(self, f, block_size):
+        message = self.new()
+        buffer = read_buffer(block_size)[:block_size]
+        length = f.readinto(buffer)
+        while length:
+            message.update(buffer[:length])
+            length = f.readinto(buffer)
+        return message.hexdigest()
+
+    def _mmap_checksum(self, f):
+        message = self.new()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            if hasattr(mapped_file, 'madvise'):
+                mapped_file.madvise(mmap.MADV_SEQUENTIAL)
+            message.update(mapped_file)
+        return message.hexdigest()
+
+
+class XxhashAlgorithm(HashAlgorithm):
+    def __init__(self, name, algorithm_id, digest_size):
+        super().__init__(name, algorithm_id, digest_size)
+        self._function = getattr(xxhash, name, None)
+
+    def new(self):
+        if self._function is None:
+            raise ImportError('The {} hash algorithm requires xxhash 2.0 or later.'.format(self.name))
+        return self._function()
+
+
+class Blake3Algorithm(HashAlgorithm):
+    # larger files are hashed by several threads
+    MULTITHREADING_MIN_SIZE = 16 * 1024 * 1024
+
+    def __init__(self):
+        super().__init__('blake3', 4, 32)
+
+    @staticmethod
+    def _blake3():
+        try:
+            import blake3
+        except ImportError:
+            raise ImportError('The blake3 hash algorithm requires the blake3 package.')
+        return blake3.blake3
+
+    def new(self):
+        return self._blake3()()
+
+    def file_checksum(self, path, drop_cache=False):
+        if os.path.getsize(path) < self.MULTITHREADING_MIN_SIZE:
+            return super().file_checksum(path, drop_cache)
+        blake3 = self._blake3()
+        message = blake3(max_threads=blake3.AUTO)
+        message.update_mmap(path)
+        if drop_cache:
+            with open(path, 'rb', buffering=0) as f:
+                fadvise(f.fileno(), 'POSIX_FADV_DONTNEED')
+        return message.hexdigest()
+
+
+HASH_ALGORITHMS = {algorithm.name: algorithm for algorithm in [
+        XxhashAlgorithm('xxh64', 1, 8), XxhashAlgorithm('xxh3_64', 2, 8), XxhashAlgorithm('xxh3_128', 3, 16),
+        Blake3Algorithm()]}
+HASH_ALGORITHMS_BY_ID = {algorithm.algorithm_id: algorithm for algorithm in HASH_ALGORITHMS.values()}
+# the algorithm of checkpoints and storages that do not record one
+DEFAULT_HASH_ALGORITHM = HASH_ALGORITHMS['xxh64']
+
+
+def get_hash_algorithm(name):
+    try:
+        return HASH_ALGORITHMS[name]
+    except KeyError:
+        raise ValueError('Unknown hash algorithm: ' + name)
+
+
+def file_checksum(path, hash_algorithm=None, drop_cache=False):
+    return (DEFAULT_HASH_ALGORITHM if hash_algorithm is None else hash_algorithm).file_checksum(path, drop_cache)
+
+
+class HashingReader:
+    """ Wraps a binary file object and hashes all data read through it, so a file can be hashed while it is copied. """
+
+    def __init__(self, f, hash_algorithm=None):
+        self.f = f
+        self.message = (DEFAULT_HASH_ALGORITHM if hash_algorithm is None else hash_algorithm).new()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.message.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.message.hexdigest()
+
+
+class FileHasher:
+    """ Computes the checksums of FileNodes one after another, consulting the hash cache first.
+
+    :param hash_function: function returning the checksum of the file at a path, e.g. Storage.store_file_hashed to
+        store files while they are hashed. The file_checksum of the hash algorithm if None.
+    :param hash_algorithm: the HashAlgorithm of the checksums, DEFAULT_HASH_ALGORITHM if None
+    """
+
+    def __init__(self, hash_cache=None, hash_function=None, hash_algorithm=None):
+        self.hash_cache = hash_cache
+        self.hash_algorithm = DEFAULT_HASH_ALGORITHM if hash_algorithm is None else hash_algorithm
+        self.hash_function = self.hash_algorithm.file_checksum if hash_function is None else hash_function
+
+    def submit(self, node, path, file_stat):
+        """ Sets the checksum of the node. Subclasses may set it later, at the latest when join() returns. """
+        checksum = self._cached_checksum(file_stat)
+        if checksum is None:
+            self._finish(node, path, file_stat, self.hash_function(path))
+        else:
+            node.checksum = checksum
+
+    def complete(self, nodes):
+        """ Returns once the checksums of the given submitted nodes are set. """
+        pass
+
+    def join(self):
+        pass
+
+    def _cached_checksum(self, file_stat):
+        if self.hash_cache is None:
+            return None
+        return self.hash_cache.get(file_stat)
+
+    def _finish(self, node, path, file_stat, checksum):
+        node.checksum = checksum
+        # only cache the checksum if the file did not change while it was read
+        if self.hash_cache is not None and HashCache.key(file_stat) == HashCache.key(os.lstat(path)):
+            self.hash_cache.set(file_stat, checksum)
+
+
+class ParallelFileHasher(FileHasher):
+    """ Computes the checksums of FileNodes concurrently in a thread or process pool.
+
+    At most max_pending files are queued at once, older results are collected before new files are submitted.
+    """
+
+    def __init__(self, workers, hash_cache=None, use_processes=False, max_pending=None, hash_function=None,
+                 hash_algorithm=None):
+        super().__init__(hash_cache, hash_function, hash_algorithm)
+        self.max_pending = 4 * workers if max_pending is None else max_pending
+        self.executor = ProcessPoolExecutor(workers) if use_processes else ThreadPoolExecutor(workers)
+        self.pending = deque()
+
+    def submit(self, node, path, file_stat):
+        checksum = self._cached_checksum(file_stat)
+        if checksum is not None:
+            node.checksum = checksum
+            return
+
+        while len(self.pending) >= self.max_pending:
+            self._collect()
+        self.pending.append((self.executor.submit(self.hash_function, path), node, path, file_stat))
+
+    def complete(self, nodes):
+        while self.pending and any(node.digest is None for node in nodes):
+            self._collect()
+
+    def join(self):
+        try:
+            while self.pending:
+                self._collect()
+        finally:
+            self.executor.shutdown()
+
+    def _collect(self):
+        future, node, path, file_stat = self.pending.popleft()
+        self._finish(node, path, file_stat, future.result())
@@ -0,0 +1,195 @@
+""" Ignore rules with the semantics of gitignore files.
+
+Paths are ignored by patterns from .bakkerignore files in the backed up directory tree and by patterns of the
+config, which apply to the whole tree like a .bakkerignore file in its root that every .bakkerignore file overrides.
+The patterns of a .bakkerignore file apply to the paths below its directory, relative to it:
+
+    - blank lines and lines starting with # are skipped, trailing spaces are removed unless escaped by a backslash
+    - a pattern starting with ! includes paths again that a previous pattern ignored
+    - a pattern ending with / only matches directories
+    - a pattern with a / at its beginning or in its middle is matched against the path relative to the directory of
+      the .bakkerignore file, otherwise against the name at any depth below it
+    - * matches anything but /, ? any single character but /, [...] a character class
+    - **/ at the beginning matches in all directories, /** at the end everything inside, /**/ zero or more directories
+
+The last matching pattern decides, and patterns of a deeper .bakkerignore file are matched after the ones of its
+parents. Ignored directories are not descended into, so paths below them can not be included again.
+
+The patterns of every .bakkerignore file are compiled into regular expressions once, and the patterns of a file
+without ! into a single one, so an entry is matched by one regular expression per rule set.
+"""
+
+import os
+import re
+
+IGNORE_FILE_NAME = '.bakkerignore'
+
+
+def _translate_segment(segment):
+    """ Returns the regular expression of a path segment of a pattern without /. """
+    regex = ''
+    i = 0
+    while i < len(segment):
+        c = segment[i]
+        i += 1
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '\\' and i < len(segment):
+            regex += re.escape(segment[i])
+            i += 1
+        elif c == '[':
+            end = i
+            if end < len(segment) and segment[end] in '!^':
+                end += 1
+            if end < len(segment) and segment[end] == ']':
+                end += 1
+            end = segment.find(']', end)
+            if end < 0:
+                regex += '\\['
+            else:
+                characters = segment[i:end].replace('\\', '\\\\')
+                if characters[:1] in ('!', '^'):
+                    characters = '^' + characters[1:]
+                regex += '[' + characters + ']'
+                i = end + 1
+        else:
+            regex += re.escape(c)
+    return regex
+
+
+def translate(pattern):
+    """ Returns the regular expression a path matches if the pattern matches it, or None for blank lines and
+    comments. The ! and the trailing / of the pattern are not translated, see IgnoreRules.
+    """
+    if pattern.endswith('/'):
+        pattern = pattern[:-1]
+    # a leading / only anchors the pattern
+    anchored = '/' in pattern
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    if not pattern:
+        return None
+
+    segments = pattern.split('/')
+    regex = '' if anchored else '(?:.*/)?'
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == '**':
+            regex += '.*' if last else '(?:.*/)?'
+        else:
+            regex += _translate_segment(segment) + ('' if last else '/')
+    return regex
+
+
+class IgnoreRules:
+    """ The compiled patterns of a .bakkerignore file or of the config.
+
+    :param patterns: the lines of a .bakkerignore file
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+
+        # (regular expression, whether it includes paths again, whether it only matches directories)
+        rules = []
+        for pattern in self.patterns:
+            pattern = pattern.rstrip('\r\n')
+            if not pattern or pattern.startswith('#'):
+                continue
+            # trailing spaces are removed unless they are escaped
+            stripped = pattern.rstrip(' ')
+            if stripped != pattern and stripped.endswith('\\'):
+                stripped += ' '
+            pattern = stripped
+            negate = pattern.startswith('!')
+            if negate:
+                pattern = pattern[1:]
+            regex = translate(pattern)
+            if regex is not None:
+                rules.append((regex, negate, pattern.endswith('/')))
+
+        self._rules = [(re.compile(regex + r'\Z', re.DOTALL), negate, dir_only)
+                       for regex, negate, dir_only in rules]
+        # without ! the order of the patterns does not matter, so all of them are matched at once
+        self._combined = None
+        if not any(negate for _, negate, _ in rules):
+            self._combined = tuple(self._combine([regex for regex, _, dir_only in rules if not dir_only or is_dir])
+                                   for is_dir in (False, True))
+
+    @staticmethod
+    def _combine(regexes):
+        if not regexes:
+            return None
+        return re.compile('(?:' + '|'.join(regexes) + r')\Z', re.DOTALL)
+
+    def __bool__(self):
+        return bool(self._rules)
+
+    def match(self, path, is_dir):
+        """ Returns True if the path is ignored, False if it is included again and None if no pattern matches it.
+
+        :param path: the path relative to the directory of the rules, with / as separator
+        """
+        if self._combined is not None:
+            regex = self._combined[is_dir]
+            return True if regex is not None and regex.match(path) else None
+        for regex, negate, dir_only in reversed(self._rules):
+            if (is_dir or not dir_only) and regex.match(path):
+                return not negate
+        return None
+
+    @staticmethod
+    def from_file(path):
+        with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            return IgnoreRules(f.read().splitlines())
+
+
+class IgnoreMatcher:
+    """ The rules that apply to the entries of a directory while a tree is walked.
+
+    The walk starts with the matcher of the config patterns (from_patterns), calls enter() with the entries of each
+    directory it lists, which adds the rules of its .bakkerignore file, skips the ignored entries (is_ignored) and
+    descends with the matcher of the subdirectory (descend). Matchers can be pickled, e.g. to be sent to scanning
+    processes.
+
+    :param rule_sets: list of (IgnoreRules, path of the directory relative to the directory of the rules followed by
+        a /, or '' for the directory of the rules itself), the rules of the deepest directory last
+    """
+
+    def __init__(self, rule_sets=()):
+        self.rule_sets = list(rule_sets)
+
+    @staticmethod
+    def from_patterns(patterns=None):
+        """ Returns the matcher of the root directory of a walk, with the rules of the config patterns. """
+        rules = IgnoreRules(patterns or ())
+        return IgnoreMatcher([(rules, '')] if rules else [])
+
+    def enter(self, dir_path, entries):
+        """ Returns the matcher of the entries of the directory, including the rules of its .bakkerignore file.
+
+        :param entries: the DirEntry objects of the directory
+        """
+        for entry in entries:
+            if entry.name == IGNORE_FILE_NAME and entry.is_file():
+                rules = IgnoreRules.from_file(os.path.join(dir_path, IGNORE_FILE_NAME))
+                if rules:
+                    return IgnoreMatcher(self.rule_sets + [(rules, '')])
+                break
+        return self
+
+    def is_ignored(self, name, is_dir):
+        """ Returns whether the entry of the directory with the given name is ignored. """
+        for rules, prefix in reversed(self.rule_sets):
+            ignored = rules.match(prefix + name, is_dir)
+            if ignored is not None:
+                return ignored
+        return False
+
+    def descend(self, name):
+        """ Returns the matcher of the subdirectory with the given name, before its entries are entered. """
+        if not self.rule_sets:
+            return self
+        return IgnoreMatcher([(rules, prefix + name + '/') for rules, prefix in self.rule_sets])
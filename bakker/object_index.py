@@ -0,0 +1,133 @@
+from bisect import bisect_left
+import heapq
+import os
+import struct
+import threading
+
+
+class ObjectIndex:
+    """ Remembers which objects are stored, so they are found without looking at the storage.
+
+    The index is a single file with a header, which records the digest size of the checksums, followed by the sorted
+    digests of the known objects. The index is read once and searched by bisection, digests are compared in full.
+    Objects added since the index was last written are kept in memory until flush() merges them into the index.
+
+    The index may miss objects, e.g. objects stored concurrently by another process. Callers check the storage for
+    objects that are not in the index and add the ones they find. Checksums of another digest size are never in the
+    index. Objects are only removed from a storage when a verification quarantines them (see bakker.verify), which
+    removes them from the index first, so an object in the index is always stored.
+
+    :param digest_size: the size of the digests in bytes, see HashAlgorithm.digest_size
+    """
+    INDEX_MAGIC = b'BKOI'
+    INDEX_VERSION = 1
+    INDEX_HEADER = struct.Struct('>4sBB')
+    TMP_FILE_EXT = '.tmp'
+
+    def __init__(self, index_file_path, digest_size):
+        self.index_file_path = index_file_path
+        self.digest_size = digest_size
+
+        self._keys = None
+        self._pending = set()
+        # lookups may happen from several threads
+        self._load_lock = threading.Lock()
+
+    def key(self, checksum):
+        """ Returns the digest of the checksum, None if it has another digest size. """
+        if len(checksum) != 2 * self.digest_size:
+            return None
+        return bytes.fromhex(checksum)
+
+    def exists(self):
+        return os.path.isfile(self.index_file_path)
+
+    def _load(self):
+        if self._keys is not None:
+            return self._keys
+        with self._load_lock:
+            if self._keys is None:
+                self._keys = self._read_keys()
+        return self._keys
+
+    def _read_keys(self):
+        if not self.exists():
+            return _Digests(b'', self.digest_size)
+
+        with open(self.index_file_path, 'rb') as f:
+            magic, version, digest_size = self.INDEX_HEADER.unpack(f.read(self.INDEX_HEADER.size))
+            if magic != self.INDEX_MAGIC or version > self.INDEX_VERSION or digest_size != self.digest_size:
+                raise IOError('Unsupported object index: ' + self.index_file_path)
+            return _Digests(f.read(), self.digest_size)
+
+    def __contains__(self, checksum):
+        key = self.key(checksum)
+        if key is None:
+            return False
+        if key in self._pending:
+            return True
+        keys = self._load()
+        position = bisect_left(keys, key)
+        return position < len(keys) and keys[position] == key
+
+    def __len__(self):
+        return len(self._load()) + len(self._pending)
+
+    def add(self, checksum):
+        key = self.key(checksum)
+        if key is not None:
+            self._pending.add(key)
+
+    def flush(self):
+        """ Merges the objects added so far into the index. """
+        if not self._pending:
+            return
+        self._write(heapq.merge(self._load(), sorted(self._pending)))
+
+    def remove(self, checksums):
+        """ Removes the objects from the index. """
+        keys = set(self.key(checksum) for checksum in checksums)
+        self._pending -= keys
+        if self.exists():
+            self._write(key for key in self._load() if key not in keys)
+
+    def rebuild(self, checksums):
+        """ Replaces the index by one that contains exactly the given objects. """
+        keys = set(self.key(checksum) for checksum in checksums)
+        keys.discard(None)
+        self._write(sorted(keys))
+
+    def _write(self, keys):
+        unique_keys = bytearray()
+        last_key = None
+        for key in keys:
+            if key != last_key:
+                unique_keys += key
+                last_key = key
+
+        tmp_index_file_path = self.index_file_path + self.TMP_FILE_EXT
+        with open(tmp_index_file_path, 'wb') as f:
+            f.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION, self.digest_size))
+            f.write(unique_keys)
+        os.replace(tmp_index_file_path, self.index_file_path)
+        self._keys = _Digests(bytes(unique_keys), self.digest_size)
+        self._pending.clear()
+
+
+class _Digests:
+    """ A sorted sequence of digests of the same size, stored back to back in a single bytes object. """
+
+    def __init__(self, data, digest_size):
+        self.data = data
+        self.digest_size = digest_size
+
+    def __len__(self):
+        return len(self.data) // self.digest_size
+
+    def __getitem__(self, position):
+        start = position * self.digest_size
+        return self.data[start:start + self.digest_size]
+
+    def __iter__(self):
+        for start in range(0, len(self.data), self.digest_size):
+            yield self.data[start:start + self.digest_size]
@@ -0,0 +1,218 @@
+import mmap
+import os
+import struct
+import threading
+
+from .compression import CODECS_BY_ID
+
+
+class PackStore:
+    """ Appends small objects to large pack files and finds them through a sorted binary index.
+
+    The index is a single file with a header followed by fixed size records (digest, pack id, offset, length, codec
+    id, modification time of the file), sorted by digest, so an object is found by a binary search over the
+    memory-mapped index. Objects added since the index was last written are kept in memory until flush() merges them
+    into the index. Pack data that is not
+    referenced by the index, e.g. after a crash, is ignored.
+    """
+    INDEX_FILE = 'index'
+    INDEX_MAGIC = b'BKPI'
+    INDEX_VERSION = 1
+    INDEX_HEADER = struct.Struct('>4sBB')
+    PACK_FILE_PREFIX = 'pack-'
+    PACK_FILE_EXT = '.pack'
+    TMP_FILE_EXT = '.tmp'
+    MAX_PACK_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.index_file_path = os.path.join(path, self.INDEX_FILE)
+
+        self._index = None
+        self._index_file = None
+        self._index_loaded = False
+        self._index_count = 0
+        self._digest_size = None
+        self._record = None
+        self._pending = dict()
+
+        self._pack_file = None
+        self._pack_id = None
+        self._read_fds = dict()
+        # lookup() and read() may be called from several threads, e.g. by a parallel restore
+        self._index_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+
+    def _pack_file_path(self, pack_id):
+        return os.path.join(self.path, '{}{:06d}{}'.format(self.PACK_FILE_PREFIX, pack_id, self.PACK_FILE_EXT))
+
+    @staticmethod
+    def _record_struct(digest_size):
+        return struct.Struct('>{}sIQIBq'.format(digest_size))
+
+    def _open_index(self):
+        if self._index_loaded:
+            return
+        with self._index_lock:
+            if not self._index_loaded:
+                self._load_index()
+                self._index_loaded = True
+
+    def _load_index(self):
+        if not os.path.isfile(self.index_file_path):
+            return
+
+        self._index_file = open(self.index_file_path, 'rb')
+        header = self._index_file.read(self.INDEX_HEADER.size)
+        magic, version, self._digest_size = self.INDEX_HEADER.unpack(header)
+        if magic != self.INDEX_MAGIC or version != self.INDEX_VERSION:
+            raise IOError('Unsupported pack index: ' + self.index_file_path)
+
+        self._record = PackStore._record_struct(self._digest_size)
+        index_size = os.fstat(self._index_file.fileno()).st_size
+        self._index_count = (index_size - self.INDEX_HEADER.size) // self._record.size
+        if self._index_count:
+            self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_index(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+        self._index_loaded = False
+        self._index_count = 0
+
+    def _search_index(self, digest):
+        self._open_index()
+        if self._index is None or len(digest) != self._digest_size:
+            return None
+
+        index, record = self._index, self._record
+        low, high = 0, self._index_count
+        while low < high:
+            middle = (low + high) // 2
+            position = self.INDEX_HEADER.size + middle * record.size
+            middle_digest = index[position:position + self._digest_size]
+            if middle_digest < digest:
+                low = middle + 1
+            elif middle_digest > digest:
+                high = middle
+            else:
+                return self._unpack_record(position)[1:]
+        return None
+
+    def _unpack_record(self, position):
+        return self._record.unpack_from(self._index, position)
+
+    def lookup(self, checksum):
+        """ Returns (pack id, offset, length, codec id, mtime_ns) of the object or None if it is not packed. """
+        digest = bytes.fromhex(checksum)
+        location = self._pending.get(digest)
+        if location is None:
+            location = self._search_index(digest)
+        return location
+
+    def __contains__(self, checksum):
+        return self.lookup(checksum) is not None
+
+    def add(self, checksum, data, codec=None, mtime_ns=0):
+        """ Appends the object to the current pack.
+
+        :param data: the object, already compressed with the codec if one is given
+        :param mtime_ns: the modification time of the file of the object, restored with it
+        """
+        if self._pack_file is None or self._pack_file.tell() + len(data) > self.MAX_PACK_SIZE:
+            self._open_next_pack()
+
+        offset = self._pack_file.tell()
+        self._pack_file.write(data)
+        codec_id = 0 if codec is None else codec.codec_id
+        self._pending[bytes.fromhex(checksum)] = (self._pack_id, offset, len(data), codec_id, mtime_ns)
+
+    def _open_next_pack(self):
+        if self._pack_file is not None:
+            self._pack_file.close()
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        pack_ids = [int(file_name[len(self.PACK_FILE_PREFIX):-len(self.PACK_FILE_EXT)])
+                    for file_name in os.listdir(self.path)
+                    if file_name.startswith(self.PACK_FILE_PREFIX) and file_name.endswith(self.PACK_FILE_EXT)]
+        # a new pack is started for every session, so existing packs are never modified
+        self._pack_id = max(pack_ids, default=0) + 1
+        self._pack_file = open(self._pack_file_path(self._pack_id), 'xb')
+
+    def read(self, checksum):
+        """ Returns the uncompressed object. """
+        location = self.lookup(checksum)
+        if location is None:
+            raise FileNotFoundError(checksum)
+        pack_id, offset, length, codec_id, _ = location
+
+        with self._read_lock:
+            if pack_id == self._pack_id and self._pack_file is not None:
+                self._pack_file.flush()
+            fd = self._read_fds.get(pack_id)
+            if fd is None:
+                fd = os.open(self._pack_file_path(pack_id), os.O_RDONLY)
+                self._read_fds[pack_id] = fd
+
+        data = os.pread(fd, length, offset)
+        if len(data) != length:
+            raise IOError('Packed object {} is truncated.'.format(checksum))
+        return data if codec_id == 0 else CODECS_BY_ID[codec_id].decompress(data)
+
+    def flush(self):
+        """ Makes the objects added so far durable and merges them into the index. """
+        if not self._pending:
+            return
+
+        self._pack_file.flush()
+        os.fsync(self._pack_file.fileno())
+
+        digest_size = len(next(iter(self._pending)))
+        records = self._read_records()
+        records.extend((digest,) + location for digest, location in self._pending.items())
+        records.sort()
+        self._write_index(records, digest_size)
+        self._pending.clear()
+
+    def remove(self, checksums):
+        """ Removes the objects from the index, e.g. corrupt ones. Their data stays in the packs. """
+        digests = set(bytes.fromhex(checksum) for checksum in checksums)
+        for digest in digests:
+            self._pending.pop(digest, None)
+        records = self._read_records()
+        if records:
+            self._write_index([r for r in records if r[0] not in digests], self._digest_size)
+
+    def _read_records(self):
+        self._open_index()
+        records = []
+        if self._index is not None:
+            for i in range(self._index_count):
+                records.append(self._unpack_record(self.INDEX_HEADER.size + i * self._record.size))
+        return records
+
+    def _write_index(self, records, digest_size):
+        record = PackStore._record_struct(digest_size)
+        tmp_index_file_path = self.index_file_path + self.TMP_FILE_EXT
+        with open(tmp_index_file_path, 'wb') as f:
+            f.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION, digest_size))
+            for r in records:
+                f.write(record.pack(*r))
+        self._close_index()
+        os.replace(tmp_index_file_path, self.index_file_path)
+
+    def close(self):
+        self.flush()
+        self._close_index()
+        if self._pack_file is not None:
+            self._pack_file.close()
+            self._pack_file = None
+            self._pack_id = None
+        for fd in self._read_fds.values():
+            os.close(fd)
+        self._read_fds.clear()
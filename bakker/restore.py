@@ -0,0 +1,261 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import stat
+
+from .checkpoint import DirectoryNode, FileNode, SymlinkNode
+from .diff import diff_trees, REMOVED, MODIFIED, PERMISSIONS_CHANGED
+from .hashing import FileHasher
+from .ignore import IgnoreMatcher
+
+
+class RestoreStats:
+    """ What a restore did. Bytes only count regular files, skipped and deleted paths only incremental restores. """
+
+    def __init__(self):
+        self.files_written = 0
+        self.bytes_written = 0
+        # data of the destination that already matched the checkpoint
+        self.bytes_skipped = 0
+        self.paths_deleted = 0
+        self.bytes_deleted = 0
+
+
+class NoMatchError(LookupError):
+    """ Raised if a pattern of the paths to restore matches no path of the checkpoint.
+
+    :param pattern: the pattern
+    """
+
+    def __init__(self, pattern):
+        super().__init__(pattern)
+        self.pattern = pattern
+
+
+class RestoreError(IOError):
+    """ Raised after a restore if some files could not be retrieved.
+
+    :param errors: list of (path, exception) tuples
+    """
+
+    def __init__(self, errors):
+        super().__init__('{} file(s) could not be restored, first {}: {}'.format(len(errors), *errors[0]))
+        self.errors = errors
+
+
+class TreeRetriever:
+    """ Retrieves trees from a storage, the files of them concurrently in a thread pool.
+
+    Directories are created when a tree is added, with permissions that allow writing their children, and get their
+    permissions from the checkpoint in finish(), so read-only directories are restored too. Files are retrieved while
+    further trees are added. Files that fail do not stop the restore, their errors are raised together by finish().
+
+    :param storage: the Storage the files are retrieved from
+    :param workers: number of files retrieved concurrently, files are retrieved one after another if None
+    :param stats: RestoreStats the retrieved files are counted in
+    :param progress: function called with the stats after every retrieved file
+    """
+
+    def __init__(self, storage, workers=None, stats=None, progress=None):
+        self.storage = storage
+        self.stats = RestoreStats() if stats is None else stats
+        self.progress = progress
+        self.executor = None if workers is None else ThreadPoolExecutor(workers)
+        self.max_pending = 0 if workers is None else 4 * workers
+        self.pending = deque()
+        self.errors = []
+        # (path, permissions) of the directories, parents before their children
+        self.directory_permissions = []
+
+    def add(self, root, dst_path):
+        """ Retrieves the node and, if it is a directory, all nodes below it to dst_path. """
+        stack = [(root, dst_path)]
+        while stack:
+            node, path = stack.pop()
+            if isinstance(node, DirectoryNode):
+                if not os.path.exists(path):
+                    os.mkdir(path, 0o700)
+                    self.directory_permissions.append((path, node.permissions))
+                stack.extend((child, os.path.join(path, child_name)) for child_name, child in node.children.items())
+            else:
+                self._submit(node, path)
+
+    def set_directory_permissions(self, path, permissions):
+        """ Sets the permissions of an existing directory in finish(). """
+        self.directory_permissions.append((path, permissions))
+
+    def _retrieve_file(self, node, path):
+        self.storage.retrieve_file(node.checksum, path, node.permissions)
+        return os.lstat(path).st_size if isinstance(node, FileNode) else 0
+
+    def _submit(self, node, path):
+        if self.executor is None:
+            try:
+                size = self._retrieve_file(node, path)
+            except Exception as e:
+                self.errors.append((path, e))
+            else:
+                self._count(size)
+            return
+
+        while len(self.pending) >= self.max_pending:
+            self._collect()
+        self.pending.append((self.executor.submit(self._retrieve_file, node, path), path))
+
+    def _collect(self):
+        future, path = self.pending.popleft()
+        try:
+            size = future.result()
+        except Exception as e:
+            self.errors.append((path, e))
+        else:
+            self._count(size)
+
+    def _count(self, size):
+        self.stats.files_written += 1
+        self.stats.bytes_written += size
+        if self.progress is not None:
+            self.progress(self.stats)
+
+    def finish(self):
+        """ Waits for all files, then sets the permissions of the directories, children first.
+
+        :raises RestoreError: If any file could not be retrieved.
+        """
+        try:
+            while self.pending:
+                self._collect()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+        for path, permissions in reversed(self.directory_permissions):
+            os.chmod(path, permissions)
+        self.directory_permissions = []
+        if self.errors:
+            raise RestoreError(self.errors)
+        return self.stats
+
+
+class _SizeCountingHasher(FileHasher):
+    def __init__(self, hash_cache=None, hash_algorithm=None):
+        super().__init__(hash_cache, hash_algorithm=hash_algorithm)
+        self.total_size = 0
+
+    def submit(self, node, path, file_stat):
+        self.total_size += file_stat.st_size
+        super().submit(node, path, file_stat)
+
+
+def _tree_size(path):
+    """ Returns the size of the regular file at path or of all regular files below it. """
+    path_stat = os.lstat(path)
+    if stat.S_ISREG(path_stat.st_mode):
+        return path_stat.st_size
+    if not stat.S_ISDIR(path_stat.st_mode):
+        return 0
+    size = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file_stat = os.lstat(os.path.join(dir_path, file_name))
+            if stat.S_ISREG(file_stat.st_mode):
+                size += file_stat.st_size
+    return size
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def retrieve_incremental(storage, dst_dir_path, checkpoint, delete=False, hash_cache=None, workers=None):
+    """ Makes the destination directory match the checkpoint, retrieving only what differs.
+
+    The destination is scanned like a new checkpoint, with the hash cache skipping files that did not change since
+    they were last hashed, and diffed against the checkpoint, so unchanged subtrees are skipped by their tree keys.
+    Files that differ are replaced, missing paths are retrieved and permissions are updated. Paths the ignore rules
+    of the checkpoint and the .bakkerignore files of the destination ignore are not scanned, so they are neither
+    deleted nor hashed.
+
+    :param storage: the Storage the checkpoint is retrieved from
+    :param delete: also delete paths that are not part of the checkpoint
+    :param hash_cache: the HashCache of the destination
+    :param workers: number of files retrieved concurrently, see TreeRetriever
+    :returns: RestoreStats
+    :raises RestoreError: If any file could not be retrieved.
+    """
+    stats = RestoreStats()
+    retriever = TreeRetriever(storage, workers, stats)
+    # the destination is hashed like the checkpoint, so equal files have equal checksums
+    hasher = _SizeCountingHasher(hash_cache, checkpoint.hash_algorithm)
+    try:
+        dst_root = DirectoryNode.build_node(dst_dir_path, '', hasher,
+                                            ignore=IgnoreMatcher.from_patterns(checkpoint.ignore_patterns))
+    finally:
+        hasher.join()
+    if dst_root.digest is None:
+        dst_root.update_checksum(checkpoint.hash_algorithm)
+
+    replaced_size = 0
+    for change in diff_trees(dst_root, checkpoint.root, checkpoint.hash_algorithm):
+        path = os.path.join(dst_dir_path, change.path)
+        if change.kind == PERMISSIONS_CHANGED:
+            # symlinks have no permissions of their own, the destination root is left alone like by Storage.retrieve
+            if isinstance(change.new_node, DirectoryNode):
+                if change.path:
+                    retriever.set_directory_permissions(path, change.new_node.permissions)
+            elif not isinstance(change.new_node, SymlinkNode):
+                os.chmod(path, change.new_node.permissions)
+        elif change.kind == REMOVED:
+            size = _tree_size(path)
+            replaced_size += size
+            if delete:
+                _remove(path)
+                stats.paths_deleted += 1
+                stats.bytes_deleted += size
+        else:
+            if change.kind == MODIFIED:
+                replaced_size += _tree_size(path)
+                _remove(path)
+            elif os.path.lexists(path):
+                # the destination ignores the path, so it was not scanned
+                _remove(path)
+            retriever.add(change.new_node, path)
+
+    stats.bytes_skipped = hasher.total_size - replaced_size
+    return retriever.finish()
+
+
+def retrieve_paths(storage, dst_dir_path, checkpoint, patterns, workers=None):
+    """ Retrieves the subtrees of the checkpoint whose paths match any of the patterns (see Checkpoint.glob) to the
+    same paths below the destination directory. Missing parent directories are created, a subtree below another
+    matching one is only retrieved once.
+
+    :param storage: the Storage the checkpoint is retrieved from
+    :param workers: number of files retrieved concurrently, see TreeRetriever
+    :returns: RestoreStats
+    :raises NoMatchError: If a pattern matches no path, before anything is retrieved.
+    :raises RestoreError: If any file could not be retrieved.
+    """
+    nodes = dict()
+    for pattern in patterns:
+        matches = {path: node for node, path in checkpoint.glob(pattern)}
+        if not matches:
+            raise NoMatchError(pattern)
+        nodes.update(matches)
+
+    retriever = TreeRetriever(storage, workers)
+    retrieved_path = None
+    # parents are sorted before their children
+    for path in sorted(nodes, key=lambda path: path.split(os.sep)):
+        if retrieved_path is not None and (retrieved_path == '' or path.startswith(retrieved_path + os.sep)):
+            continue
+        dst_path = os.path.join(dst_dir_path, path)
+        if not os.path.isdir(os.path.dirname(dst_path)):
+            os.makedirs(os.path.dirname(dst_path))
+        retriever.add(nodes[path], dst_path)
+        retrieved_path = path
+    return retriever.finish()
@@ -0,0 +1,207 @@
+""" Scanning of large directory trees in several processes.
+
+The walk of DirectoryNode.build_node is bound to one core. ParallelScanner spreads it over worker processes that
+claim directories from a shared queue. A worker scans the subtree of the directory it claimed by itself, except
+that whenever more workers are idle than directories are queued it queues the subdirectories it finds instead of
+descending into them, so wide and deep subtrees are shared among all workers.
+
+A worker returns the subtree it scanned as nested tuples, one per entry:
+
+    directory   (TYPE_DIRECTORY, name, permissions, entries), entries None if the directory was queued
+    file        (TYPE_FILE, name, permissions, st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns)
+    symlink     (TYPE_SYMLINK, name, permissions, checksum)
+
+The parent builds the nodes of the results as they arrive and submits the files to its hasher, which consults the
+hash cache and hashes them, then links the queued directories into their parents. Queued directories are sent with
+their IgnoreMatcher (see bakker.ignore), ignored entries are skipped by the workers.
+"""
+
+from collections import namedtuple
+import multiprocessing
+import os
+import pickle
+import queue
+import stat
+
+from .hashing import get_hash_algorithm
+from .ignore import IgnoreMatcher
+from .serialization import TYPE_DIRECTORY, TYPE_FILE, TYPE_SYMLINK
+
+# the stat fields of a scanned file that FileHasher and the hash cache use
+ScannedStat = namedtuple('ScannedStat', ['st_dev', 'st_ino', 'st_size', 'st_mtime_ns', 'st_ctime_ns'])
+
+
+def _scan_directory(dir_path, relative_path, tasks, idle, hash_algorithm, ignore):
+    """ Returns the entries of the directory, queueing subdirectories when workers are idle.
+
+    :param idle: shared array of the number of idle workers and the number of queued directories
+    :param ignore: the IgnoreMatcher of the directory
+    """
+    from .checkpoint import SymlinkNode
+
+    dir_entries = list(os.scandir(dir_path))
+    ignore = ignore.enter(dir_path, dir_entries)
+    entries = []
+    for entry in dir_entries:
+        if ignore.is_ignored(entry.name, entry.is_dir(follow_symlinks=False)):
+            continue
+        if entry.is_symlink():
+            if not entry.is_file() and not entry.is_dir():
+                print("Ignored: " + entry.path)
+                continue
+            link_stat = entry.stat(follow_symlinks=False)
+            entries.append((TYPE_SYMLINK, entry.name, stat.S_IMODE(link_stat.st_mode),
+                            SymlinkNode.link_checksum(entry.path, hash_algorithm)))
+        elif entry.is_file(follow_symlinks=False):
+            file_stat = entry.stat(follow_symlinks=False)
+            entries.append((TYPE_FILE, entry.name, stat.S_IMODE(file_stat.st_mode), file_stat.st_dev,
+                            file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ctime_ns))
+        elif entry.is_dir(follow_symlinks=False):
+            permissions = stat.S_IMODE(entry.stat(follow_symlinks=False).st_mode)
+            child_relative_path = os.path.join(relative_path, entry.name)
+            child_ignore = ignore.descend(entry.name)
+            if idle[0] > idle[1]:
+                with idle.get_lock():
+                    idle[1] += 1
+                tasks.put((child_relative_path, child_ignore))
+                child_entries = None
+            else:
+                child_entries = _scan_directory(entry.path, child_relative_path, tasks, idle, hash_algorithm,
+                                                child_ignore)
+            entries.append((TYPE_DIRECTORY, entry.name, permissions, child_entries))
+        else:
+            print("Ignored: " + entry.path)
+    return entries
+
+
+def _scan_worker(root_path, tasks, results, idle, hash_algorithm_name):
+    hash_algorithm = get_hash_algorithm(hash_algorithm_name)
+    while True:
+        with idle.get_lock():
+            idle[0] += 1
+        task = tasks.get()
+        with idle.get_lock():
+            idle[0] -= 1
+            if task is not None:
+                idle[1] -= 1
+        if task is None:
+            return
+
+        relative_path, ignore = task
+        try:
+            entries = _scan_directory(os.path.join(root_path, relative_path), relative_path, tasks, idle,
+                                      hash_algorithm, ignore)
+            results.put((relative_path, entries, None))
+        except Exception as e:
+            results.put((relative_path, None, _picklable_error(e)))
+
+
+def _picklable_error(error):
+    """ Returns the error, or a RuntimeError describing it if it can not be sent to the parent. """
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError(repr(error))
+
+
+class ParallelScanner:
+    """ Builds the node of a directory tree like TreeNode.build_node, scanning it in worker processes.
+
+    :param processes: number of worker processes scanning directories
+    """
+    # seconds between checks that the workers are still alive while waiting for results
+    RESULT_TIMEOUT = 1
+
+    def __init__(self, processes):
+        self.processes = processes
+
+        # relative path of a queued directory -> its node, until its entries arrive
+        self._queued_nodes = dict()
+        # relative path of a queued directory -> its children, until the entries of its parent arrive
+        self._queued_children = dict()
+
+    def build_node(self, path, hasher, ignore=None):
+        """
+        :param ignore: the IgnoreMatcher of the directory at path, nothing is ignored if None
+        """
+        from .checkpoint import DirectoryNode, TreeNode
+
+        path_stat = os.lstat(path)
+        if not stat.S_ISDIR(path_stat.st_mode):
+            return TreeNode.build_node(path, '', hasher)
+
+        root = DirectoryNode('', None, stat.S_IMODE(path_stat.st_mode), dict())
+        self._queued_nodes = {'': root}
+        self._queued_children = dict()
+
+        context = multiprocessing.get_context()
+        tasks = context.Queue()
+        results = context.Queue()
+        # the number of idle workers and of queued directories
+        idle = context.Array('i', [0, 1])
+        workers = [context.Process(target=_scan_worker, args=(path, tasks, results, idle, hasher.hash_algorithm.name),
+                                   daemon=True)
+                   for _ in range(self.processes)]
+        for worker in workers:
+            worker.start()
+
+        finished = False
+        try:
+            tasks.put(('', IgnoreMatcher() if ignore is None else ignore))
+            # results may arrive before the results of their parents, the tree is complete once every queued
+            # directory got its children and every result was linked into its parent
+            while self._queued_nodes or self._queued_children:
+                try:
+                    relative_path, entries, error = results.get(timeout=self.RESULT_TIMEOUT)
+                except queue.Empty:
+                    # a worker that died took the directory it claimed with it
+                    for worker in workers:
+                        if not worker.is_alive():
+                            raise RuntimeError('A scan worker exited with code {}.'.format(worker.exitcode))
+                    continue
+                if error is not None:
+                    raise error
+                children = self._build_children(path, relative_path, entries, hasher)
+                if relative_path in self._queued_nodes:
+                    self._queued_nodes.pop(relative_path).children = children
+                else:
+                    self._queued_children[relative_path] = children
+            finished = True
+        finally:
+            if finished:
+                for _ in workers:
+                    tasks.put(None)
+                for worker in workers:
+                    worker.join()
+            else:
+                for worker in workers:
+                    worker.terminate()
+        return root
+
+    def _build_children(self, root_path, relative_path, entries, hasher):
+        from .checkpoint import DirectoryNode, FileNode, SymlinkNode
+
+        # the parent does the least work per entry, as it limits how far the scan scales
+        dir_path = os.path.join(root_path, relative_path)
+        if not dir_path.endswith(os.sep):
+            dir_path += os.sep
+        children = dict()
+        for entry in entries:
+            node_type, name, permissions = entry[:3]
+            if node_type == TYPE_FILE:
+                node = FileNode(name, None, permissions)
+                hasher.submit(node, dir_path + name, ScannedStat._make(entry[3:]))
+            elif node_type == TYPE_SYMLINK:
+                node = SymlinkNode(name, entry[3], permissions)
+            else:
+                node = DirectoryNode(name, None, permissions, dict())
+                child_relative_path = os.path.join(relative_path, name)
+                if entry[3] is not None:
+                    node.children = self._build_children(root_path, child_relative_path, entry[3], hasher)
+                elif child_relative_path in self._queued_children:
+                    node.children = self._queued_children.pop(child_relative_path)
+                else:
+                    self._queued_nodes[child_relative_path] = node
+            children[node.name] = node
+        return children
@@ -0,0 +1,306 @@
+""" Versioned binary encoding of checkpoints.
+
+A checkpoint file starts with a header (magic, format version, codec id of the body, 0 if it is uncompressed),
+followed by the body:
+
+    time        varint length + ISO format string
+    name        varint length + UTF-8 string, length 0 if the checkpoint has no name
+    digest size byte
+    hash        byte, id of the hash algorithm of the checksums and tree keys (see bakker.hashing)
+    ignore      varint pattern count followed by the varint length + UTF-8 string of each ignore pattern of the
+                checkpoint (see bakker.ignore)
+    nodes
+    root offset 8 bytes, offset of the root node in the body
+
+Nodes are encoded in post-order, so every directory follows its children and can refer to them by their offset:
+
+    type        byte (directory, file or symlink)
+    permissions varint
+    name        varint length + file system encoded name
+    digest      raw checksum bytes
+    tree key    raw key of the tree object of the directory (see bakker.trees), directories only
+    children    varint child count followed by 8 byte child offsets sorted by encoded name, directories only
+
+An uncompressed checkpoint file is memory-mapped and its directories are only decoded when they are accessed, a
+path is found by a binary search over the child offsets of each directory on it. Compressed checkpoint files are
+decompressed into memory first.
+"""
+
+import mmap
+import struct
+
+from .compression import CODECS_BY_ID
+from .hashing import HASH_ALGORITHMS_BY_ID
+from .utils import datetime_from_iso_format
+
+
+MAGIC = b'BKCP'
+VERSION = 1
+HEADER = struct.Struct('>4sBB')
+OFFSET = struct.Struct('>Q')
+
+TYPE_DIRECTORY = 0
+TYPE_FILE = 1
+TYPE_SYMLINK = 2
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def encode_name(name):
+    return name.encode('utf-8', 'surrogateescape')
+
+
+def decode_name(encoded_name):
+    return encoded_name.decode('utf-8', 'surrogateescape')
+
+
+class _Writer:
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, f, codec=None, level=None):
+        self.f = f
+        self.compressor = None if codec is None else codec.compressor(level)
+        self.buffer = bytearray()
+        # uncompressed bytes written so far
+        self.position = 0
+
+    def write(self, data):
+        self.position += len(data)
+        self.buffer += data
+        if len(self.buffer) >= self.BUFFER_SIZE:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        self.f.write(data if self.compressor is None else self.compressor.compress(data))
+
+    def close(self):
+        self._write_buffer()
+        if self.compressor is not None:
+            self.f.write(self.compressor.flush())
+
+
+def _decode_varint(buffer, position):
+    """ Returns the varint at the position of the buffer and the position following it. """
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class TreeBuffer:
+    """ Decodes the nodes of a checkpoint body on demand.
+
+    :param buffer: the body, e.g. a memory-mapped checkpoint file
+    :param base: the position of the body in the buffer
+    """
+
+    def __init__(self, buffer, base, digest_size):
+        self.buffer = buffer
+        self.base = base
+        self.digest_size = digest_size
+
+    def _node_name(self, offset):
+        position = self.base + offset + 1
+        _, position = _decode_varint(self.buffer, position)
+        name_length, position = _decode_varint(self.buffer, position)
+        return self.buffer[position:position + name_length]
+
+    def node(self, offset):
+        from .checkpoint import FileNode, LazyDirectoryNode, SymlinkNode
+
+        buffer = self.buffer
+        position = self.base + offset
+        node_type = buffer[position]
+        permissions, position = _decode_varint(buffer, position + 1)
+        name_length, position = _decode_varint(buffer, position)
+        name = decode_name(buffer[position:position + name_length])
+        position += name_length
+        digest = buffer[position:position + self.digest_size]
+        position += self.digest_size
+
+        if node_type == TYPE_DIRECTORY:
+            tree_key = buffer[position:position + self.digest_size].hex()
+            position += self.digest_size
+            child_count, position = _decode_varint(buffer, position)
+            node = LazyDirectoryNode(name, None, permissions, self, position, child_count, tree_key)
+        elif node_type == TYPE_FILE:
+            node = FileNode(name, None, permissions)
+        elif node_type == TYPE_SYMLINK:
+            node = SymlinkNode(name, None, permissions)
+        else:
+            raise ValueError('Unknown node type: ' + str(node_type))
+        # the raw digest is kept, without converting it to hex and back
+        node.digest = digest
+        return node
+
+    def child_offsets(self, table_position, child_count):
+        return struct.unpack_from('>{}Q'.format(child_count), self.buffer, table_position)
+
+    def find_child(self, table_position, child_count, name):
+        """ Returns the offset of the child with the given name or None, by a binary search over the child table. """
+        encoded_name = encode_name(name)
+        low, high = 0, child_count
+        while low < high:
+            middle = (low + high) // 2
+            child_offset = OFFSET.unpack_from(self.buffer, table_position + middle * OFFSET.size)[0]
+            middle_name = self._node_name(child_offset)
+            if middle_name < encoded_name:
+                low = middle + 1
+            elif middle_name > encoded_name:
+                high = middle
+            else:
+                return child_offset
+        return None
+
+
+def encode_node(node, node_type):
+    """ Returns the encoded type, permissions, name and checksum of the node. """
+    encoded_name = encode_name(node.name)
+    return (bytes([node_type]) + encode_varint(node.permissions) + encode_varint(len(encoded_name)) + encoded_name +
+            node.digest)
+
+
+class CheckpointWriter:
+    """ Writes a binary checkpoint node by node, e.g. while the checkpoint is built.
+
+    Nodes are added in post-order: the children of a directory are added before it, and the root last. Only the
+    records of the nodes whose parent was not added yet are kept, so the memory used is bounded by the directories
+    that are not complete yet rather than by the size of the checkpoint. Once a directory is added, its subdirectories
+    only need their checksums and tree keys.
+
+    :param codec: the Codec the body is compressed with, uncompressed if None. Only uncompressed checkpoints are
+        memory-mapped when they are loaded.
+    """
+
+    def __init__(self, f, time, name, hash_algorithm, digest_size=None, codec=None, level=None, ignore_patterns=None):
+        self.hash_algorithm = hash_algorithm
+        self.digest_size = hash_algorithm.digest_size if digest_size is None else digest_size
+
+        f.write(HEADER.pack(MAGIC, VERSION, 0 if codec is None else codec.codec_id))
+        self.writer = _Writer(f, codec, level)
+        time_string = time.isoformat().encode()
+        encoded_name = b'' if name is None else name.encode()
+        self.writer.write(encode_varint(len(time_string)) + time_string + encode_varint(len(encoded_name)) +
+                          encoded_name + bytes([self.digest_size, hash_algorithm.algorithm_id]))
+        ignore_patterns = [] if ignore_patterns is None else ignore_patterns
+        self.writer.write(encode_varint(len(ignore_patterns)))
+        for pattern in ignore_patterns:
+            encoded_pattern = encode_name(pattern)
+            self.writer.write(encode_varint(len(encoded_pattern)) + encoded_pattern)
+
+        # id of a node -> (encoded name, offset, encoded node) of the nodes whose parent was not added yet
+        self._records = dict()
+        self._last_offset = None
+
+    def add(self, node):
+        from .checkpoint import DirectoryNode, SymlinkNode
+        from . import trees
+
+        offset = self.writer.position
+        if isinstance(node, DirectoryNode):
+            records = sorted(self._records.pop(id(child)) for child in node.children.values())
+            # the tree object of the directory consists of the records of its children, so its key is computed
+            # without encoding the directory again
+            node.tree_key = trees.tree_key(trees.tree_object(self.digest_size, [record[2] for record in records]),
+                                           self.hash_algorithm)
+            encoded_node = encode_node(node, TYPE_DIRECTORY) + bytes.fromhex(node.tree_key)
+            self.writer.write(encoded_node + encode_varint(len(records)) +
+                              b''.join(OFFSET.pack(record[1]) for record in records))
+        else:
+            encoded_node = encode_node(node, TYPE_SYMLINK if isinstance(node, SymlinkNode) else TYPE_FILE)
+            self.writer.write(encoded_node)
+        self._records[id(node)] = (encode_name(node.name), offset, encoded_node)
+        self._last_offset = offset
+
+    def close(self):
+        """ Finishes the checkpoint, the node added last is its root. """
+        self.writer.write(OFFSET.pack(self._last_offset))
+        self.writer.close()
+        self._records.clear()
+
+
+def dump(checkpoint, f, codec=None, level=None):
+    """ Writes the checkpoint to the binary file object f, see CheckpointWriter. """
+    from .checkpoint import DirectoryNode
+
+    writer = CheckpointWriter(f, checkpoint.time, checkpoint.name, checkpoint.hash_algorithm,
+                              len(checkpoint.root.digest), codec, level, checkpoint.ignore_patterns)
+    # (node, whether its children were added already)
+    stack = [(checkpoint.root, False)]
+    while stack:
+        node, children_added = stack.pop()
+        if isinstance(node, DirectoryNode) and not children_added:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children.values())
+        else:
+            writer.add(node)
+    writer.close()
+
+
+def load(f):
+    """ Reads a checkpoint written by dump() from the binary file object f.
+
+    The directories of the checkpoint are decoded lazily, an uncompressed checkpoint file is memory-mapped and
+    stays mapped after f is closed.
+    """
+    from .checkpoint import Checkpoint
+
+    magic, version, codec_id = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a binary checkpoint file.')
+    if version != VERSION:
+        raise ValueError('Unsupported checkpoint format version: ' + str(version))
+
+    if codec_id:
+        buffer = CODECS_BY_ID[codec_id].decompress(f.read())
+        base = 0
+    else:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            base = HEADER.size
+        except (AttributeError, OSError, ValueError):
+            # not a real file, e.g. io.BytesIO
+            buffer = f.read()
+            base = 0
+
+    end = len(buffer) - base - OFFSET.size
+    if end < 0:
+        raise EOFError('Checkpoint file is truncated.')
+    time_length, position = _decode_varint(buffer, base)
+    time = datetime_from_iso_format(bytes(buffer[position:position + time_length]).decode())
+    position += time_length
+    name_length, position = _decode_varint(buffer, position)
+    name = bytes(buffer[position:position + name_length]).decode() or None
+    position += name_length
+    digest_size = buffer[position]
+    hash_algorithm = HASH_ALGORITHMS_BY_ID.get(buffer[position + 1])
+    if hash_algorithm is None:
+        raise ValueError('Unknown hash algorithm id in checkpoint file: ' + str(buffer[position + 1]))
+    ignore_patterns = []
+    pattern_count, position = _decode_varint(buffer, position + 2)
+    for _ in range(pattern_count):
+        pattern_length, position = _decode_varint(buffer, position)
+        ignore_patterns.append(decode_name(bytes(buffer[position:position + pattern_length])))
+        position += pattern_length
+
+    tree_buffer = TreeBuffer(buffer, base, digest_size)
+    root_offset = OFFSET.unpack_from(buffer, base + end)[0]
+    if root_offset >= end:
+        raise ValueError('Invalid root offset in checkpoint file.')
+    return Checkpoint(tree_buffer.node(root_offset), time=time, name=name, hash_algorithm=hash_algorithm,
+                      ignore_patterns=ignore_patterns)
+
@@ -1,11 +1,38 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import io
+import json
 import os
+import re
 import shutil
+import stat
+import tempfile
+import threading
 
-from bakker.checkpoint import Checkpoint, FileNode, SymlinkNode, DirectoryNode, CheckpointMeta
+import xxhash
+
+from bakker.cache import HashCache
+from bakker.checkpoint_index import CheckpointIndex
+from bakker.chunking import Chunker
+from bakker.compression import Codec, get_codec
+from bakker.hashing import HashingReader, DEFAULT_HASH_ALGORITHM, get_hash_algorithm, fadvise
+from bakker.object_index import ObjectIndex
+from bakker.packs import PackStore
+from bakker.checkpoint import Checkpoint, FileNode, SymlinkNode, DirectoryNode, CheckpointMeta, StoredDirectoryNode
+from bakker import trees
+from bakker.restore import TreeRetriever, retrieve_incremental, retrieve_paths
+from bakker.transfer import FileCopier, TransferStats, copy_times, BUFFERED, HARDLINK, PACKED, CHUNKED, COMPRESSED, \
+    SYMLINK
+from bakker.utils import BlockReader, datetime_from_iso_format
 
 
 class Storage(ABC):
+    # number of files whose presence store() checks at once
+    STORE_BATCH_SIZE = 1024
+    VERIFY_BLOCKSIZE = 1024 * 1024
+    # the HashAlgorithm of the checksums of all files in the storage
+    hash_algorithm = DEFAULT_HASH_ALGORITHM
+
     @abstractmethod
     def has_file(self, checksum):
         pass
@@ -22,6 +49,40 @@ class Storage(ABC):
     def store_checkpoint(self, checkpoint):
         pass
 
+    @abstractmethod
+    def open_file(self, checksum):
+        """ Returns a binary file object reading the stored file, see CheckpointView.
+
+        :raises FileNotFoundError: If the file is not stored.
+        """
+
+    @abstractmethod
+    def quarantine_file(self, checksum):
+        """ Removes a corrupt file from the storage, so the next checkpoint that contains it stores it again, see
+        bakker.verify.
+        """
+
+    def verify_file(self, checksum, hash_algorithm=None, throttle=None):
+        """ Reads the stored file and returns whether it still matches its checksum.
+
+        :param hash_algorithm: the HashAlgorithm of the checksum, the one of the storage if None
+        :param throttle: Throttle that limits the rate the file is read at
+        :returns: the number of bytes read, or None if the file does not match its checksum
+        :raises FileNotFoundError: If the file or a part of it is missing.
+        """
+        message = (self.hash_algorithm if hash_algorithm is None else hash_algorithm).new()
+        size = 0
+        with self.open_file(checksum) as f:
+            while True:
+                block = f.read(self.VERIFY_BLOCKSIZE)
+                if not block:
+                    break
+                if throttle is not None:
+                    throttle.consume(len(block))
+                message.update(block)
+                size += len(block)
+        return size if message.hexdigest() == checksum else None
+
     @abstractmethod
     def retrieve_checkpoint_metas(self):
         pass
@@ -30,71 +91,394 @@ class Storage(ABC):
     def retrieve_checkpoint(self, checkpoint_meta):
         pass
 
+    def flush(self):
+        """ Makes all stored files durable. Called before the checkpoint referencing them is stored. """
+        pass
+
+    @abstractmethod
+    def store_hash_cache(self, src_dir_path, hash_cache):
+        pass
+
+    @abstractmethod
+    def retrieve_hash_cache(self, src_dir_path):
+        pass
+
+    def store_file_hashed(self, src_file_path):
+        """ Stores the regular file if it is not stored yet and returns its checksum.
+
+        This reads the file twice, storages that can hash a file while storing it override it.
+        """
+        checksum = self.hash_algorithm.file_checksum(src_file_path)
+        if not self.has_file(checksum):
+            self.store_file(src_file_path, checksum)
+        return checksum
+
+    def create(self, src_dir_path, name=None, hash_cache=None, workers=None, scan_processes=None,
+               ignore_patterns=None):
+        """ Builds the checkpoint of the directory and stores it, storing files while they are hashed.
+
+        The checkpoint is the same as the one built by Checkpoint.build_checkpoint. Symlinks and files whose
+        checksums come from the hash cache are stored by store() afterwards, if they are missing.
+
+        :param workers: number of threads hashing and storing files concurrently, one after another if None
+        :param scan_processes: number of processes walking the directory, see Checkpoint.build_checkpoint
+        :param ignore_patterns: patterns of ignored paths, see Checkpoint.build_checkpoint
+        :returns: the checkpoint
+        """
+        checkpoint = Checkpoint.build_checkpoint(src_dir_path, name, hash_cache, workers,
+                                                 hash_function=self.store_file_hashed,
+                                                 hash_algorithm=self.hash_algorithm, scan_processes=scan_processes,
+                                                 ignore_patterns=ignore_patterns)
+        self.store(src_dir_path, checkpoint)
+        return checkpoint
+
+    def has_files(self, checksums):
+        """ Returns the set of the given checksums whose files are stored. Storages that can check many files at once
+        override it.
+        """
+        return set(checksum for checksum in checksums if self.has_file(checksum))
+
     def store(self, src_dir_path, checkpoint):
-        for node, relative_node_path in checkpoint.iter():
-            absolute_node_path = os.path.join(src_dir_path, relative_node_path)
-            if isinstance(node, FileNode) and not self.has_file(node.checksum):
-                self.store_file(absolute_node_path, node.checksum)
-            elif isinstance(node, SymlinkNode) and not self.has_file(node.checksum):
-                self.store_file(absolute_node_path, node.checksum)
+        """ Stores the files of the checkpoint that are not stored yet, and the checkpoint.
 
+        :raises ValueError: If the checkpoint was built with another hash algorithm than the one of the storage.
+        """
+        if checkpoint.hash_algorithm is not self.hash_algorithm:
+            raise ValueError('The checkpoint is hashed with {}, the storage with {}.'.format(
+                    checkpoint.hash_algorithm.name, self.hash_algorithm.name))
+        for _ in self.store_nodes(src_dir_path, checkpoint.iter()):
+            pass
+
+        self.flush()
         self.store_checkpoint(checkpoint)
 
-    def retrieve(self, dst_dir_path, checkpoint_meta):
+    def store_nodes(self, src_dir_path, nodes):
+        """ Stores the files and symlinks among the (node, relative path) pairs that are not stored yet, and yields
+        the pairs, e.g. of Checkpoint.iter() or of the stream of Checkpoint.build_nodes().
+        """
+        batch = []
+        for node, relative_node_path in nodes:
+            if isinstance(node, (FileNode, SymlinkNode)):
+                batch.append((node, relative_node_path))
+                if len(batch) >= self.STORE_BATCH_SIZE:
+                    self._store_batch(src_dir_path, batch)
+                    batch = []
+            yield node, relative_node_path
+        self._store_batch(src_dir_path, batch)
+
+    def _store_batch(self, src_dir_path, batch):
+        stored_checksums = self.has_files(set(node.checksum for node, _ in batch))
+        for node, relative_node_path in batch:
+            if node.checksum not in stored_checksums:
+                self.store_file(os.path.join(src_dir_path, relative_node_path), node.checksum)
+                stored_checksums.add(node.checksum)
+
+    def retrieve(self, dst_dir_path, checkpoint_meta, workers=None, paths=None):
+        """ Retrieves the checkpoint to the existing destination directory.
+
+        :param workers: number of files retrieved concurrently, files are retrieved one after another if None
+        :param paths: paths or glob patterns relative to the root of the checkpoint, only the matching subtrees are
+            retrieved if given, see bakker.restore.retrieve_paths
+        :raises RestoreError: If any file could not be retrieved.
+        :raises NoMatchError: If one of the paths matches nothing in the checkpoint.
+        """
         checkpoint = self.retrieve_checkpoint(checkpoint_meta)
-        for item, relative_item_path in checkpoint.iter():
-            item_path = os.path.join(dst_dir_path, relative_item_path)
-            if isinstance(item, DirectoryNode) and not os.path.exists(item_path):
-                os.mkdir(item_path, item.permissions)
-            if isinstance(item, SymlinkNode) or isinstance(item, FileNode):
-                item_path = os.path.join(dst_dir_path, relative_item_path)
-                self.retrieve_file(item.checksum, item_path, item.permissions)
-
-    def retrieve_by_checksum(self, dst_dir_path, checksum):
-        checkpoint_metas = self.retrieve_checkpoint_metas()
-
-        checkpoint_meta_candidates = []
-        for checkpoint_meta in checkpoint_metas:
-            if checkpoint_meta.checksum[:len(checksum)] == checksum:
-                checkpoint_meta_candidates.append(checkpoint_meta)
+        if paths is not None:
+            return retrieve_paths(self, dst_dir_path, checkpoint, paths, workers)
+        return self.retrieve_tree(checkpoint.root, dst_dir_path, workers=workers)
+
+    def retrieve_tree(self, root, dst_path, stats=None, workers=None):
+        """ Retrieves the node and, if it is a directory, all nodes below it to dst_path, see TreeRetriever.
+
+        :param stats: RestoreStats the retrieved files are counted in
+        :returns: RestoreStats
+        """
+        retriever = TreeRetriever(self, workers, stats)
+        retriever.add(root, dst_path)
+        return retriever.finish()
+
+    def retrieve_incremental(self, dst_dir_path, checkpoint_meta, delete=False, workers=None):
+        """ Makes the destination directory match the checkpoint, only retrieving the files that differ, see
+        bakker.restore.retrieve_incremental. The hash cache of the destination is used and updated.
+
+        :param delete: also delete paths that are not part of the checkpoint
+        :returns: RestoreStats
+        """
+        hash_cache = self.retrieve_hash_cache(dst_dir_path)
+        stats = retrieve_incremental(self, dst_dir_path, self.retrieve_checkpoint(checkpoint_meta), delete, hash_cache,
+                                     workers)
+        self.store_hash_cache(dst_dir_path, hash_cache)
+        return stats
+
+    def find_checkpoint_metas_by_checksum(self, checksum):
+        """ Returns the metas of all checkpoints whose checksum starts with the given checksum. """
+        return [meta for meta in self.retrieve_checkpoint_metas() if meta.checksum[:len(checksum)] == checksum]
+
+    def find_checkpoint_metas_by_name(self, name):
+        """ Returns the metas of all checkpoints with the given name. """
+        return [meta for meta in self.retrieve_checkpoint_metas() if meta.name == name]
+
+    def find_checkpoint_metas_by_time(self, start=None, end=None):
+        """ Returns the metas of all checkpoints created at or after start and before end, sorted by time.
+
+        :param start: a datetime, unbounded if None
+        :param end: a datetime, unbounded if None
+        """
+        checkpoint_metas = [meta for meta in self.retrieve_checkpoint_metas()
+                            if (start is None or meta.time >= start) and (end is None or meta.time < end)]
+        return sorted(checkpoint_metas, key=lambda meta: meta.time)
+
+    def find_by_checksum(self, checksum):
+        """ Returns the meta of the only checkpoint whose checksum starts with the given checksum
+
+        :raises FileNotFoundError: If no checkpoint matches.
+        :raises NoUniqueMatchError: If more than one checkpoint matches.
+        """
+        checkpoint_meta_candidates = self.find_checkpoint_metas_by_checksum(checksum)
 
         if len(checkpoint_meta_candidates) == 0:
             raise FileNotFoundError(checksum)
         elif len(checkpoint_meta_candidates) == 1:
-            self.retrieve(dst_dir_path, checkpoint_meta_candidates[0])
+            return checkpoint_meta_candidates[0]
         else:
             raise NoUniqueMatchError(checksum)
 
-    def retrieve_by_name(self, dst_dir_path, name):
-        checkpoint_metas = self.retrieve_checkpoint_metas()
+    def find_by_name(self, name):
+        """ Returns the meta of the only checkpoint with the given name
 
-        checkpoint_meta_candidates = []
-        for checkpoint_meta in checkpoint_metas:
-            if checkpoint_meta.name == name:
-                checkpoint_meta_candidates.append(checkpoint_meta)
+        :raises FileNotFoundError: If no checkpoint matches.
+        :raises NoUniqueMatchError: If more than one checkpoint matches.
+        """
+        checkpoint_meta_candidates = self.find_checkpoint_metas_by_name(name)
 
         if len(checkpoint_meta_candidates) == 0:
             raise FileNotFoundError(name)
         elif len(checkpoint_meta_candidates) == 1:
-            self.retrieve(dst_dir_path, checkpoint_meta_candidates[0])
+            return checkpoint_meta_candidates[0]
         else:
             raise NoUniqueMatchError(name)
 
+    def find_by_identifier(self, identifier):
+        """ Returns the meta of the only checkpoint whose checksum starts with the identifier, or otherwise of the
+        only checkpoint named like the identifier.
+        """
+        try:
+            return self.find_by_checksum(identifier)
+        except FileNotFoundError:
+            return self.find_by_name(identifier)
+
+    def retrieve_by_checksum(self, dst_dir_path, checksum, workers=None):
+        return self.retrieve(dst_dir_path, self.find_by_checksum(checksum), workers)
+
+    def retrieve_by_name(self, dst_dir_path, name, workers=None):
+        return self.retrieve(dst_dir_path, self.find_by_name(name), workers)
+
 
 class FileSystemStorage(Storage):
     TREE_DIR = 'checkpoints'
     FILE_DIR = 'files'
+    CHUNK_DIR = 'chunks'
+    MANIFEST_DIR = 'manifests'
+    PACK_DIR = 'packs'
+    TREE_OBJECT_DIR = 'trees'
+    CACHE_DIR = 'caches'
+    LAYOUT_FILE = 'store.json'
+    CHECKPOINT_INDEX_FILE = 'checkpoints.idx'
+    OBJECT_INDEX_FILE = 'objects.idx'
+    QUARANTINE_DIR = 'quarantine'
+    VERIFY_STATE_FILE = 'verify.json'
+    CHECKSUM_PATTERN = re.compile('^([0-9a-f]{2})+$')
+    LAYOUT_VERSION = 1
+    CACHE_FILE_EXT = '.json'
     TREE_FILE_EXT = '.json'
+    BINARY_TREE_FILE_EXT = '.ckpt'
+    ROOT_TREE_FILE_EXT = '.root'
+    CHECKPOINT_FORMATS = {'binary': BINARY_TREE_FILE_EXT, 'json': TREE_FILE_EXT, 'tree': ROOT_TREE_FILE_EXT}
+    ROOT_TREE_VERSION = 1
+    MANIFEST_FILE_EXT = '.json'
     FILE_EXT = ''
+    TMP_FILE_EXT = '.tmp'
     REMOTE_PERMISSIONS = 0o440
+    # of checkpoint files written to temporary files first
+    TREE_FILE_PERMISSIONS = 0o644
+    DEFAULT_FAN_OUT = 0
+    # smaller files are always stored as a whole, chunking them would hardly find duplicate data
+    CHUNKING_MIN_FILE_SIZE = 4 * 1024 * 1024
+    PACK_MAX_OBJECT_SIZE = 8 * 1024
+    STORE_BLOCKSIZE = 1024 * 1024
+    # number of decoded tree objects kept in memory, shared by all checkpoints retrieved from the storage
+    TREE_CACHE_SIZE = 4096
 
-    def __init__(self, path):
+    def __init__(self, path, chunking=False, chunker=None, fan_out=DEFAULT_FAN_OUT, packing=False, compression=None,
+                 compression_level=None, checkpoint_format='binary', hardlink_restore=False, hash_algorithm=None):
+        """
+        :param path: the root directory of the storage
+        :param chunking: store large files as content defined chunks, so files that changed only partially share
+            most of their chunks with previous versions
+        :param chunker: the Chunker used to split files, a Chunker with default chunk sizes if None
+        :param fan_out: number of directory levels objects are sharded into, e.g. files/ab/cd/abcd... for 2. Only
+            used for new storages, existing storages keep their layout until they are migrated.
+        :param packing: append files up to PACK_MAX_OBJECT_SIZE bytes to pack files instead of storing each of them
+            as a separate file
+        :param compression: name of the codec new objects are compressed with (zlib, zstd or lz4), None to store
+            objects uncompressed. Objects whose first block does not compress are always stored uncompressed.
+        :param compression_level: compression level of the codec, the default level of the codec if None
+        :param checkpoint_format: 'binary', 'json' or 'tree', the format new checkpoints are stored in. Binary
+            checkpoints are stored uncompressed, so they are memory-mapped and decoded lazily when they are
+            retrieved. The tree format stores every directory as a content-addressed tree object (see bakker.trees)
+            and the checkpoint as a small root record, so only directories that changed since any previous
+            checkpoint are written. Checkpoints of all formats are retrieved.
+        :param hardlink_restore: restore read-only files that are stored uncompressed as hardlinks to their objects
+            where the file system allows it, if their permissions are the ones of the objects (REMOTE_PERMISSIONS).
+            The restored files share the inode, and so the permissions, of the object and must not be made writable.
+        :param hash_algorithm: name of the hash algorithm of the checksums (see bakker.hashing), xxh64 if None. Only
+            used for new storages, existing storages keep the algorithm they were created with.
+        """
         self.path = path
         self.tree_path = os.path.join(path, self.TREE_DIR)
         self.file_path = os.path.join(path, self.FILE_DIR)
+        self.chunk_path = os.path.join(path, self.CHUNK_DIR)
+        self.manifest_path = os.path.join(path, self.MANIFEST_DIR)
+        self.cache_path = os.path.join(path, self.CACHE_DIR)
+        self.tree_object_path = os.path.join(path, self.TREE_OBJECT_DIR)
+        self.layout_file_path = os.path.join(path, self.LAYOUT_FILE)
+        self.quarantine_path = os.path.join(path, self.QUARANTINE_DIR)
+        # progress of an interrupted verification, see bakker.verify
+        self.verify_state_file_path = os.path.join(path, self.VERIFY_STATE_FILE)
+        self.checkpoint_index = CheckpointIndex(os.path.join(path, self.CHECKPOINT_INDEX_FILE), self.tree_path,
+                                                list(self.CHECKPOINT_FORMATS.values()))
+        self.chunking = chunking
+        self.chunker = Chunker() if chunker is None else chunker
+        self.packing = packing
+        self.packs = PackStore(os.path.join(path, self.PACK_DIR))
+        self._objects_checked = False
+        self.compression = None if compression is None else get_codec(compression)
+        self.compression_level = compression_level
+        if checkpoint_format not in self.CHECKPOINT_FORMATS:
+            raise ValueError('Unknown checkpoint format: ' + checkpoint_format)
+        self.checkpoint_format = checkpoint_format
+        self._tree_cache = OrderedDict()
+        self.hardlink_restore = hardlink_restore
+        self.copier = FileCopier()
+        # how files were transferred, by method (see bakker.transfer)
+        self.store_stats = TransferStats()
+        self.retrieve_stats = TransferStats()
+        # serializes adding objects while files are stored from several threads, see store_file_hashed
+        self._store_lock = threading.RLock()
+
+        self._load_layout(fan_out, hash_algorithm)
+        self.objects = ObjectIndex(os.path.join(path, self.OBJECT_INDEX_FILE), self.hash_algorithm.digest_size)
+
+    def _load_layout(self, fan_out, hash_algorithm=None):
+        if os.path.isfile(self.layout_file_path):
+            with open(self.layout_file_path, 'r') as f:
+                layout = json.load(f)
+            if layout['version'] > self.LAYOUT_VERSION:
+                raise IOError('Unsupported storage layout version: ' + str(layout['version']))
+            self.fan_out = layout['fan_out']
+            self.previous_fan_out = layout.get('previous_fan_out')
+            self.codecs = [get_codec(name) for name in layout.get('codecs', [])]
+            self.hash_algorithm = get_hash_algorithm(layout.get('hash_algorithm', DEFAULT_HASH_ALGORITHM.name))
+            self._layout_stored = True
+        else:
+            # storages created before the layout was recorded store all objects flat and use xxh64
+            existing = os.path.isdir(self.file_path)
+            self.fan_out = 0 if existing else fan_out
+            self.previous_fan_out = None
+            self.codecs = []
+            if existing or hash_algorithm is None:
+                self.hash_algorithm = DEFAULT_HASH_ALGORITHM
+            else:
+                self.hash_algorithm = get_hash_algorithm(hash_algorithm)
+            self._layout_stored = False
+
+    def _store_layout(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        layout = dict(version=self.LAYOUT_VERSION, fan_out=self.fan_out, previous_fan_out=self.previous_fan_out,
+                      codecs=[codec.name for codec in self.codecs], hash_algorithm=self.hash_algorithm.name)
+        tmp_layout_file_path = self.layout_file_path + self.TMP_FILE_EXT
+        with open(tmp_layout_file_path, 'w') as f:
+            json.dump(layout, f)
+        os.replace(tmp_layout_file_path, self.layout_file_path)
+        self._layout_stored = True
+
+    def _object_file_path(self, object_dir_path, name, fan_out=None):
+        fan_out = self.fan_out if fan_out is None else fan_out
+        shards = [name[2 * level:2 * level + 2] for level in range(fan_out)]
+        return os.path.join(object_dir_path, *shards, name)
+
+    def _find_object_file(self, object_dir_path, name, exists=os.path.lexists, compressed=False):
+        """ Returns the path of an existing object or None.
+
+        While a migration is running, the object may still be in the previous layout. The previous layout is checked
+        first, so an object that is moved concurrently is found in the new layout.
+
+        :param compressed: also look for the object compressed with any codec that was used in the storage
+        """
+        names = [name]
+        if compressed:
+            names += [name + codec.file_ext for codec in self.codecs]
+        fan_outs = [self.fan_out] if self.previous_fan_out is None else [self.previous_fan_out, self.fan_out]
+        for fan_out in fan_outs:
+            for object_name in names:
+                object_file_path = self._object_file_path(object_dir_path, object_name, fan_out)
+                if exists(object_file_path):
+                    return object_file_path
+        return None
+
+    def _object_codec(self, object_file_path):
+        """ Returns the codec the object was compressed with or None. """
+        for codec in self.codecs:
+            if object_file_path.endswith(codec.file_ext):
+                return codec
+        return None
+
+    def _compression_codec(self, sample):
+        """ Returns the codec new data starting with the sample is compressed with, or None if it is not compressed.
+
+        The codec is recorded in the layout before it is used for the first time, so the object is found again.
+        """
+        if self.compression is None or not self.compression.is_compressible(sample, self.compression_level):
+            return None
+        with self._store_lock:
+            if self.compression not in self.codecs:
+                self.codecs.append(self.compression)
+                self._store_layout()
+        return self.compression
 
     def has_file(self, checksum):
-        return os.path.lexists(os.path.join(self.file_path, checksum + self.FILE_EXT))
+        """ Checks the pack and object indexes first, so stored files are usually found without a syscall. Only files
+        that are in neither index are looked up in the storage, and added to the object index if they are found.
+        """
+        if checksum in self.packs or checksum in self._object_index():
+            return True
+        if (self._find_object_file(self.file_path, checksum + self.FILE_EXT, compressed=True) is not None
+                or self._find_object_file(self.manifest_path, checksum + self.MANIFEST_FILE_EXT) is not None):
+            self.objects.add(checksum)
+            return True
+        return False
+
+    def _object_index(self):
+        """ Returns the object index, rebuilt from the objects in the storage if it does not exist yet. """
+        if not self._objects_checked:
+            with self._store_lock:
+                if not self._objects_checked:
+                    if not self.objects.exists() and os.path.isdir(self.path):
+                        self.objects.rebuild(self._stored_object_checksums())
+                    self._objects_checked = True
+        return self.objects
+
+    def _stored_object_checksums(self):
+        """ Yields the checksums of the files stored as objects or manifests, by listing the object directories. """
+        for object_dir_path in [self.file_path, self.manifest_path]:
+            for _, _, file_names in os.walk(object_dir_path):
+                for file_name in file_names:
+                    # strips the extensions of codecs and manifests
+                    checksum = file_name.split('.', 1)[0]
+                    if not file_name.endswith(self.TMP_FILE_EXT) and self.CHECKSUM_PATTERN.match(checksum):
+                        yield checksum
 
     def store_file(self, src_file_path, checksum):
         """ Stores a single file at the backup location
@@ -104,16 +488,179 @@ class FileSystemStorage(Storage):
 
         :raises IOError: If the source is not readable or the destination is not writable.
         """
-        dst_file_path = os.path.join(self.file_path, checksum + self.FILE_EXT)
-
-        if os.path.isfile(dst_file_path):
+        if self.has_file(checksum):
             raise FileExistsError(checksum)
+        if not self._layout_stored:
+            self._store_layout()
+        src_stat = os.lstat(src_file_path)
+        if self.packing and stat.S_ISREG(src_stat.st_mode) and src_stat.st_size <= self.PACK_MAX_OBJECT_SIZE:
+            with open(src_file_path, 'rb') as f:
+                data = f.read()
+            codec = self._compression_codec(data)
+            self.packs.add(checksum, data if codec is None else codec.compress(data, self.compression_level), codec,
+                           src_stat.st_mtime_ns)
+            self.store_stats.add(PACKED, len(data))
+            return
+        if self.chunking and stat.S_ISREG(src_stat.st_mode) and src_stat.st_size >= self.CHUNKING_MIN_FILE_SIZE:
+            self._store_chunked_file(src_file_path, checksum, src_stat)
+            self.store_stats.add(CHUNKED, src_stat.st_size)
+            return
+
+        dst_file_path = self._object_file_path(self.file_path, checksum + self.FILE_EXT)
         if not os.path.exists(os.path.dirname(dst_file_path)):
             os.makedirs(os.path.dirname(dst_file_path))
 
-        shutil.copy2(src_file_path, dst_file_path, follow_symlinks=False)
-        if not os.path.islink(dst_file_path):
-            os.chmod(dst_file_path, self.REMOTE_PERMISSIONS)
+        if stat.S_ISREG(src_stat.st_mode) and self.compression is not None:
+            with open(src_file_path, 'rb') as src_file:
+                first_block = src_file.read(Codec.BLOCKSIZE)
+                codec = self._compression_codec(first_block)
+                if codec is not None:
+                    self._write_compressed_object(dst_file_path + codec.file_ext, codec, src_file, first_block,
+                                                  src_stat)
+                    self.objects.add(checksum)
+                    self.store_stats.add(COMPRESSED, src_stat.st_size)
+                    return
+
+        if stat.S_ISLNK(src_stat.st_mode):
+            shutil.copy2(src_file_path, dst_file_path, follow_symlinks=False)
+            self.objects.add(checksum)
+            self.store_stats.add(SYMLINK, 0)
+            return
+        self.store_stats.add(*self.copier.copy(src_file_path, dst_file_path, self.REMOTE_PERMISSIONS))
+        self.objects.add(checksum)
+
+    def create(self, src_dir_path, name=None, hash_cache=None, workers=None, scan_processes=None,
+               ignore_patterns=None):
+        """ Builds the checkpoint of the directory and stores it, storing files while they are hashed.
+
+        Binary checkpoints are written while they are built (see Checkpoint.write_checkpoint), so the checkpoint is
+        never held in memory as a whole, unless the directory is scanned by several processes. The returned
+        checkpoint is loaded lazily from the stored file.
+        """
+        if self.checkpoint_format != 'binary' or scan_processes is not None:
+            return super().create(src_dir_path, name, hash_cache, workers, scan_processes, ignore_patterns)
+
+        with self._store_lock:
+            if not self._layout_stored:
+                self._store_layout()
+        if not os.path.exists(self.tree_path):
+            os.makedirs(self.tree_path)
+        # refreshes the index before the checkpoint directory is modified, so it is not stale afterwards
+        self.checkpoint_index.refresh()
+        # the name of the checkpoint file depends on its checksum, which is only known once it is written
+        fd, tmp_tree_file_path = tempfile.mkstemp(suffix=self.TMP_FILE_EXT, dir=self.tree_path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                checkpoint_meta = Checkpoint.write_checkpoint(
+                        src_dir_path, f, name, hash_cache, workers, hash_function=self.store_file_hashed,
+                        hash_algorithm=self.hash_algorithm,
+                        process_nodes=lambda nodes: self.store_nodes(src_dir_path, nodes),
+                        ignore_patterns=ignore_patterns)
+            # the objects are durable before the checkpoint referencing them is
+            self.flush()
+            # the index is stale while the temporary file exists, the checkpoint files are looked for directly
+            checkpoint_name = checkpoint_meta.to_string()
+            if any(os.path.lexists(os.path.join(self.tree_path, checkpoint_name + tree_file_ext))
+                   for tree_file_ext in self.CHECKPOINT_FORMATS.values()):
+                raise FileExistsError(checkpoint_name)
+            tree_file_name = checkpoint_name + self.BINARY_TREE_FILE_EXT
+            os.chmod(tmp_tree_file_path, self.TREE_FILE_PERMISSIONS)
+            os.replace(tmp_tree_file_path, os.path.join(self.tree_path, tree_file_name))
+        except BaseException:
+            if os.path.exists(tmp_tree_file_path):
+                os.remove(tmp_tree_file_path)
+            raise
+        self.checkpoint_index.add(tree_file_name)
+        return self.retrieve_checkpoint(checkpoint_meta)
+
+    def store_file_hashed(self, src_file_path):
+        """ Stores the regular file while it is hashed, so it is read only once, and returns its checksum.
+
+        The file is written to a temporary object, which is renamed to its checksum once the whole file is hashed or
+        discarded if the object is stored already. Files may be stored from several threads concurrently.
+        """
+        with self._store_lock:
+            if not self._layout_stored:
+                self._store_layout()
+
+        with open(src_file_path, 'rb') as src_file:
+            src_stat = os.fstat(src_file.fileno())
+            fadvise(src_file.fileno(), 'POSIX_FADV_SEQUENTIAL')
+            try:
+                return self._store_file_hashed(src_file, src_stat)
+            finally:
+                # the file is not read again, its pages would only evict more useful ones
+                if src_stat.st_size >= self.hash_algorithm.DROP_CACHE_MIN_SIZE:
+                    fadvise(src_file.fileno(), 'POSIX_FADV_DONTNEED')
+
+    def _store_file_hashed(self, src_file, src_stat):
+        """ Stores the file, the object gets the access and modification times of the src_stat. """
+        size = src_stat.st_size
+        reader = HashingReader(src_file, self.hash_algorithm)
+        if self.packing and size <= self.PACK_MAX_OBJECT_SIZE:
+            data = reader.read()
+            checksum = reader.hexdigest()
+            with self._store_lock:
+                if not self.has_file(checksum):
+                    codec = self._compression_codec(data)
+                    packed_data = data if codec is None else codec.compress(data, self.compression_level)
+                    self.packs.add(checksum, packed_data, codec, src_stat.st_mtime_ns)
+                    self.store_stats.add(PACKED, len(data))
+            return checksum
+        if self.chunking and size >= self.CHUNKING_MIN_FILE_SIZE:
+            chunks = self._store_chunks(reader)
+            checksum = reader.hexdigest()
+            with self._store_lock:
+                if not self.has_file(checksum):
+                    self._write_manifest(checksum, chunks, src_stat)
+                    self.store_stats.add(CHUNKED, size)
+            return checksum
+        return self._store_object_hashed(reader, src_stat)
+
+    def _store_object_hashed(self, reader, src_stat):
+        if not os.path.exists(self.file_path):
+            os.makedirs(self.file_path, exist_ok=True)
+        fd, tmp_object_file_path = tempfile.mkstemp(suffix=self.TMP_FILE_EXT, dir=self.file_path)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                first_block = reader.read(Codec.BLOCKSIZE)
+                codec = self._compression_codec(first_block)
+                if codec is None:
+                    block = first_block
+                    while block:
+                        tmp_file.write(block)
+                        block = reader.read(self.STORE_BLOCKSIZE)
+                else:
+                    codec.compress_file(reader, tmp_file, self.compression_level, first_block)
+            checksum = reader.hexdigest()
+
+            with self._store_lock:
+                if self.has_file(checksum):
+                    os.remove(tmp_object_file_path)
+                    return checksum
+                object_file_path = self._object_file_path(self.file_path, checksum + self.FILE_EXT)
+                if codec is not None:
+                    object_file_path += codec.file_ext
+                if not os.path.exists(os.path.dirname(object_file_path)):
+                    os.makedirs(os.path.dirname(object_file_path))
+                os.chmod(tmp_object_file_path, self.REMOTE_PERMISSIONS)
+                copy_times(src_stat, tmp_object_file_path)
+                os.replace(tmp_object_file_path, object_file_path)
+                self.objects.add(checksum)
+        except BaseException:
+            if os.path.exists(tmp_object_file_path):
+                os.remove(tmp_object_file_path)
+            raise
+        self.store_stats.add(BUFFERED if codec is None else COMPRESSED, src_stat.st_size)
+        return checksum
+
+    def _write_compressed_object(self, object_file_path, codec, src_file, first_block, src_stat):
+        tmp_object_file_path = object_file_path + self.TMP_FILE_EXT
+        with open(tmp_object_file_path, 'wb') as dst_file:
+            codec.compress_file(src_file, dst_file, self.compression_level, first_block)
+        os.chmod(tmp_object_file_path, self.REMOTE_PERMISSIONS)
+        copy_times(src_stat, tmp_object_file_path)
+        os.replace(tmp_object_file_path, object_file_path)
 
     def retrieve_file(self, checksum, dst_file_path, file_permissions):
         """ Retrieves a single file from the backup location
@@ -124,41 +671,406 @@ class FileSystemStorage(Storage):
 
         :raises IOError: If the source is not readable or the destination is not writable.
         """
-        src_file_path = os.path.join(self.file_path, checksum + self.FILE_EXT)
         # checks existence and returns true for broken symlinks
-        if not os.path.lexists(src_file_path):
+        src_file_path = self._find_object_file(self.file_path, checksum + self.FILE_EXT, compressed=True)
+        if src_file_path is None:
+            manifest_file_path = self._find_object_file(self.manifest_path, checksum + self.MANIFEST_FILE_EXT)
+            if manifest_file_path is not None:
+                self._retrieve_chunked_file(checksum, manifest_file_path, dst_file_path, file_permissions)
+                return
+            if checksum in self.packs:
+                self._retrieve_packed_file(checksum, dst_file_path, file_permissions)
+                return
             raise FileNotFoundError(checksum)
 
-        shutil.copy2(src_file_path, dst_file_path, follow_symlinks=False)
-        if not os.path.islink(dst_file_path):
+        codec = self._object_codec(src_file_path)
+        if codec is not None:
+            with open(src_file_path, 'rb') as src_file, open(dst_file_path, 'wb') as dst_file:
+                src_stat = os.fstat(src_file.fileno())
+                codec.decompress_file(src_file, dst_file)
+                self.retrieve_stats.add(COMPRESSED, dst_file.tell())
             os.chmod(dst_file_path, file_permissions)
+            copy_times(src_stat, dst_file_path)
+            return
+
+        if os.path.islink(src_file_path):
+            shutil.copy2(src_file_path, dst_file_path, follow_symlinks=False)
+            self.retrieve_stats.add(SYMLINK, 0)
+            return
+        if self.hardlink_restore and not file_permissions & 0o222:
+            # a writable hardlink would allow changing the object through the restored file. The link shares the mode
+            # of the object, which is never changed, so only files with the same permissions are linked.
+            object_stat = os.lstat(src_file_path)
+            if (stat.S_IMODE(object_stat.st_mode) == file_permissions
+                    and self.copier.link(src_file_path, dst_file_path)):
+                self.retrieve_stats.add(HARDLINK, object_stat.st_size)
+                return
+        self.retrieve_stats.add(*self.copier.copy(src_file_path, dst_file_path, file_permissions))
+
+    def _retrieve_packed_file(self, checksum, dst_file_path, file_permissions):
+        data = self.packs.read(checksum)
+        mtime_ns = self.packs.lookup(checksum)[4]
+        fd = os.open(dst_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, data)
+            os.fchmod(fd, file_permissions)
+        finally:
+            os.close(fd)
+        # packs only record the modification time
+        os.utime(dst_file_path, ns=(mtime_ns, mtime_ns))
+        self.retrieve_stats.add(PACKED, len(data))
+
+    def flush(self):
+        self.packs.flush()
+        self.objects.flush()
+
+    def _store_chunked_file(self, src_file_path, checksum, src_stat):
+        """ Stores the chunks of the file that are not stored yet and a manifest listing all chunks of the file. The
+        manifest gets the access and modification times of the file, the chunks are shared with other files.
+        """
+        with open(src_file_path, 'rb') as f:
+            chunks = self._store_chunks(f)
+        # the manifest is written last, a file is only present once all of its chunks are stored
+        self._write_manifest(checksum, chunks, src_stat)
+
+    def _store_chunks(self, f):
+        """ Stores the chunks of the binary file object that are not stored yet and returns [checksum, length] lists
+        of all chunks.
+        """
+        chunks = []
+        for chunk in self.chunker.chunks(f):
+            chunk_checksum = self.hash_algorithm.hexdigest(chunk)
+            length = len(chunk)
+
+            if self._find_object_file(self.chunk_path, chunk_checksum, os.path.isfile, compressed=True) is None:
+                chunk_file_path = self._object_file_path(self.chunk_path, chunk_checksum)
+                codec = self._compression_codec(chunk[:Codec.BLOCKSIZE])
+                if codec is not None:
+                    chunk_file_path += codec.file_ext
+                    chunk = codec.compress(chunk, self.compression_level)
+                with self._store_lock:
+                    # another thread may have stored the chunk meanwhile
+                    if not os.path.isfile(chunk_file_path):
+                        self._write_object(chunk_file_path, chunk)
+            chunks.append([chunk_checksum, length])
+        return chunks
+
+    def _write_manifest(self, checksum, chunks, src_stat):
+        manifest = dict(size=sum(length for _, length in chunks), chunks=chunks)
+        manifest_file_path = self._object_file_path(self.manifest_path, checksum + self.MANIFEST_FILE_EXT)
+        self._write_object(manifest_file_path, json.dumps(manifest).encode(), src_stat)
+        self.objects.add(checksum)
+
+    def _retrieve_chunked_file(self, checksum, manifest_file_path, dst_file_path, file_permissions):
+        with open(manifest_file_path, 'r') as f:
+            manifest_stat = os.fstat(f.fileno())
+            manifest = json.load(f)
+
+        with open(dst_file_path, 'wb') as dst_file:
+            for chunk in self._chunks(checksum, manifest):
+                dst_file.write(chunk)
+        os.chmod(dst_file_path, file_permissions)
+        copy_times(manifest_stat, dst_file_path)
+        self.retrieve_stats.add(CHUNKED, manifest['size'])
+
+    def _chunks(self, checksum, manifest):
+        """ Yields the chunks of the file of the manifest one after another. """
+        for chunk_checksum, length in manifest['chunks']:
+            chunk_file_path = self._find_object_file(self.chunk_path, chunk_checksum, os.path.isfile,
+                                                     compressed=True)
+            if chunk_file_path is None:
+                raise FileNotFoundError('Chunk {} of file {} is missing.'.format(chunk_checksum, checksum))
+            with open(chunk_file_path, 'rb') as chunk_file:
+                chunk = chunk_file.read()
+            codec = self._object_codec(chunk_file_path)
+            if codec is not None:
+                chunk = codec.decompress(chunk)
+            if len(chunk) != length:
+                raise IOError('Chunk {} of file {} is corrupt.'.format(chunk_checksum, checksum))
+            yield chunk
+
+    def open_file(self, checksum):
+        """ Returns a binary file object reading the stored file. Compressed and chunked files are decompressed and
+        assembled while they are read, only packed files, which are small, are read at once. The content of a symlink
+        is its target path.
+
+        :raises FileNotFoundError: If the file is not stored.
+        """
+        src_file_path = self._find_object_file(self.file_path, checksum + self.FILE_EXT, compressed=True)
+        if src_file_path is None:
+            manifest_file_path = self._find_object_file(self.manifest_path, checksum + self.MANIFEST_FILE_EXT)
+            if manifest_file_path is not None:
+                with open(manifest_file_path, 'r') as f:
+                    manifest = json.load(f)
+                return io.BufferedReader(BlockReader(self._chunks(checksum, manifest)))
+            if checksum in self.packs:
+                return io.BytesIO(self.packs.read(checksum))
+            raise FileNotFoundError(checksum)
+
+        if os.path.islink(src_file_path):
+            return io.BytesIO(os.fsencode(os.readlink(src_file_path)))
+        codec = self._object_codec(src_file_path)
+        if codec is None:
+            return open(src_file_path, 'rb')
+        return io.BufferedReader(BlockReader(self._decompressed_blocks(src_file_path, codec)))
+
+    def quarantine_file(self, checksum):
+        """ Moves the objects of a corrupt file into the quarantine directory, keeping their paths relative to the
+        storage, and removes the file from the indexes, so the next checkpoint that contains the file stores it
+        again. Of a chunked file, its manifest and its corrupt chunks are moved, the intact chunks are shared with
+        other files. A packed file is only removed from the pack index, its data stays in its pack.
+        """
+        object_file_paths = []
+        object_file_path = self._find_object_file(self.file_path, checksum + self.FILE_EXT, compressed=True)
+        if object_file_path is not None:
+            object_file_paths.append(object_file_path)
+        manifest_file_path = self._find_object_file(self.manifest_path, checksum + self.MANIFEST_FILE_EXT)
+        if manifest_file_path is not None:
+            object_file_paths.extend(self._corrupt_chunk_file_paths(manifest_file_path))
+            object_file_paths.append(manifest_file_path)
+
+        for object_file_path in object_file_paths:
+            quarantine_file_path = os.path.join(self.quarantine_path, os.path.relpath(object_file_path, self.path))
+            if not os.path.exists(os.path.dirname(quarantine_file_path)):
+                os.makedirs(os.path.dirname(quarantine_file_path))
+            os.replace(object_file_path, quarantine_file_path)
+        if checksum in self.packs:
+            self.packs.remove([checksum])
+        self.objects.remove([checksum])
+
+    def _corrupt_chunk_file_paths(self, manifest_file_path):
+        with open(manifest_file_path, 'r') as f:
+            manifest = json.load(f)
+        for chunk_checksum, length in manifest['chunks']:
+            chunk_file_path = self._find_object_file(self.chunk_path, chunk_checksum, os.path.isfile, compressed=True)
+            if chunk_file_path is None:
+                continue
+            try:
+                with open(chunk_file_path, 'rb') as chunk_file:
+                    chunk = chunk_file.read()
+                codec = self._object_codec(chunk_file_path)
+                if codec is not None:
+                    chunk = codec.decompress(chunk)
+            except Exception:
+                yield chunk_file_path
+                continue
+            if len(chunk) != length or self.hash_algorithm.hexdigest(chunk) != chunk_checksum:
+                yield chunk_file_path
+
+    @staticmethod
+    def _decompressed_blocks(object_file_path, codec):
+        with open(object_file_path, 'rb') as f:
+            yield from codec.decompress_blocks(f)
+
+    def _write_object(self, object_file_path, data, src_stat=None):
+        """ Writes the data to a temporary file first, so a crash never leaves a partially written object.
+
+        :param src_stat: stat result of the file of the object, the object gets its access and modification times
+        """
+        if not os.path.exists(os.path.dirname(object_file_path)):
+            os.makedirs(os.path.dirname(object_file_path))
+
+        tmp_object_file_path = object_file_path + self.TMP_FILE_EXT
+        with open(tmp_object_file_path, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_object_file_path, self.REMOTE_PERMISSIONS)
+        if src_stat is not None:
+            copy_times(src_stat, tmp_object_file_path)
+        os.replace(tmp_object_file_path, object_file_path)
+
+    def migrate(self, fan_out):
+        """ Moves all objects into the layout with the given fan out.
+
+        Objects are renamed, their content is neither read nor hashed again. The storage can be used while the
+        migration is running, and an interrupted migration is continued by calling migrate again.
+
+        :raises ValueError: If an interrupted migration to another fan out has not been finished yet.
+        """
+        if self.previous_fan_out is None:
+            if fan_out == self.fan_out:
+                if not self._layout_stored and os.path.isdir(self.path):
+                    self._store_layout()
+                return
+            self.previous_fan_out, self.fan_out = self.fan_out, fan_out
+        elif fan_out != self.fan_out:
+            raise ValueError('Unfinished migration to fan out {} must be finished first.'.format(self.fan_out))
+        self._store_layout()
+
+        for object_dir_path in [self.file_path, self.chunk_path, self.manifest_path, self.tree_object_path]:
+            for dir_path, _, file_names in os.walk(object_dir_path):
+                for file_name in file_names:
+                    if file_name.endswith(self.TMP_FILE_EXT):
+                        continue
+                    object_file_path = os.path.join(dir_path, file_name)
+                    new_object_file_path = self._object_file_path(object_dir_path, file_name)
+                    if object_file_path == new_object_file_path:
+                        continue
+                    if not os.path.exists(os.path.dirname(new_object_file_path)):
+                        os.makedirs(os.path.dirname(new_object_file_path))
+                    os.rename(object_file_path, new_object_file_path)
+
+            for dir_path, dir_names, file_names in os.walk(object_dir_path, topdown=False):
+                if dir_path != object_dir_path and not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+
+        self.previous_fan_out = None
+        self._store_layout()
 
     def store_checkpoint(self, checkpoint):
-        tree_file_path = os.path.join(self.tree_path, checkpoint.meta.to_string() + self.TREE_FILE_EXT)
-        if os.path.isfile(tree_file_path):
+        checkpoint_name = checkpoint.meta.to_string()
+        # refreshes the index before the checkpoint directory is modified, so it is not stale afterwards
+        if self.checkpoint_index.tree_file_name(checkpoint.meta) is not None:
             raise FileExistsError(checkpoint)
-        if not os.path.exists(os.path.dirname(tree_file_path)):
-            os.makedirs(os.path.dirname(tree_file_path))
-        with open(tree_file_path, 'w') as f:
-            f.write(checkpoint.to_json())
+        if not self._layout_stored:
+            self._store_layout()
+        if not os.path.exists(self.tree_path):
+            os.makedirs(self.tree_path)
+
+        tree_file_name = checkpoint_name + self.CHECKPOINT_FORMATS[self.checkpoint_format]
+        tree_file_path = os.path.join(self.tree_path, tree_file_name)
+        tmp_tree_file_path = tree_file_path + self.TMP_FILE_EXT
+        if self.checkpoint_format == 'json':
+            with open(tmp_tree_file_path, 'w') as f:
+                checkpoint.dump_json(f)
+        elif self.checkpoint_format == 'tree':
+            root_tree = self._store_trees(checkpoint)
+            with open(tmp_tree_file_path, 'w') as f:
+                f.write(json.dumps(root_tree))
+        else:
+            with open(tmp_tree_file_path, 'wb') as f:
+                checkpoint.dump(f)
+        os.replace(tmp_tree_file_path, tree_file_path)
+        self.checkpoint_index.add(tree_file_name)
 
     def retrieve_checkpoint_metas(self):
-        if not os.path.isdir(self.tree_path):
-            return []
-        return [CheckpointMeta.from_string(checkpoint_file[:-len(self.TREE_FILE_EXT)])
-                for checkpoint_file in os.listdir(self.tree_path)
-                if checkpoint_file[-len(self.TREE_FILE_EXT):] == self.TREE_FILE_EXT]
+        return self.checkpoint_index.metas()
+
+    def find_checkpoint_metas_by_checksum(self, checksum):
+        return self.checkpoint_index.find_by_checksum(checksum)
+
+    def find_checkpoint_metas_by_name(self, name):
+        return self.checkpoint_index.find_by_name(name)
+
+    def find_checkpoint_metas_by_time(self, start=None, end=None):
+        return self.checkpoint_index.find_by_time(start, end)
 
     def retrieve_checkpoint(self, checkpoint_meta):
-        if not os.path.isdir(self.tree_path):
+        tree_file_name = self.checkpoint_index.tree_file_name(checkpoint_meta)
+        if tree_file_name is None:
             return
-        checkpoint_files = [c for c in os.listdir(self.tree_path)
-                            if c[-len(self.TREE_FILE_EXT):] == self.TREE_FILE_EXT]
+        tree_file_path = os.path.join(self.tree_path, tree_file_name)
+        if tree_file_name.endswith(self.BINARY_TREE_FILE_EXT):
+            with open(tree_file_path, 'rb') as f:
+                return Checkpoint.load(f)
+        if tree_file_name.endswith(self.ROOT_TREE_FILE_EXT):
+            with open(tree_file_path, 'r') as f:
+                return self._retrieve_trees(json.load(f))
+        with open(tree_file_path, 'r') as f:
+            return Checkpoint.from_json(f.read())
 
-        checkpoint_file = checkpoint_meta.to_string() + self.TREE_FILE_EXT
-        if checkpoint_file in checkpoint_files:
-            with open(os.path.join(self.tree_path, checkpoint_file), 'r') as f:
-                return Checkpoint.from_json(f.read())
+    def _store_trees(self, checkpoint):
+        """ Stores the tree objects of the checkpoint that are not stored yet and returns its root record. """
+        if not isinstance(checkpoint.root, DirectoryNode):
+            raise ValueError('Only checkpoints of directories can be stored as tree objects.')
+        root_tree_key = trees.store_trees(checkpoint.root, self._has_tree_object, self._store_tree_object,
+                                          checkpoint.hash_algorithm)
+        # the tree objects are durable before the root record referencing them is written
+        self.flush()
+        return dict(version=self.ROOT_TREE_VERSION, tree=root_tree_key, checksum=checkpoint.root.checksum,
+                    permissions=checkpoint.root.permissions, time=checkpoint.time.isoformat(), name=checkpoint.name,
+                    hash=checkpoint.hash_algorithm.name, ignore=checkpoint.ignore_patterns)
+
+    def _retrieve_trees(self, root_tree):
+        if root_tree['version'] > self.ROOT_TREE_VERSION:
+            raise IOError('Unsupported root tree version: ' + str(root_tree['version']))
+        root = StoredDirectoryNode('', root_tree['checksum'], root_tree['permissions'], root_tree['tree'],
+                                   self._tree_children)
+        return Checkpoint(root, time=datetime_from_iso_format(root_tree['time']), name=root_tree['name'],
+                          hash_algorithm=get_hash_algorithm(root_tree.get('hash', DEFAULT_HASH_ALGORITHM.name)),
+                          ignore_patterns=root_tree.get('ignore'))
+
+    def _has_tree_object(self, tree_key):
+        return (tree_key in self.packs
+                or self._find_object_file(self.tree_object_path, tree_key, compressed=True) is not None)
+
+    def _store_tree_object(self, tree_key, data):
+        codec = self._compression_codec(data[:Codec.BLOCKSIZE])
+        if codec is not None:
+            data = codec.compress(data, self.compression_level)
+        if self.packing and len(data) <= self.PACK_MAX_OBJECT_SIZE:
+            self.packs.add(tree_key, data, codec)
+            return
+        tree_object_file_path = self._object_file_path(self.tree_object_path, tree_key)
+        self._write_object(tree_object_file_path if codec is None else tree_object_file_path + codec.file_ext, data)
+
+    def _read_tree_object(self, tree_key):
+        tree_object_file_path = self._find_object_file(self.tree_object_path, tree_key, compressed=True)
+        if tree_object_file_path is None:
+            if tree_key in self.packs:
+                return self.packs.read(tree_key)
+            raise FileNotFoundError('Tree object {} is missing.'.format(tree_key))
+
+        with open(tree_object_file_path, 'rb') as f:
+            data = f.read()
+        codec = self._object_codec(tree_object_file_path)
+        return data if codec is None else codec.decompress(data)
+
+    def _tree_children(self, tree_key):
+        """ Returns the children of the tree object as nodes. Subtrees that appear in several checkpoints share the
+        same nodes while they are cached.
+        """
+        children = self._tree_cache.get(tree_key)
+        if children is not None:
+            self._tree_cache.move_to_end(tree_key)
+            return children
+
+        children = dict()
+        for node_type, permissions, name, checksum, child_tree_key in trees.decode_tree(
+                self._read_tree_object(tree_key)):
+            if node_type == trees.TYPE_DIRECTORY:
+                child = StoredDirectoryNode(name, checksum, permissions, child_tree_key, self._tree_children)
+            elif node_type == trees.TYPE_SYMLINK:
+                child = SymlinkNode(name, checksum, permissions)
+            else:
+                child = FileNode(name, checksum, permissions)
+            children[child.name] = child
+
+        self._tree_cache[tree_key] = children
+        if len(self._tree_cache) > self.TREE_CACHE_SIZE:
+            self._tree_cache.popitem(last=False)
+        return children
+
+    def _hash_cache_file_path(self, src_dir_path):
+        message = xxhash.xxh64()
+        message.update(os.fsencode(os.path.abspath(src_dir_path)))
+        return os.path.join(self.cache_path, message.hexdigest() + self.CACHE_FILE_EXT)
+
+    def store_hash_cache(self, src_dir_path, hash_cache):
+        """ Stores the hash cache that belongs to the source directory, replacing the previous one
+
+        :param src_dir_path: the directory the hash cache was used for when building the last checkpoint
+        :param hash_cache: the HashCache to store
+        """
+        cache_file_path = self._hash_cache_file_path(src_dir_path)
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path)
+
+        tmp_cache_file_path = cache_file_path + self.TMP_FILE_EXT
+        with open(tmp_cache_file_path, 'w') as f:
+            f.write(hash_cache.to_json())
+        os.replace(tmp_cache_file_path, cache_file_path)
+
+    def retrieve_hash_cache(self, src_dir_path):
+        """ Retrieves the hash cache that was stored with the last checkpoint of the source directory
+
+        An empty HashCache is returned if no cache exists or it cannot be read.
+        """
+        cache_file_path = self._hash_cache_file_path(src_dir_path)
+        try:
+            with open(cache_file_path, 'r') as f:
+                return HashCache.from_json(f.read())
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            return HashCache()
 
 
 class NoUniqueMatchError(LookupError):
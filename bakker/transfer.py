@@ -0,0 +1,173 @@
+import errno
+import os
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# how regular files are copied, from the cheapest to the most expensive method
+REFLINK = 'reflink'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+BUFFERED = 'buffered'
+COPY_METHODS = [REFLINK, COPY_FILE_RANGE, SENDFILE, BUFFERED]
+HARDLINK = 'hardlink'
+# objects that are not copied as a whole
+PACKED = 'packed'
+CHUNKED = 'chunked'
+COMPRESSED = 'compressed'
+SYMLINK = 'symlink'
+
+# _IOW(0x94, 9, int) from linux/fs.h, shares the extents of the source file on Btrfs, XFS and other file systems
+FICLONE = 0x40049409
+# errors that mean a method does not work for the two files, the next method is tried
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY, errno.ENOSYS, errno.EINVAL,
+                      errno.EBADF}
+LINK_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def copy_times(src_stat, dst_file_path):
+    """ Sets the access and modification times of the file to the ones of the stat result, like shutil.copystat. """
+    os.utime(dst_file_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+
+class TransferStats:
+    """ Counts the files and bytes transferred with each method. Safe to use from several threads. """
+
+    def __init__(self):
+        self.files = dict()
+        self.bytes = dict()
+        self._lock = threading.Lock()
+
+    def add(self, method, size):
+        with self._lock:
+            self.files[method] = self.files.get(method, 0) + 1
+            self.bytes[method] = self.bytes.get(method, 0) + size
+
+    def summary(self):
+        return ', '.join('{}: {} file(s), {} bytes'.format(method, self.files[method], self.bytes[method])
+                         for method in sorted(self.files))
+
+
+class FileCopier:
+    """ Copies regular files without moving their data through user space where the file systems allow it.
+
+    The methods are tried in order: a reflink (FICLONE) shares the data of the source, copy_file_range and sendfile
+    copy it in the kernel, and a buffered copy always works. A method that is not supported for a pair of devices is
+    not tried again for them.
+
+    :param methods: the methods tried, a subset of COPY_METHODS, all available methods if None. The buffered copy is
+        always tried last.
+    """
+    BLOCKSIZE = 64 * 1024 * 1024
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, methods=None):
+        methods = COPY_METHODS if methods is None else methods
+        self.methods = [method for method in COPY_METHODS if method in methods and FileCopier.is_available(method)]
+        if BUFFERED not in self.methods:
+            self.methods.append(BUFFERED)
+        # (method, source device, destination device) tuples
+        self._unsupported = set()
+
+    @staticmethod
+    def is_available(method):
+        if method == REFLINK:
+            return fcntl is not None and sys.platform.startswith('linux')
+        if method == COPY_FILE_RANGE:
+            return hasattr(os, 'copy_file_range')
+        if method == SENDFILE:
+            return hasattr(os, 'sendfile') and sys.platform.startswith('linux')
+        return method == BUFFERED
+
+    def copy(self, src_file_path, dst_file_path, permissions):
+        """ Copies the content of a regular file to a new file with the given permissions and the access and
+        modification times of the source.
+
+        :returns: (method, size) tuple, the method the data was copied with and the number of bytes copied
+        """
+        src_fd = os.open(src_file_path, os.O_RDONLY)
+        try:
+            # before the source is read, which may update its access time
+            src_stat = os.fstat(src_fd)
+            dst_fd = os.open(dst_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                result = self._copy(src_fd, dst_fd)
+                os.fchmod(dst_fd, permissions)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+        copy_times(src_stat, dst_file_path)
+        return result
+
+    def _copy(self, src_fd, dst_fd):
+        devices = (os.fstat(src_fd).st_dev, os.fstat(dst_fd).st_dev)
+        # every method continues at the file positions the previous one stopped at
+        copied = 0
+        for method in self.methods:
+            if (method,) + devices in self._unsupported:
+                continue
+            try:
+                copied += getattr(self, '_' + method)(src_fd, dst_fd)
+            except OSError as e:
+                if method == BUFFERED or e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self._unsupported.add((method,) + devices)
+                continue
+            return method, copied
+
+    @staticmethod
+    def _reflink(src_fd, dst_fd):
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return os.fstat(dst_fd).st_size
+
+    def _copy_file_range(self, src_fd, dst_fd):
+        copied = 0
+        while True:
+            length = os.copy_file_range(src_fd, dst_fd, self.BLOCKSIZE)
+            if length == 0:
+                break
+            copied += length
+        if copied == 0 and os.lseek(src_fd, 0, os.SEEK_CUR) < os.fstat(src_fd).st_size:
+            # some file systems report success without copying anything
+            raise OSError(errno.ENOSYS, 'copy_file_range copied nothing')
+        return copied
+
+    def _sendfile(self, src_fd, dst_fd):
+        copied = 0
+        while True:
+            length = os.sendfile(dst_fd, src_fd, None, self.BLOCKSIZE)
+            if length == 0:
+                return copied
+            copied += length
+
+    def _buffered(self, src_fd, dst_fd):
+        buffer = bytearray(self.BUFFER_SIZE)
+        view = memoryview(buffer)
+        copied = 0
+        while True:
+            length = os.readv(src_fd, [buffer])
+            if length == 0:
+                return copied
+            written = 0
+            while written < length:
+                written += os.write(dst_fd, view[written:length])
+            copied += length
+
+    @staticmethod
+    def link(src_file_path, dst_file_path):
+        """ Hardlinks the destination to the source.
+
+        :returns: False if the file system does not allow the link, e.g. across devices
+        """
+        try:
+            os.link(src_file_path, dst_file_path)
+        except OSError as e:
+            if e.errno not in LINK_UNSUPPORTED_ERRNOS:
+                raise
+            return False
+        return True
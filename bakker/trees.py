@@ -0,0 +1,135 @@
+""" Content-addressed tree objects.
+
+A tree object encodes a single directory, a header (magic, format version, digest size) followed by one entry per
+child, sorted by encoded name:
+
+    type        byte (directory, file or symlink)
+    permissions varint
+    name        varint length + file system encoded name
+    checksum    raw checksum bytes
+    tree key    raw key of the tree object of the child, directories only, of the same size as the checksums
+
+The key of a tree object is the checksum of its encoding, computed with the hash algorithm of the checkpoint. Unlike
+the checksum of a directory, it covers names, types and permissions, so equal keys mean equal subtrees and a directory
+that did not change is stored only once.
+"""
+
+import struct
+
+from .hashing import DEFAULT_HASH_ALGORITHM
+from .serialization import TYPE_DIRECTORY, TYPE_FILE, TYPE_SYMLINK, _decode_varint, decode_name, encode_name, \
+    encode_node
+
+
+MAGIC = b'BKTR'
+VERSION = 1
+HEADER = struct.Struct('>4sBB')
+
+
+def tree_key(data, hash_algorithm=None):
+    return (DEFAULT_HASH_ALGORITHM if hash_algorithm is None else hash_algorithm).hexdigest(data)
+
+
+def tree_object(digest_size, entries):
+    """ Returns the tree object consisting of the encoded entries, which are sorted by encoded name. """
+    return HEADER.pack(MAGIC, VERSION, digest_size) + b''.join(entries)
+
+
+def encode_tree(directory):
+    """ Returns the tree object of the directory. The tree keys of its subdirectories have to be known. """
+    from .checkpoint import DirectoryNode, SymlinkNode
+
+    entries = []
+    for child in sorted(directory.children.values(), key=lambda child: encode_name(child.name)):
+        if isinstance(child, DirectoryNode):
+            entries.append(encode_node(child, TYPE_DIRECTORY) + bytes.fromhex(child.tree_key))
+        else:
+            entries.append(encode_node(child, TYPE_SYMLINK if isinstance(child, SymlinkNode) else TYPE_FILE))
+    return tree_object(len(directory.digest), entries)
+
+
+def decode_tree(data):
+    """ Returns the entries of the tree object as (type, permissions, name, checksum, tree key) tuples, the tree key
+    being None for files and symlinks.
+    """
+    magic, version, digest_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a tree object.')
+    if version != VERSION:
+        raise ValueError('Unsupported tree object version: ' + str(version))
+
+    entries = []
+    position = HEADER.size
+    while position < len(data):
+        node_type = data[position]
+        permissions, position = _decode_varint(data, position + 1)
+        name_length, position = _decode_varint(data, position)
+        name = decode_name(data[position:position + name_length])
+        position += name_length
+        checksum = data[position:position + digest_size].hex()
+        position += digest_size
+        child_tree_key = None
+        if node_type == TYPE_DIRECTORY:
+            child_tree_key = data[position:position + digest_size].hex()
+            position += digest_size
+        if position > len(data):
+            raise ValueError('Tree object is truncated.')
+        entries.append((node_type, permissions, name, checksum, child_tree_key))
+    return entries
+
+
+def _compute_tree_keys(root, is_known, hash_algorithm):
+    """ Computes the tree keys of the root directory and the directories below it in post-order and yields each
+    directory with its tree object. Directories for which is_known returns True are neither visited nor yielded.
+    """
+    from .checkpoint import DirectoryNode
+
+    if is_known(root):
+        return
+
+    def unknown_subdirectories(directory):
+        return [child for child in directory.children.values()
+                if isinstance(child, DirectoryNode) and not is_known(child)]
+
+    # (directory node, subdirectories still to be visited)
+    stack = [(root, unknown_subdirectories(root))]
+    while stack:
+        directory, subdirectories = stack[-1]
+        if subdirectories:
+            subdirectory = subdirectories.pop()
+            stack.append((subdirectory, unknown_subdirectories(subdirectory)))
+            continue
+
+        stack.pop()
+        data = encode_tree(directory)
+        directory.tree_key = tree_key(data, hash_algorithm)
+        yield directory, data
+
+
+def update_tree_keys(root, hash_algorithm=None):
+    """ Computes the tree keys of the root directory and all directories below it that are not known yet, e.g. of a
+    checkpoint that was just built, and returns the tree key of the root directory.
+
+    :param hash_algorithm: the HashAlgorithm of the checkpoint, DEFAULT_HASH_ALGORITHM if None
+    """
+    for _ in _compute_tree_keys(root, lambda directory: directory.tree_key is not None, hash_algorithm):
+        pass
+    return root.tree_key
+
+
+def store_trees(root, has_tree, store_tree, hash_algorithm=None):
+    """ Stores the tree objects of the root directory and all directories below it that are not stored yet.
+
+    :param has_tree: function returning whether the tree object with the given key is stored
+    :param store_tree: function storing the tree object data under the given key
+    :param hash_algorithm: the HashAlgorithm of the checkpoint, DEFAULT_HASH_ALGORITHM if None
+    :returns: the tree key of the root directory
+    """
+    # the subtree of a directory whose tree object is stored is complete, it is not visited again
+    def is_stored(directory):
+        return directory.tree_key is not None and has_tree(directory.tree_key)
+
+    for directory, data in _compute_tree_keys(root, is_stored, hash_algorithm):
+        if not has_tree(directory.tree_key):
+            store_tree(directory.tree_key, data)
+    return root.tree_key
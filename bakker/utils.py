@@ -1,4 +1,5 @@
 from datetime import datetime
+import io
 
 
 def datetime_from_iso_format(string):
@@ -9,3 +10,36 @@ def datetime_from_iso_format(string):
         return datetime.strptime(string, TIME_ISO_FORMAT)
     elif 19 < len(string) <= 26:
         return datetime.strptime(string, TIME_ISO_FORMAT_MILLISECONDS)
+
+
+class BlockReader(io.RawIOBase):
+    """ A readable binary stream of the blocks of bytes an iterator yields, e.g. data that is decompressed or
+    assembled while it is read. Wrap it in io.BufferedReader for read() and readline().
+
+    :param blocks: iterable of bytes, a generator is closed when the reader is closed
+    """
+
+    def __init__(self, blocks):
+        self._blocks = iter(blocks)
+        self._block = b''
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._position >= len(self._block):
+            self._block = next(self._blocks, None)
+            self._position = 0
+            if self._block is None:
+                self._block = b''
+                return 0
+        size = min(len(buffer), len(self._block) - self._position)
+        buffer[:size] = self._block[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        if hasattr(self._blocks, 'close'):
+            self._blocks.close()
+        super().close()
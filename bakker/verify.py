@@ -0,0 +1,242 @@
+""" Verification of the files of a storage against their checksums.
+
+A verification reads every file that a checkpoint of the storage references, in the order of the checksums, hashes
+it and compares the hash with its checksum. Files are verified concurrently in a thread pool, results are collected
+in the order the files were submitted, so the verification has verified every file up to the checksum collected
+last. That position and the problems found so far are saved to a state file regularly and when the verification is
+interrupted, a verification with the same state file resumes after the position. Files of checkpoints created in
+the meantime whose checksums sort before the position are verified by the next complete verification.
+
+The rate files are read at can be limited, so a verification of a large storage can run beside its regular use.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import time
+
+from .checkpoint import FileNode, SymlinkNode
+
+OK = 'ok'
+CORRUPT = 'corrupt'
+MISSING = 'missing'
+
+
+class Throttle:
+    """ Limits the rate of bytes read by several threads, by delaying every read until the bytes read before it
+    would have been read at the rate.
+
+    :param rate: bytes per second
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def consume(self, size):
+        """ Waits until size more bytes may be read. """
+        with self._lock:
+            now = time.monotonic()
+            start_time = max(self._next_time, now)
+            self._next_time = start_time + size / self.rate
+        delay = start_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class VerifyReport:
+    """ What a verification found, including the results of the runs it resumed.
+
+    :param position: the checksum of the file verified last, None if no file was verified yet
+    """
+
+    def __init__(self, position=None, files=0, size=0, corrupt=None, missing=None, checkpoint_errors=None):
+        self.position = position
+        self.files = files
+        # bytes read from the storage
+        self.size = size
+        # checksums of the files that do not match their checksums or could not be read
+        self.corrupt = [] if corrupt is None else corrupt
+        # checksums of the files that are missing, completely or partially
+        self.missing = [] if missing is None else missing
+        # [checkpoint, error] of the checkpoints that could not be read
+        self.checkpoint_errors = [] if checkpoint_errors is None else checkpoint_errors
+        # whether every file was verified
+        self.complete = False
+
+    def to_dict(self):
+        return dict(position=self.position, files=self.files, size=self.size, corrupt=self.corrupt,
+                    missing=self.missing, checkpoint_errors=self.checkpoint_errors)
+
+    @staticmethod
+    def from_dict(d):
+        return VerifyReport(d['position'], d['files'], d['size'], d['corrupt'], d['missing'], d['checkpoint_errors'])
+
+
+class Verifier:
+    """ Verifies the files referenced by the checkpoints of a storage.
+
+    :param storage: the Storage, files are read with Storage.verify_file
+    :param workers: number of files verified concurrently, files are verified one after another if None
+    :param rate: bytes per second files are read at, unlimited if None
+    :param state_file_path: the file the progress is saved to, a verification can not be resumed if None
+    :param quarantine: remove corrupt files from the storage (see Storage.quarantine_file), so the next checkpoint
+        that contains them stores them again
+    :param progress: function called with the VerifyReport after every verified file
+    """
+    # seconds between saves of the state
+    SAVE_INTERVAL = 10
+    STATE_VERSION = 1
+    TMP_FILE_EXT = '.tmp'
+
+    def __init__(self, storage, workers=None, rate=None, state_file_path=None, quarantine=False, progress=None):
+        self.storage = storage
+        self.workers = workers
+        self.throttle = None if rate is None else Throttle(rate)
+        self.state_file_path = state_file_path
+        self.quarantine = quarantine
+        self.progress = progress
+        self._last_save = 0
+
+    def _checkpoints(self, report=None):
+        """ Yields the checkpoints of the storage, the ones that can not be read are added to the report. """
+        for checkpoint_meta in self.storage.retrieve_checkpoint_metas():
+            try:
+                yield checkpoint_meta, self.storage.retrieve_checkpoint(checkpoint_meta)
+            except Exception as e:
+                if report is not None:
+                    report.checkpoint_errors.append([checkpoint_meta.to_string(), str(e)])
+
+    def referenced_files(self, report=None):
+        """ Returns the sorted checksums of all files and symlinks the checkpoints reference, and a dict of the hash
+        algorithms of the checksums of checkpoints with another hash algorithm than the storage.
+        """
+        digests = set()
+        hash_algorithms = dict()
+        for checkpoint_meta, checkpoint in self._checkpoints(report):
+            try:
+                for node, _ in checkpoint.iter():
+                    if isinstance(node, (FileNode, SymlinkNode)):
+                        digests.add(node.digest)
+                        if checkpoint.hash_algorithm is not self.storage.hash_algorithm:
+                            hash_algorithms[node.checksum] = checkpoint.hash_algorithm
+            except Exception as e:
+                # e.g. a missing tree object
+                if report is not None:
+                    report.checkpoint_errors.append([checkpoint_meta.to_string(), str(e)])
+        return [digest.hex() for digest in sorted(digests)], hash_algorithms
+
+    def find_references(self, checksums):
+        """ Returns a dict of the given checksums to the [checkpoint, path] lists that reference them. """
+        checksums = set(checksums)
+        references = dict()
+        if not checksums:
+            return references
+        for checkpoint_meta, checkpoint in self._checkpoints():
+            try:
+                for node, path in checkpoint.iter():
+                    if isinstance(node, (FileNode, SymlinkNode)) and node.checksum in checksums:
+                        references.setdefault(node.checksum, []).append([checkpoint_meta.to_string(), path])
+            except Exception:
+                # reported by verify()
+                pass
+        return references
+
+    def _load_state(self):
+        if self.state_file_path is None or not os.path.isfile(self.state_file_path):
+            return VerifyReport()
+        with open(self.state_file_path, 'r') as f:
+            state = json.load(f)
+        if state['version'] > self.STATE_VERSION:
+            raise IOError('Unsupported verification state: ' + self.state_file_path)
+        return VerifyReport.from_dict(state)
+
+    def _save_state(self, report):
+        if self.state_file_path is None:
+            return
+        state = report.to_dict()
+        state['version'] = self.STATE_VERSION
+        tmp_state_file_path = self.state_file_path + self.TMP_FILE_EXT
+        with open(tmp_state_file_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_state_file_path, self.state_file_path)
+        self._last_save = time.monotonic()
+
+    def reset(self):
+        """ Discards the progress of an interrupted verification. """
+        if self.state_file_path is not None and os.path.exists(self.state_file_path):
+            os.remove(self.state_file_path)
+
+    def verify(self):
+        """ Verifies the files after the position of the saved state, or all files if there is none. The state is
+        removed once all files are verified.
+
+        :returns: the VerifyReport, including the results of the resumed verification
+        """
+        report = self._load_state()
+        # checkpoints are read again by every run, their errors are not resumed
+        report.checkpoint_errors = []
+        checksums, hash_algorithms = self.referenced_files(report)
+        executor = None if self.workers is None else ThreadPoolExecutor(self.workers)
+        max_pending = 0 if self.workers is None else 4 * self.workers
+        pending = deque()
+        self._last_save = time.monotonic()
+        try:
+            for checksum in checksums:
+                if report.position is not None and checksum <= report.position:
+                    continue
+                hash_algorithm = hash_algorithms.get(checksum)
+                if executor is None:
+                    self._collect(report, checksum, self._verify_file(checksum, hash_algorithm))
+                    continue
+                while len(pending) >= max_pending:
+                    self._collect_pending(report, pending)
+                pending.append((checksum, executor.submit(self._verify_file, checksum, hash_algorithm)))
+            while pending:
+                self._collect_pending(report, pending)
+            report.complete = True
+        finally:
+            for _, future in pending:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown()
+            if report.complete:
+                self.reset()
+            else:
+                self._save_state(report)
+        return report
+
+    def _verify_file(self, checksum, hash_algorithm):
+        """ Returns (OK, size), (CORRUPT, 0) or (MISSING, 0). """
+        try:
+            size = self.storage.verify_file(checksum, hash_algorithm, self.throttle)
+        except FileNotFoundError:
+            return MISSING, 0
+        except Exception:
+            # e.g. data that can not be decompressed
+            return CORRUPT, 0
+        return (CORRUPT, 0) if size is None else (OK, size)
+
+    def _collect_pending(self, report, pending):
+        checksum, future = pending[0]
+        self._collect(report, checksum, future.result())
+        pending.popleft()
+
+    def _collect(self, report, checksum, result):
+        status, size = result
+        if status == CORRUPT:
+            report.corrupt.append(checksum)
+            if self.quarantine:
+                self.storage.quarantine_file(checksum)
+        elif status == MISSING:
+            report.missing.append(checksum)
+        report.files += 1
+        report.size += size
+        report.position = checksum
+        if self.progress is not None:
+            self.progress(report)
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self._save_state(report)
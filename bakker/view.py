@@ -0,0 +1,117 @@
+""" Read-only access to the paths of a stored checkpoint, without restoring it. """
+
+from collections import namedtuple
+import errno
+import os
+import stat
+
+from .checkpoint import DirectoryNode, SymlinkNode
+
+# the mode (type and permissions) and the checksum of a node, checkpoints do not record sizes or times of files
+CheckpointStat = namedtuple('CheckpointStat', ['st_mode', 'checksum'])
+
+
+class PathNotFoundError(FileNotFoundError):
+    """ Raised if a path does not exist in the checkpoint, unlike a FileNotFoundError of a missing stored object. """
+
+
+class CheckpointView:
+    """ Lists, stats and reads the paths of a checkpoint like a read-only file system. File contents are streamed from
+    the storage, see Storage.open_file.
+
+    Paths are relative to the root of the checkpoint, with / or os.sep as separator. Like on a file system, symlinks
+    are followed unless they are the last name of the path and follow_symlinks is False. Symlinks are resolved within
+    the checkpoint, absolute targets and targets outside of it do not exist.
+
+    :param storage: the Storage the checkpoint is stored in
+    :param checkpoint: the Checkpoint
+    """
+    MAX_SYMLINKS = 40
+
+    def __init__(self, storage, checkpoint):
+        self.storage = storage
+        self.checkpoint = checkpoint
+
+    def _node(self, path, follow_symlinks=True):
+        """ Returns the node at the path.
+
+        :raises PathNotFoundError: If the path does not exist.
+        :raises NotADirectoryError: If a name of the path other than the last one is not a directory.
+        """
+        names = self._names(path)
+        names.reverse()
+        # the directories from the root to the current one
+        parents = []
+        node = self.checkpoint.root
+        symlinks = 0
+        while names:
+            name = names.pop()
+            if name == '..':
+                if not parents:
+                    raise PathNotFoundError(path)
+                node = parents.pop()
+                continue
+            if not isinstance(node, DirectoryNode):
+                raise NotADirectoryError(path)
+            child = node.get_child(name)
+            if child is None:
+                raise PathNotFoundError(path)
+            if isinstance(child, SymlinkNode) and (names or follow_symlinks):
+                symlinks += 1
+                if symlinks > self.MAX_SYMLINKS:
+                    raise OSError(errno.ELOOP, 'Too many levels of symbolic links', path)
+                target = self._read_link(child)
+                if os.path.isabs(target):
+                    raise PathNotFoundError(path)
+                names.extend(reversed(self._names(target)))
+                continue
+            parents.append(node)
+            node = child
+        return node
+
+    @staticmethod
+    def _names(path):
+        return [name for name in path.replace(os.sep, '/').split('/') if name not in ('', '.')]
+
+    def _read_link(self, node):
+        with self.storage.open_file(node.checksum) as f:
+            return os.fsdecode(f.read())
+
+    def exists(self, path):
+        try:
+            self._node(path)
+            return True
+        except OSError:
+            return False
+
+    def listdir(self, path=''):
+        """ Returns the sorted names of the entries of the directory. """
+        node = self._node(path)
+        if not isinstance(node, DirectoryNode):
+            raise NotADirectoryError(path)
+        return sorted(node.children.keys())
+
+    def stat(self, path, follow_symlinks=True):
+        """ Returns the CheckpointStat of the path. """
+        node = self._node(path, follow_symlinks)
+        if isinstance(node, DirectoryNode):
+            file_type = stat.S_IFDIR
+        elif isinstance(node, SymlinkNode):
+            file_type = stat.S_IFLNK
+        else:
+            file_type = stat.S_IFREG
+        return CheckpointStat(file_type | node.permissions, node.checksum)
+
+    def readlink(self, path):
+        """ Returns the target of the symlink. """
+        node = self._node(path, follow_symlinks=False)
+        if not isinstance(node, SymlinkNode):
+            raise OSError(errno.EINVAL, 'Not a symlink', path)
+        return self._read_link(node)
+
+    def open(self, path):
+        """ Returns a binary file object reading the content of the file from the storage. """
+        node = self._node(path)
+        if isinstance(node, DirectoryNode):
+            raise IsADirectoryError(path)
+        return self.storage.open_file(node.checksum)
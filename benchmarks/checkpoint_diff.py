@@ -0,0 +1,45 @@
+"""
+Measures how long diffing two stored binary checkpoints takes that differ in a single file, for a synthetic
+checkpoint.
+
+Usage: python checkpoint_diff.py <number_of_directories> <files_per_directory>
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.checkpoint import Checkpoint, DirectoryNode, FileNode
+from bakker.diff import diff
+
+
+def synthetic_checkpoint(directory_count, file_count, modified_file_checksum=None):
+    directories = dict()
+    for d in range(directory_count):
+        files = {'file_{}'.format(f): FileNode('file_{}'.format(f), '{:016x}'.format(d * file_count + f), 0o644)
+                 for f in range(file_count)}
+        directories['dir_{}'.format(d)] = DirectoryNode('dir_{}'.format(d), '{:016x}'.format(d), 0o755, files)
+    if modified_file_checksum is not None:
+        directories['dir_0'].children['file_0'].checksum = modified_file_checksum
+    return Checkpoint(DirectoryNode('', '0' * 16, 0o755, directories))
+
+
+directory_count = int(sys.argv[1])
+file_count = int(sys.argv[2])
+
+with tempfile.TemporaryDirectory() as tmp_path:
+    checkpoint_file_paths = []
+    for i, modified_file_checksum in enumerate([None, 'f' * 16]):
+        checkpoint_file_paths.append(os.path.join(tmp_path, '{}.ckpt'.format(i)))
+        with open(checkpoint_file_paths[-1], 'wb') as f:
+            synthetic_checkpoint(directory_count, file_count, modified_file_checksum).dump(f)
+
+    start = time.time()
+    checkpoints = []
+    for checkpoint_file_path in checkpoint_file_paths:
+        with open(checkpoint_file_path, 'rb') as f:
+            checkpoints.append(Checkpoint.load(f))
+    changes = list(diff(*checkpoints))
+    print('{} entries, {} change(s), open and diff: {:.2f} ms'.format(
+        directory_count * (file_count + 1) + 1, len(changes), (time.time() - start) * 1000))
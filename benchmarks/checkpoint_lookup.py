@@ -0,0 +1,48 @@
+"""
+Measures how long opening a stored binary checkpoint and looking up a single path takes, compared to decoding the
+complete checkpoint, for a synthetic checkpoint.
+
+Usage: python checkpoint_lookup.py <number_of_directories> <files_per_directory>
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.checkpoint import Checkpoint, DirectoryNode, FileNode
+
+
+def synthetic_checkpoint(directory_count, file_count):
+    directories = dict()
+    for d in range(directory_count):
+        files = {'file_{}'.format(f): FileNode('file_{}'.format(f), '{:016x}'.format(d * file_count + f), 0o644)
+                 for f in range(file_count)}
+        directories['dir_{}'.format(d)] = DirectoryNode('dir_{}'.format(d), '{:016x}'.format(d), 0o755, files)
+    return Checkpoint(DirectoryNode('', '0' * 16, 0o755, directories))
+
+
+directory_count = int(sys.argv[1])
+file_count = int(sys.argv[2])
+path = os.path.join('dir_{}'.format(directory_count // 2), 'file_{}'.format(file_count // 2))
+
+checkpoint = synthetic_checkpoint(directory_count, file_count)
+with tempfile.TemporaryDirectory() as tmp_path:
+    checkpoint_file_path = os.path.join(tmp_path, 'checkpoint.ckpt')
+    start = time.time()
+    with open(checkpoint_file_path, 'wb') as f:
+        checkpoint.dump(f)
+    print('{} entries, {:.1f} MB, written in {:.2f} s'.format(
+        directory_count * (file_count + 1) + 1, os.path.getsize(checkpoint_file_path) / 10**6, time.time() - start))
+    del checkpoint
+
+    start = time.time()
+    with open(checkpoint_file_path, 'rb') as f:
+        node = Checkpoint.load(f).lookup(path)
+    assert node is not None
+    print('open and look up one path: {:.2f} ms'.format((time.time() - start) * 1000))
+
+    start = time.time()
+    with open(checkpoint_file_path, 'rb') as f:
+        entry_count = sum(1 for _ in Checkpoint.load(f).iter())
+    print('open and decode all {} entries: {:.2f} s'.format(entry_count, time.time() - start))
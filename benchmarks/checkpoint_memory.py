@@ -0,0 +1,76 @@
+"""
+Measures the memory a checkpoint takes per node, when it is built from a directory and when it is loaded from a
+binary checkpoint file and all its directories are decoded. The file names repeat in every directory, like e.g.
+__init__.py or .gitignore do in real trees. Also compares the peak memory of building a checkpoint and writing it
+afterwards with writing it while it is built.
+
+Usage: python checkpoint_memory.py <number_of_directories> <files_per_directory>
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from bakker.checkpoint import Checkpoint
+
+
+def measure(description, function):
+    gc.collect()
+    tracemalloc.start()
+    checkpoint = function()
+    node_count = sum(1 for _ in checkpoint.iter())
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('{}: {} nodes, {:.1f} MiB, {:.0f} bytes per node'.format(
+        description, node_count, size / 1024 / 1024, size / node_count))
+    return checkpoint
+
+
+def measure_peak(description, function):
+    gc.collect()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{}: peak {:.1f} MiB'.format(description, peak / 1024 / 1024))
+
+
+def build_and_dump(src_path, checkpoint_file_path):
+    with open(checkpoint_file_path, 'wb') as f:
+        Checkpoint.build_checkpoint(src_path).dump(f)
+
+
+def write_streaming(src_path, checkpoint_file_path):
+    with open(checkpoint_file_path, 'wb') as f:
+        Checkpoint.write_checkpoint(src_path, f)
+
+
+def load(checkpoint_file_path):
+    with open(checkpoint_file_path, 'rb') as f:
+        return Checkpoint.load(f)
+
+
+directory_count = int(sys.argv[1])
+file_count = int(sys.argv[2])
+
+with tempfile.TemporaryDirectory() as tmp_path:
+    src_path = os.path.join(tmp_path, 'src')
+    for d in range(directory_count):
+        dir_path = os.path.join(src_path, 'dir_{}'.format(d))
+        os.makedirs(dir_path)
+        for f in range(file_count):
+            with open(os.path.join(dir_path, 'file_{}'.format(f)), 'w') as file:
+                file.write('{}/{}'.format(d, f))
+
+    checkpoint = measure('build', lambda: Checkpoint.build_checkpoint(src_path))
+    checkpoint_file_path = os.path.join(tmp_path, 'checkpoint')
+    with open(checkpoint_file_path, 'wb') as f:
+        checkpoint.dump(f)
+    del checkpoint
+    measure('load', lambda: load(checkpoint_file_path))
+
+    measure_peak('build, then dump', lambda: build_and_dump(src_path, checkpoint_file_path))
+    measure_peak('write while building', lambda: write_streaming(src_path, checkpoint_file_path))
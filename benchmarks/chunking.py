@@ -0,0 +1,65 @@
+"""
+Measures deduplication ratio and store throughput of chunked and whole file storage on synthetic workloads.
+
+Usage: python chunking.py <size_in_mb> [append|edit]
+
+Each workload stores a random file and then a second version of it. The "append" workload appends 1% of new data,
+the "edit" workload inserts 1% of new data in the middle of the file.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.checkpoint import Checkpoint
+from bakker.storage import FileSystemStorage
+
+
+def directory_size(path):
+    size = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            size += os.lstat(os.path.join(dir_path, file_name)).st_size
+    return size
+
+
+def versions(workload, size):
+    data = os.urandom(size)
+    new_data = os.urandom(size // 100)
+    if workload == 'append':
+        return [data, data + new_data]
+    middle = size // 2
+    return [data, data[:middle] + new_data + data[middle:]]
+
+
+def benchmark(workload, size, chunking):
+    with tempfile.TemporaryDirectory() as tmp_path:
+        src_path = os.path.join(tmp_path, 'src')
+        os.makedirs(src_path)
+        storage = FileSystemStorage(os.path.join(tmp_path, 'store'), chunking=chunking)
+
+        logical_size = 0
+        duration = 0
+        for data in versions(workload, size):
+            with open(os.path.join(src_path, 'file'), 'wb') as f:
+                f.write(data)
+            logical_size += len(data)
+
+            checkpoint = Checkpoint.build_checkpoint(src_path)
+            start = time.time()
+            storage.store(src_path, checkpoint)
+            duration += time.time() - start
+
+        stored_size = directory_size(storage.file_path) + directory_size(storage.chunk_path)
+        print('{} {}: dedup ratio {:.2f}, store throughput {:.1f} MB/s'.format(
+            workload, 'chunked' if chunking else 'whole file', logical_size / stored_size,
+            logical_size / duration / 10**6))
+
+
+size = int(sys.argv[1]) * 1024 * 1024
+workloads = sys.argv[2:] or ['append', 'edit']
+
+for workload in workloads:
+    benchmark(workload, size, False)
+    benchmark(workload, size, True)
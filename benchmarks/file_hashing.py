@@ -0,0 +1,73 @@
+"""
+Compares the strategies for reading files while hashing them: read() of new 64 KiB blocks like before, readinto a
+reused buffer with a fixed and the adaptive block size, and a memory map. With "cold" as the third argument the file
+is dropped from the page cache before every run.
+
+Usage: python file_hashing.py <size_in_mib> <times> [cold]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.hashing import DEFAULT_HASH_ALGORITHM, fadvise
+
+
+def read_checksum(algorithm, path):
+    message = algorithm.new()
+    with open(path, 'rb') as f:
+        file_buffer = f.read(65536)
+        while len(file_buffer) > 0:
+            message.update(file_buffer)
+            file_buffer = f.read(65536)
+    return message.hexdigest()
+
+
+def readinto_checksum(block_size):
+    def checksum(algorithm, path):
+        with open(path, 'rb', buffering=0) as f:
+            return algorithm._readinto_checksum(f, block_size)
+    return checksum
+
+
+def adaptive_checksum(algorithm, path):
+    with open(path, 'rb', buffering=0) as f:
+        return algorithm._readinto_checksum(f, algorithm.block_size(os.fstat(f.fileno())))
+
+
+def mmap_checksum(algorithm, path):
+    with open(path, 'rb', buffering=0) as f:
+        return algorithm._mmap_checksum(f)
+
+
+def benchmark(name, checksum_function, path, times, cold):
+    total = 0
+    for i in range(times):
+        if cold:
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+                fadvise(f.fileno(), 'POSIX_FADV_DONTNEED')
+        start = time.time()
+        checksum_function(DEFAULT_HASH_ALGORITHM, path)
+        total += time.time() - start
+    average = total / times
+    size = os.path.getsize(path)
+    print('{:>16}: {:.4f} s, {:.0f} MiB/s'.format(name, average, size / average / 1024 / 1024))
+
+
+size = int(sys.argv[1]) * 1024 * 1024
+times = int(sys.argv[2])
+cold = len(sys.argv) > 3 and sys.argv[3] == 'cold'
+
+with tempfile.TemporaryDirectory() as tmp_path:
+    path = os.path.join(tmp_path, 'file')
+    with open(path, 'wb') as f:
+        for i in range(0, size, 1024 * 1024):
+            f.write(os.urandom(min(1024 * 1024, size - i)))
+
+    benchmark('read 64 KiB', read_checksum, path, times, cold)
+    benchmark('readinto 64 KiB', readinto_checksum(64 * 1024), path, times, cold)
+    benchmark('readinto 1 MiB', readinto_checksum(1024 * 1024), path, times, cold)
+    benchmark('readinto adaptive', adaptive_checksum, path, times, cold)
+    benchmark('mmap', mmap_checksum, path, times, cold)
@@ -16,3 +16,4 @@ end = time.time()
 print("Checkpoint build duration:" + str(checkpoint_end - start))
 print("Total duration: " + str(end-start))
 
+print("Transferred: " + storage.store_stats.summary())
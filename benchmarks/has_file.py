@@ -0,0 +1,39 @@
+"""
+Measures how long checking the presence of stored files takes with the object index and by looking up every object in
+the storage, like before the index existed.
+
+Usage: python has_file.py <number_of_files> <fan_out>
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.checkpoint import Checkpoint
+from bakker.storage import FileSystemStorage
+
+
+file_count = int(sys.argv[1])
+fan_out = int(sys.argv[2])
+
+with tempfile.TemporaryDirectory() as tmp_path:
+    src_path = os.path.join(tmp_path, 'src')
+    os.mkdir(src_path)
+    for i in range(file_count):
+        with open(os.path.join(src_path, 'file_{}'.format(i)), 'w') as f:
+            f.write(str(i))
+    checkpoint = Checkpoint.build_checkpoint(src_path)
+    store_path = os.path.join(tmp_path, 'store')
+    FileSystemStorage(store_path, fan_out=fan_out).store(src_path, checkpoint)
+    checksums = [node.checksum for node in checkpoint.root.children.values()]
+
+    start = time.time()
+    storage = FileSystemStorage(store_path)
+    present = storage.has_files(checksums)
+    print('{} files, with the object index: {:.2f} ms'.format(len(present), (time.time() - start) * 1000))
+
+    start = time.time()
+    present = [checksum for checksum in checksums
+               if storage._find_object_file(storage.file_path, checksum, compressed=True) is not None]
+    print('{} files, by looking up the objects: {:.2f} ms'.format(len(present), (time.time() - start) * 1000))
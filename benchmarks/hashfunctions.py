@@ -1,29 +1,46 @@
-import xxhash
-import sys
-import time
+"""
+Compares the throughput of the hash algorithms a storage can use, for a given file or for generated files of
+several sizes. Algorithms whose packages are not installed are skipped.
 
+Usage: python hashfunctions.py <times> [<file>]
+"""
 
-def get_digest(hash_function, filename):
-    BLOCKSIZE = 65536
+import os
+import sys
+import tempfile
+import time
 
-    m = hash_function()
-    with open(filename, 'rb') as f:
-        file_buffer = f.read(BLOCKSIZE)
-        while len(file_buffer) > 0:
-            m.update(file_buffer)
-            file_buffer = f.read(BLOCKSIZE)
-        
-    print(m.hexdigest())
+from bakker.hashing import HASH_ALGORITHMS
 
 
-def benchmark(hash_function, filename, times): 
+def benchmark(algorithm, filename, times):
     start = time.time()
     for i in range(times):
-        get_digest(hash_function, filename)
+        algorithm.file_checksum(filename)
     end = time.time()
-    print("Average in {} runs: {}.".format(times, (end-start)/times))
-
-
-benchmark(xxhash.xxh64, sys.argv[1], int(sys.argv[2]))
-
-
+    size = os.path.getsize(filename)
+    average = (end - start) / times
+    print('{:>9} {:>12} bytes: {:.4f} s, {:.0f} MiB/s'.format(
+            algorithm.name, size, average, size / average / 1024 / 1024 if average > 0 else float('inf')))
+
+
+def benchmark_all(filename, times):
+    for algorithm in HASH_ALGORITHMS.values():
+        try:
+            algorithm.new()
+        except ImportError as e:
+            print('{:>9} skipped: {}'.format(algorithm.name, e))
+            continue
+        benchmark(algorithm, filename, times)
+
+
+times = int(sys.argv[1])
+if len(sys.argv) > 2:
+    benchmark_all(sys.argv[2], times)
+else:
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for size in [4 * 1024, 1024 * 1024, 64 * 1024 * 1024]:
+            filename = os.path.join(tmp_path, str(size))
+            with open(filename, 'wb') as f:
+                f.write(os.urandom(size))
+            benchmark_all(filename, times)
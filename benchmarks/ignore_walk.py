@@ -0,0 +1,60 @@
+"""
+Compares the walk of a directory tree whose dependency directories are ignored by a .bakkerignore file with the walk
+of the whole tree, and measures how fast the compiled rules match entries. File contents are not read.
+
+Usage: python ignore_walk.py <number_of_directories> <files_per_directory>
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.checkpoint import Checkpoint, TreeNode
+from bakker.hashing import FileHasher
+from bakker.ignore import IgnoreMatcher, IgnoreRules, IGNORE_FILE_NAME
+
+
+class NullHasher(FileHasher):
+    def submit(self, node, path, file_stat):
+        node.checksum = '0' * 16
+
+
+PATTERNS = ['node_modules/', '.venv/', '__pycache__/', '*.pyc', '/build', '*.log', '!keep.log']
+
+
+def walk(path, ignore):
+    start = time.time()
+    root = TreeNode.build_node(path, '', NullHasher(), ignore)
+    duration = time.time() - start
+    return sum(1 for _ in Checkpoint(root).iter()), duration
+
+
+directory_count = int(sys.argv[1])
+file_count = int(sys.argv[2])
+
+with tempfile.TemporaryDirectory() as src_path:
+    # 80% of the directories are dependencies, like in a typical project
+    for d in range(directory_count):
+        parent = 'node_modules' if d % 5 else 'src'
+        dir_path = os.path.join(src_path, parent, 'dir_{}'.format(d))
+        os.makedirs(dir_path)
+        for f in range(file_count):
+            with open(os.path.join(dir_path, 'file_{}.js'.format(f)), 'w') as file:
+                file.write('{}/{}'.format(d, f))
+    with open(os.path.join(src_path, IGNORE_FILE_NAME), 'w') as f:
+        f.write('\n'.join(PATTERNS) + '\n')
+
+    # warm up the dentry and inode caches
+    walk(src_path, None)
+    entries, duration = walk(src_path, None)
+    print('whole tree: {} entries, {:.3f}s'.format(entries, duration))
+    entries, duration = walk(src_path, IgnoreMatcher())
+    print('ignored dependencies: {} entries, {:.3f}s'.format(entries, duration))
+
+names = ['file_{}.js'.format(i) for i in range(100000)]
+for description, rules in [('without !', IgnoreRules(PATTERNS[:-1])), ('with !', IgnoreRules(PATTERNS))]:
+    start = time.time()
+    for name in names:
+        rules.match('src/dir/' + name, False)
+    print('match {}: {:.2f} us per entry'.format(description, (time.time() - start) / len(names) * 1e6))
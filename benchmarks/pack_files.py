@@ -0,0 +1,68 @@
+"""
+Measures store and restore throughput of many small files with and without pack files.
+
+Usage: python pack_files.py <number_of_files> [work_dir]
+
+A tree of small files between 100 B and 8 KiB, 1000 files per directory, is generated in work_dir (a temporary
+directory by default), e.g. 1000000 files for the large tree benchmark.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from bakker.checkpoint import Checkpoint
+from bakker.storage import FileSystemStorage
+
+
+def generate_tree(path, number_of_files):
+    generator = random.Random(0)
+    size = 0
+    for i in range(number_of_files):
+        dir_path = os.path.join(path, '{:05d}'.format(i // 1000))
+        if i % 1000 == 0:
+            os.makedirs(dir_path)
+        data = generator.getrandbits(8 * 8192).to_bytes(8192, 'little')[:generator.randint(100, 8192)]
+        with open(os.path.join(dir_path, '{:03d}'.format(i % 1000)), 'wb') as f:
+            f.write(data)
+        size += len(data)
+    return size
+
+
+def benchmark(src_path, work_path, checkpoint, number_of_files, size, packing):
+    store_path = os.path.join(work_path, 'store')
+    restore_path = os.path.join(work_path, 'restore')
+    os.makedirs(restore_path)
+    storage = FileSystemStorage(store_path, packing=packing)
+
+    start = time.time()
+    storage.store(src_path, checkpoint)
+    store_duration = time.time() - start
+
+    start = time.time()
+    storage.retrieve(restore_path, checkpoint.meta)
+    restore_duration = time.time() - start
+
+    print('{}: store {:.0f} files/s ({:.1f} MB/s), restore {:.0f} files/s ({:.1f} MB/s)'.format(
+        'packed' if packing else 'loose',
+        number_of_files / store_duration, size / store_duration / 10**6,
+        number_of_files / restore_duration, size / restore_duration / 10**6))
+
+    shutil.rmtree(store_path)
+    shutil.rmtree(restore_path)
+
+
+number_of_files = int(sys.argv[1])
+work_path = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp()
+src_path = os.path.join(work_path, 'src')
+
+try:
+    size = generate_tree(src_path, number_of_files)
+    checkpoint = Checkpoint.build_checkpoint(src_path)
+    benchmark(src_path, work_path, checkpoint, number_of_files, size, False)
+    benchmark(src_path, work_path, checkpoint, number_of_files, size, True)
+finally:
+    shutil.rmtree(src_path)
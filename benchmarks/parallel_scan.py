@@ -0,0 +1,45 @@
+"""
+Measures how the walk of a directory tree scales with the number of scanning processes. File contents are not
+read, only the walk itself and building the nodes is measured.
+
+Usage: python parallel_scan.py <path> <max_processes>
+"""
+
+import sys
+import time
+
+from bakker.checkpoint import Checkpoint, TreeNode
+from bakker.hashing import FileHasher
+from bakker.scanning import ParallelScanner
+
+
+class NullHasher(FileHasher):
+    def submit(self, node, path, file_stat):
+        node.checksum = '0' * 16
+
+
+def walk(path, processes):
+    if processes is None:
+        return TreeNode.build_node(path, '', NullHasher())
+    return ParallelScanner(processes).build_node(path, NullHasher())
+
+
+in_path = sys.argv[1]
+max_processes = int(sys.argv[2])
+
+# warm up the dentry and inode caches
+walk(in_path, None)
+
+serial_duration = None
+processes = None
+while processes is None or processes <= max_processes:
+    start = time.time()
+    root = walk(in_path, processes)
+    duration = time.time() - start
+    entries = sum(1 for _ in Checkpoint(root).iter())
+    if serial_duration is None:
+        serial_duration = duration
+    print('{}: {} entries, {:.3f}s, speedup {:.2f}'.format(
+        'serial' if processes is None else '{} process(es)'.format(processes), entries, duration,
+        serial_duration / duration))
+    processes = 1 if processes is None else processes * 2
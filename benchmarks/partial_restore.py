@@ -0,0 +1,47 @@
+"""
+Compares restoring a whole checkpoint with restoring a single file of it and with reading that file through a
+CheckpointView, from a binary checkpoint that is loaded from the storage for every run.
+
+Usage: python partial_restore.py <number_of_directories> <files_per_directory>
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.storage import FileSystemStorage
+from bakker.view import CheckpointView
+
+
+def measure(description, function):
+    start = time.time()
+    function()
+    print('{}: {:.3f}s'.format(description, time.time() - start))
+
+
+def read(storage, checkpoint_meta, path):
+    with CheckpointView(storage, storage.retrieve_checkpoint(checkpoint_meta)).open(path) as f:
+        f.read()
+
+
+directory_count = int(sys.argv[1])
+file_count = int(sys.argv[2])
+
+with tempfile.TemporaryDirectory() as tmp_path:
+    src_path = os.path.join(tmp_path, 'src')
+    for d in range(directory_count):
+        dir_path = os.path.join(src_path, 'dir_{}'.format(d))
+        os.makedirs(dir_path)
+        for f in range(file_count):
+            with open(os.path.join(dir_path, 'file_{}'.format(f)), 'w') as file:
+                file.write('{}/{}'.format(d, f))
+
+    storage = FileSystemStorage(os.path.join(tmp_path, 'store'))
+    checkpoint_meta = storage.create(src_path).meta
+    file_path = os.path.join('dir_{}'.format(directory_count // 2), 'file_0')
+
+    measure('whole checkpoint', lambda: storage.retrieve(tempfile.mkdtemp(dir=tmp_path), checkpoint_meta))
+    measure('single file', lambda: storage.retrieve(tempfile.mkdtemp(dir=tmp_path), checkpoint_meta,
+                                                    paths=[file_path]))
+    measure('read through a view', lambda: read(storage, checkpoint_meta, file_path))
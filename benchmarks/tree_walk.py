@@ -0,0 +1,94 @@
+"""
+Compares the metadata cost of the previous os.path based tree walk with the os.scandir based walk of
+DirectoryNode.build_node. File contents are not read, only the walk itself is measured.
+
+Usage: python tree_walk.py <path> [legacy|scandir]
+
+Without a mode both walkers are benchmarked. If strace is installed, the stat-family syscalls per entry are
+counted by re-running each walker under strace.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+from bakker.checkpoint import Checkpoint, TreeNode
+from bakker.hashing import FileHasher
+
+
+SYSCALLS = ['stat', 'lstat', 'newfstatat', 'statx', 'readlink', 'getdents64', 'openat']
+
+
+class NullHasher(FileHasher):
+    def submit(self, node, path, file_stat):
+        node.checksum = '0' * 16
+
+
+def legacy_walk(path):
+    """ The syscall pattern of DirectoryNode.build_node before the os.scandir walker, without hashing. """
+    count = 1
+    for child_name in os.listdir(path):
+        child_path = os.path.join(path, child_name)
+        if not os.path.isfile(child_path) and not os.path.isdir(child_path):
+            continue
+        if os.path.islink(child_path):
+            assert os.path.islink(child_path)
+            os.lstat(child_path)
+            os.readlink(child_path)
+            count += 1
+        elif os.path.isfile(child_path):
+            assert os.path.isfile(child_path)
+            assert not os.path.islink(child_path)
+            os.lstat(child_path)
+            count += 1
+        elif os.path.isdir(child_path):
+            assert os.path.isdir(child_path)
+            os.lstat(child_path)
+            count += legacy_walk(child_path)
+    return count
+
+
+def scandir_walk(path):
+    root = TreeNode.build_node(path, '', NullHasher())
+    return sum(1 for _ in Checkpoint(root).iter())
+
+
+def walk(path, mode):
+    return legacy_walk(path) if mode == 'legacy' else scandir_walk(path)
+
+
+def count_syscalls(path, mode):
+    result = subprocess.run(['strace', '-f', '-c', '-e', 'trace=' + ','.join(SYSCALLS),
+                             sys.executable, __file__, path, mode, '--walk-once'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    counts = {}
+    for line in result.stderr.splitlines():
+        columns = line.split()
+        if columns and columns[-1] in SYSCALLS and re.match(r'^\d+$', columns[3]):
+            counts[columns[-1]] = int(columns[3])
+    return counts
+
+
+in_path = sys.argv[1]
+modes = [arg for arg in sys.argv[2:] if arg in ('legacy', 'scandir')] or ['legacy', 'scandir']
+
+if '--walk-once' in sys.argv:
+    walk(in_path, modes[0])
+    sys.exit(0)
+
+for mode in modes:
+    # warm up the dentry and inode caches
+    walk(in_path, mode)
+
+    start = time.time()
+    entries = walk(in_path, mode)
+    duration = time.time() - start
+    print('{}: {} entries, {:.3f}s, {:.2f}us per entry'.format(mode, entries, duration, duration / entries * 10**6))
+
+    if shutil.which('strace') is not None:
+        counts = count_syscalls(in_path, mode)
+        print('  syscalls per entry: ' + ', '.join('{}={:.2f}'.format(name, count / entries)
+                                                   for name, count in sorted(counts.items())))
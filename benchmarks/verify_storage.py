@@ -0,0 +1,40 @@
+"""
+Verifies the files of a storage one after another, with several threads and with a limited rate.
+
+Usage: python verify_storage.py <number_of_files> <file_size_in_KiB> <workers> <rate_in_MiB_per_second>
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bakker.storage import FileSystemStorage
+from bakker.verify import Verifier
+
+
+def measure(description, verifier):
+    start = time.time()
+    report = verifier.verify()
+    duration = time.time() - start
+    print('{}: {:.3f}s, {:.1f} MiB/s'.format(description, duration, report.size / duration / 1024 / 1024))
+
+
+file_count = int(sys.argv[1])
+file_size = int(sys.argv[2]) * 1024
+workers = int(sys.argv[3])
+rate = float(sys.argv[4]) * 1024 * 1024
+
+with tempfile.TemporaryDirectory() as tmp_path:
+    src_path = os.path.join(tmp_path, 'src')
+    os.makedirs(src_path)
+    for i in range(file_count):
+        with open(os.path.join(src_path, 'file_{}'.format(i)), 'wb') as f:
+            f.write(os.urandom(file_size))
+
+    storage = FileSystemStorage(os.path.join(tmp_path, 'store'))
+    storage.create(src_path)
+
+    measure('sequential', Verifier(storage))
+    measure('{} workers'.format(workers), Verifier(storage, workers=workers))
+    measure('{} workers, limited rate'.format(workers), Verifier(storage, workers=workers, rate=rate))
@@ -29,10 +29,14 @@ setup(
     python_requires='>=3.5',
     setup_requires=[],
     install_requires=[
-        'xxhash==1.3.0',
+        'xxhash>=2.0.0',
         'Click==7.0',
     ],
-    extras_require={},
+    extras_require={
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
+        'blake3': ['blake3'],
+    },
     include_package_data=True,
     classifiers=[
         'License :: OSI Approved :: MIT License',
@@ -0,0 +1,112 @@
+from datetime import datetime
+import errno
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bakker.checkpoint import Checkpoint, DirectoryNode
+from bakker.storage import FileSystemStorage, NoUniqueMatchError
+
+
+class TestCheckpointIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.storage = FileSystemStorage(self.tmp_dir.name)
+
+        self.checkpoints = [
+                self.checkpoint('aa00000000000000', datetime(2020, 1, 1, 10), 'first'),
+                self.checkpoint('ab00000000000000', datetime(2020, 1, 1, 11), None),
+                self.checkpoint('bb00000000000000', datetime(2020, 1, 1, 12), 'last'),
+                ]
+        for checkpoint in self.checkpoints:
+            self.storage.store_checkpoint(checkpoint)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def checkpoint(checksum, time, name):
+        return Checkpoint(DirectoryNode('', checksum, 0o755, dict()), time=time, name=name)
+
+    def meta_strings(self, checkpoint_metas):
+        return [checkpoint_meta.to_string() for checkpoint_meta in checkpoint_metas]
+
+    def test_lookups(self):
+        storage = FileSystemStorage(self.tmp_dir.name)
+
+        self.assertEqual(self.meta_strings(storage.retrieve_checkpoint_metas()),
+                         self.meta_strings(checkpoint.meta for checkpoint in self.checkpoints))
+        self.assertEqual(len(storage.find_checkpoint_metas_by_checksum('a')), 2)
+        self.assertEqual(storage.find_by_checksum('ab').checksum, 'ab00000000000000')
+        self.assertRaises(NoUniqueMatchError, storage.find_by_checksum, 'a')
+        self.assertRaises(FileNotFoundError, storage.find_by_checksum, 'c')
+        self.assertEqual(storage.find_by_name('last').checksum, 'bb00000000000000')
+        self.assertRaises(FileNotFoundError, storage.find_by_name, 'missing')
+
+        checkpoint_metas = storage.find_checkpoint_metas_by_time(datetime(2020, 1, 1, 11), datetime(2020, 1, 1, 12))
+        self.assertEqual(self.meta_strings(checkpoint_metas), [self.checkpoints[1].meta.to_string()])
+        checkpoint_metas = storage.find_checkpoint_metas_by_time(start=datetime(2020, 1, 1, 11))
+        self.assertEqual(len(checkpoint_metas), 2)
+
+        checkpoint = storage.retrieve_checkpoint(storage.find_by_name('first'))
+        self.assertEqual(checkpoint.root.checksum, 'aa00000000000000')
+
+    def test_appends_to_index(self):
+        with open(self.storage.checkpoint_index.index_file_path, 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 4)
+
+        self.assertRaises(FileExistsError, self.storage.store_checkpoint, self.checkpoints[0])
+
+    def test_create_appends_to_index(self):
+        src_path = os.path.join(self.tmp_dir.name, 'src')
+        os.mkdir(src_path)
+        with open(os.path.join(src_path, 'file'), 'w') as f:
+            f.write('content')
+        self.storage.retrieve_checkpoint_metas()
+        with mock.patch.object(self.storage.checkpoint_index, 'rebuild') as rebuild:
+            for name in ['created', 'created_again']:
+                self.storage.create(src_path, name)
+        self.assertFalse(rebuild.called)
+        self.assertEqual(len(FileSystemStorage(self.tmp_dir.name).retrieve_checkpoint_metas()), 5)
+
+    def test_rebuilds_missing_index(self):
+        os.remove(self.storage.checkpoint_index.index_file_path)
+
+        storage = FileSystemStorage(self.tmp_dir.name)
+        self.assertEqual(len(storage.retrieve_checkpoint_metas()), 3)
+        self.assertTrue(os.path.isfile(storage.checkpoint_index.index_file_path))
+
+    def test_read_only_storage(self):
+        os.remove(self.storage.checkpoint_index.index_file_path)
+        os.chmod(self.tmp_dir.name, 0o555)
+        try:
+            # root ignores the mode of the directory
+            with mock.patch('bakker.checkpoint_index.os.replace',
+                            side_effect=PermissionError(errno.EACCES, 'Permission denied')):
+                storage = FileSystemStorage(self.tmp_dir.name)
+                self.assertEqual(len(storage.retrieve_checkpoint_metas()), 3)
+                self.assertEqual(storage.find_by_name('last').checksum, 'bb00000000000000')
+        finally:
+            os.chmod(self.tmp_dir.name, 0o755)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ['checkpoints', 'store.json'])
+
+    def test_rebuilds_corrupted_index(self):
+        with open(self.storage.checkpoint_index.index_file_path, 'a') as f:
+            f.write('interrupted_app')
+
+        storage = FileSystemStorage(self.tmp_dir.name)
+        self.assertEqual(len(storage.retrieve_checkpoint_metas()), 3)
+        self.assertEqual(len(self.storage.retrieve_checkpoint_metas()), 3)
+
+    def test_rebuilds_stale_index(self):
+        # a checkpoint written without updating the index
+        checkpoint = self.checkpoint('cc00000000000000', datetime(2020, 1, 1, 13), None)
+        with open(os.path.join(self.storage.tree_path, checkpoint.meta.to_string() + '.json'), 'w') as f:
+            f.write(checkpoint.to_json())
+        index_stat = os.stat(self.storage.checkpoint_index.index_file_path)
+        os.utime(self.storage.tree_path, ns=(index_stat.st_atime_ns, index_stat.st_mtime_ns + 10**9))
+
+        self.assertEqual(self.storage.find_by_checksum('c').checksum, 'cc00000000000000')
+        self.assertEqual(self.storage.retrieve_checkpoint(checkpoint.meta).root.checksum, 'cc00000000000000')
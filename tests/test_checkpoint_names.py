@@ -50,3 +50,15 @@ class TestCheckpointNames(unittest.TestCase):
         self.assertEqual(checkpoint.meta.checksum, checkpoint_2.meta.checksum)
 
         self.assertEqual(checkpoint.root.checksum, checkpoint_2.root.checksum)
+
+    def test_json_checkpoint_retrieval(self):
+        checkpoint = Checkpoint.build_checkpoint(self.resources_path, 'my_test_name')
+        with tempfile.TemporaryDirectory() as tmp_path:
+            FileSystemStorage(tmp_path, checkpoint_format='json').store(self.resources_path, checkpoint)
+
+            storage = FileSystemStorage(tmp_path)
+            meta = storage.find_by_name('my_test_name')
+            checkpoint_2 = storage.retrieve_checkpoint(meta)
+
+        self.assertEqual(checkpoint.time, checkpoint_2.time)
+        self.assertEqual(checkpoint.root.checksum, checkpoint_2.root.checksum)
@@ -0,0 +1,58 @@
+import filecmp
+import io
+import os
+import random
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.chunking import Chunker
+from bakker.storage import FileSystemStorage
+
+
+class TestChunking(unittest.TestCase):
+    def setUp(self):
+        self.data = random.Random(42).getrandbits(8 * 512 * 1024).to_bytes(512 * 1024, 'little')
+        self.chunker = Chunker(min_size=4 * 1024, avg_size=16 * 1024, max_size=64 * 1024)
+
+    def test_chunks_reassemble(self):
+        chunks = list(self.chunker.chunks(io.BytesIO(self.data)))
+
+        self.assertEqual(b''.join(chunks), self.data)
+        for chunk in chunks[:-1]:
+            self.assertTrue(self.chunker.min_size <= len(chunk) <= self.chunker.max_size)
+
+    def test_edit_in_the_middle(self):
+        middle = len(self.data) // 2
+        edited_data = self.data[:middle] + b'inserted bytes' + self.data[middle:]
+
+        chunks = list(self.chunker.chunks(io.BytesIO(self.data)))
+        edited_chunks = list(self.chunker.chunks(io.BytesIO(edited_data)))
+
+        # only the chunks around the edit differ
+        self.assertGreaterEqual(len(set(chunks) & set(edited_chunks)), len(chunks) - 3)
+
+    def test_chunked_storage(self):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            src_path = os.path.join(tmp_path, 'src')
+            dst_path = os.path.join(tmp_path, 'dst')
+            os.makedirs(src_path)
+            os.makedirs(dst_path)
+            with open(os.path.join(src_path, 'large'), 'wb') as f:
+                f.write(self.data)
+            with open(os.path.join(src_path, 'small'), 'wb') as f:
+                f.write(b'small')
+
+            storage = FileSystemStorage(os.path.join(tmp_path, 'store'), chunking=True, chunker=self.chunker)
+            storage.CHUNKING_MIN_FILE_SIZE = 1024
+            checkpoint = Checkpoint.build_checkpoint(src_path)
+            storage.store(src_path, checkpoint)
+
+            self.assertTrue(storage.has_file(checkpoint.root.children['large'].checksum))
+            self.assertEqual(os.listdir(storage.manifest_path),
+                             [checkpoint.root.children['large'].checksum + storage.MANIFEST_FILE_EXT])
+
+            storage.retrieve(dst_path, checkpoint.meta)
+            dir_comparison = filecmp.dircmp(src_path, dst_path)
+            self.assertEqual(dir_comparison.diff_files, [])
+            self.assertEqual(sorted(dir_comparison.same_files), ['large', 'small'])
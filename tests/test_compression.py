@@ -0,0 +1,74 @@
+import filecmp
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.compression import CODECS
+from bakker.storage import FileSystemStorage
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        self.store_path = os.path.join(self.tmp_dir.name, 'store')
+        os.makedirs(self.src_path)
+
+        with open(os.path.join(self.src_path, 'text'), 'w') as f:
+            f.write('a line of text\n' * 100000)
+        with open(os.path.join(self.src_path, 'small_text'), 'w') as f:
+            f.write('a line of text\n' * 100)
+        with open(os.path.join(self.src_path, 'random'), 'wb') as f:
+            f.write(os.urandom(200000))
+        os.symlink('text', os.path.join(self.src_path, 'symlink'))
+
+    def available_codecs(self):
+        codecs = []
+        for name, codec in CODECS.items():
+            try:
+                codec.compress(b'')
+                codecs.append(name)
+            except ImportError:
+                pass
+        return codecs
+
+    def assert_retrieve(self, storage, checkpoint):
+        retrieve_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        storage.retrieve(retrieve_path, checkpoint.meta)
+        dir_comparison = filecmp.dircmp(self.src_path, retrieve_path)
+        self.assertEqual(dir_comparison.diff_files, [])
+        self.assertEqual(dir_comparison.left_only, [])
+
+    def test_codecs(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        for name in self.available_codecs():
+            store_path = os.path.join(self.store_path, name)
+            storage = FileSystemStorage(store_path, compression=name, packing=True)
+            storage.store(self.src_path, checkpoint)
+
+            object_files = os.listdir(storage.file_path)
+            codec = CODECS[name]
+            self.assertIn(checkpoint.root.children['text'].checksum + codec.file_ext, object_files)
+            # incompressible files and symlinks are stored uncompressed
+            self.assertIn(checkpoint.root.children['random'].checksum, object_files)
+            self.assertIn(checkpoint.root.children['symlink'].checksum, object_files)
+
+            self.assert_retrieve(FileSystemStorage(store_path), checkpoint)
+
+    def test_mixed_storage(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        FileSystemStorage(self.store_path).store(self.src_path, checkpoint)
+
+        with open(os.path.join(self.src_path, 'more_text'), 'w') as f:
+            f.write('another line of text\n' * 10000)
+        checkpoint = Checkpoint.build_checkpoint(self.src_path, 'compressed')
+        storage = FileSystemStorage(self.store_path, compression='zlib', compression_level=9)
+        storage.store(self.src_path, checkpoint)
+
+        storage = FileSystemStorage(self.store_path)
+        self.assertTrue(storage.has_file(checkpoint.root.children['more_text'].checksum))
+        self.assert_retrieve(storage, checkpoint)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
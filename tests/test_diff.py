@@ -0,0 +1,88 @@
+import io
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint, DirectoryNode
+from bakker.diff import diff, Change, ADDED, REMOVED, MODIFIED, PERMISSIONS_CHANGED
+from bakker.storage import FileSystemStorage
+from bakker import trees
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        for dir_name in ['a/b', 'c', 'removed_dir/sub']:
+            os.makedirs(os.path.join(self.src_path, dir_name))
+        for file_name in ['a/b/file', 'a/file', 'c/file', 'removed_dir/sub/file', 'root_file', 'type_change']:
+            self.write(file_name, file_name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, file_name, content):
+        with open(os.path.join(self.src_path, file_name), 'w') as f:
+            f.write(content)
+
+    def change_tree(self):
+        self.write('a/b/file', 'modified')
+        self.write('added_file', 'added')
+        os.chmod(os.path.join(self.src_path, 'c'), 0o700)
+        os.chmod(os.path.join(self.src_path, 'root_file'), 0o600)
+        os.remove(os.path.join(self.src_path, 'removed_dir/sub/file'))
+        os.rmdir(os.path.join(self.src_path, 'removed_dir/sub'))
+        os.rmdir(os.path.join(self.src_path, 'removed_dir'))
+        os.remove(os.path.join(self.src_path, 'type_change'))
+        os.mkdir(os.path.join(self.src_path, 'type_change'))
+
+    def expected_changes(self):
+        return [
+                Change(MODIFIED, os.path.join('a', 'b', 'file'), None, None),
+                Change(ADDED, 'added_file', None, None),
+                Change(PERMISSIONS_CHANGED, 'c', None, None),
+                Change(REMOVED, 'removed_dir', None, None),
+                Change(PERMISSIONS_CHANGED, 'root_file', None, None),
+                Change(MODIFIED, 'type_change', None, None),
+                ]
+
+    def test_built_checkpoints(self):
+        old_checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        self.assertEqual(list(diff(old_checkpoint, Checkpoint.build_checkpoint(self.src_path))), [])
+
+        self.change_tree()
+        new_checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        self.assertEqual(list(diff(old_checkpoint, new_checkpoint)), self.expected_changes())
+
+    def test_stored_checkpoints(self):
+        for checkpoint_format in ['binary', 'tree']:
+            storage = FileSystemStorage(os.path.join(self.tmp_dir.name, checkpoint_format),
+                                        checkpoint_format=checkpoint_format)
+            old_checkpoint = Checkpoint.build_checkpoint(self.src_path, 'old')
+            storage.store_checkpoint(old_checkpoint)
+            self.change_tree()
+            new_checkpoint = Checkpoint.build_checkpoint(self.src_path, 'new')
+            storage.store_checkpoint(new_checkpoint)
+
+            old_checkpoint = storage.retrieve_checkpoint(storage.find_by_name('old'))
+            new_checkpoint = storage.retrieve_checkpoint(storage.find_by_name('new'))
+            self.assertEqual(list(diff(old_checkpoint, new_checkpoint)), self.expected_changes())
+            # the directory whose content did not change was skipped by its tree key without being decoded
+            self.assertIsNone(old_checkpoint.root.children['c']._children)
+            self.assertIsNone(new_checkpoint.root.children['c']._children)
+            self.assertIsNotNone(new_checkpoint.root.children['a'].children['b']._children)
+
+            self.tmp_dir.cleanup()
+            self.setUp()
+
+    def test_binary_tree_keys_match_tree_objects(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        f = io.BytesIO()
+        Checkpoint.build_checkpoint(self.src_path).dump(f)
+        f.seek(0)
+        loaded_checkpoint = Checkpoint.load(f)
+
+        trees.update_tree_keys(checkpoint.root)
+        for node, path in checkpoint.iter():
+            if isinstance(node, DirectoryNode):
+                self.assertEqual(loaded_checkpoint.lookup(path).tree_key, node.tree_key)
@@ -24,7 +24,7 @@ class TestFileSystemStorage(unittest.TestCase):
                     yield from dfs_file_checksums(file_path)
                 elif os.path.islink(file_path):
                     message = xxhash.xxh64()
-                    message.update(os.readlink(file_path))
+                    message.update(os.fsencode(os.readlink(file_path)))
                     yield message.hexdigest()
                 elif os.path.isfile(file_path):
                     BLOCKSIZE = 65536
@@ -0,0 +1,116 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import xxhash
+
+from bakker.checkpoint import Checkpoint
+from bakker.diff import diff
+from bakker.hashing import HASH_ALGORITHMS, DEFAULT_HASH_ALGORITHM, HashAlgorithm, Blake3Algorithm, \
+    get_hash_algorithm
+from bakker.storage import FileSystemStorage
+
+
+class TestHashAlgorithms(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        os.makedirs(os.path.join(self.src_path, 'dir'))
+        for file_name, content in [('small', b'small'), ('dir/large', os.urandom(300000)), ('empty', b'')]:
+            with open(os.path.join(self.src_path, file_name), 'wb') as f:
+                f.write(content)
+        os.symlink('dir', os.path.join(self.src_path, 'link'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_default_checksums_are_unchanged(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        self.assertIs(checkpoint.hash_algorithm, DEFAULT_HASH_ALGORITHM)
+        self.assertEqual(checkpoint.root.get_child('small').checksum, xxhash.xxh64(b'small').hexdigest())
+        self.assertEqual(checkpoint.root.get_child('link').checksum, xxhash.xxh64(b'dir').hexdigest())
+
+    def test_store_and_retrieve(self):
+        for name, algorithm in HASH_ALGORITHMS.items():
+            try:
+                algorithm.new()
+            except ImportError:
+                continue
+            for i, checkpoint_format in enumerate(FileSystemStorage.CHECKPOINT_FORMATS):
+                store_path = os.path.join(self.tmp_dir.name, '{}_{}'.format(name, i))
+                storage = FileSystemStorage(store_path, chunking=True, checkpoint_format=checkpoint_format,
+                                            hash_algorithm=name)
+                storage.CHUNKING_MIN_FILE_SIZE = 100000
+                checkpoint = storage.create(self.src_path)
+                self.assertEqual(len(checkpoint.root.get_child('small').checksum), 2 * algorithm.digest_size)
+
+                storage = FileSystemStorage(store_path)
+                self.assertIs(storage.hash_algorithm, algorithm)
+                retrieved_checkpoint = storage.retrieve_checkpoint(checkpoint.meta)
+                self.assertIs(retrieved_checkpoint.hash_algorithm, algorithm)
+                self.assertEqual(list(diff(checkpoint, retrieved_checkpoint)), [])
+
+                dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+                os.chmod(dst_path, checkpoint.root.permissions)
+                storage.retrieve(dst_path, checkpoint.meta)
+                restored_checkpoint = Checkpoint.build_checkpoint(dst_path, hash_algorithm=algorithm)
+                self.assertEqual(list(diff(checkpoint, restored_checkpoint)), [])
+
+    def test_serialization(self):
+        algorithm = get_hash_algorithm('xxh3_128')
+        checkpoint = Checkpoint.build_checkpoint(self.src_path, hash_algorithm=algorithm)
+        self.assertIs(Checkpoint.from_json(checkpoint.to_json()).hash_algorithm, algorithm)
+        f = io.BytesIO()
+        checkpoint.dump(f)
+        f.seek(0)
+        self.assertIs(Checkpoint.load(f).hash_algorithm, algorithm)
+
+    def test_diff_with_other_algorithm(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        other_checkpoint = Checkpoint.build_checkpoint(self.src_path, hash_algorithm=get_hash_algorithm('xxh3_64'))
+        with self.assertRaises(ValueError):
+            diff(checkpoint, other_checkpoint)
+        with self.assertRaises(ValueError):
+            FileSystemStorage(os.path.join(self.tmp_dir.name, 'store')).store(self.src_path, other_checkpoint)
+
+    def test_existing_storage_keeps_its_algorithm(self):
+        store_path = os.path.join(self.tmp_dir.name, 'store')
+        FileSystemStorage(store_path).create(self.src_path)
+        self.assertIs(FileSystemStorage(store_path, hash_algorithm='xxh3_128').hash_algorithm, DEFAULT_HASH_ALGORITHM)
+        with self.assertRaises(ValueError):
+            get_hash_algorithm('md5')
+
+    def test_blake3_large_files(self):
+        algorithm = get_hash_algorithm('blake3')
+        try:
+            algorithm.new()
+        except ImportError:
+            self.skipTest('blake3 is not installed')
+        file_path = os.path.join(self.src_path, 'dir/large')
+        checksum = algorithm.file_checksum(file_path)
+        # hashed by several threads from a memory map
+        with mock.patch.object(Blake3Algorithm, 'MULTITHREADING_MIN_SIZE', 1024):
+            self.assertEqual(algorithm.file_checksum(file_path), checksum)
+
+    def test_read_strategies(self):
+        file_path = os.path.join(self.src_path, 'dir/large')
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        for algorithm in [get_hash_algorithm('xxh64'), get_hash_algorithm('xxh3_128')]:
+            checksum = algorithm.hexdigest(data)
+            self.assertEqual(algorithm.file_checksum(file_path, drop_cache=True), checksum)
+            with mock.patch.object(HashAlgorithm, 'MAX_BLOCKSIZE', 4096), \
+                    mock.patch.object(HashAlgorithm, 'MIN_BLOCKSIZE', 4096):
+                self.assertEqual(algorithm.file_checksum(file_path), checksum)
+            with mock.patch.object(HashAlgorithm, 'MMAP_MIN_SIZE', 1024):
+                self.assertEqual(algorithm.file_checksum(file_path), checksum)
+                self.assertEqual(algorithm.file_checksum(os.path.join(self.src_path, 'empty')),
+                                 algorithm.hexdigest(b''))
+
+    def test_block_size(self):
+        algorithm = DEFAULT_HASH_ALGORITHM
+        self.assertEqual(algorithm.block_size(mock.Mock(st_size=100, st_blksize=4096)), algorithm.MIN_BLOCKSIZE)
+        self.assertEqual(algorithm.block_size(mock.Mock(st_size=200000, st_blksize=4096)), 256 * 1024)
+        self.assertEqual(algorithm.block_size(mock.Mock(st_size=10 ** 9, st_blksize=4096)), algorithm.MAX_BLOCKSIZE)
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+from bakker.cache import HashCache
+from bakker.checkpoint import Checkpoint
+from bakker.storage import FileSystemStorage
+
+
+class TestHashCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        self.store_path = os.path.join(self.tmp_dir.name, 'store')
+
+        os.makedirs(os.path.join(self.src_path, 'folder'))
+        for file_name, content in [('a.txt', 'aaa'), ('b.txt', 'bbb'), ('folder/c.txt', 'ccc')]:
+            self.write_old_file(file_name, content)
+
+    def write_old_file(self, file_name, content):
+        file_path = os.path.join(self.src_path, file_name)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        # files modified within the racy window are never cached
+        os.utime(file_path, (0, 0))
+
+    def test_identical_checksums(self):
+        hash_cache = HashCache()
+        checkpoint_a = Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache)
+        self.assertEqual(hash_cache.hits, 0)
+        self.assertEqual(hash_cache.misses, 3)
+
+        checkpoint_b = Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache)
+        self.assertEqual(hash_cache.hits, 3)
+        self.assertEqual(checkpoint_a.root.checksum, checkpoint_b.root.checksum)
+        self.assertEqual(checkpoint_a.root.checksum, Checkpoint.build_checkpoint(self.src_path).root.checksum)
+
+    def test_modified_file_is_rehashed(self):
+        hash_cache = HashCache()
+        Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache)
+
+        self.write_old_file('folder/c.txt', 'cccc')
+        hash_cache = HashCache(hash_cache.new_entries)
+        checkpoint = Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache)
+
+        self.assertEqual(hash_cache.hits, 2)
+        self.assertEqual(hash_cache.misses, 1)
+        self.assertEqual(checkpoint.root.checksum, Checkpoint.build_checkpoint(self.src_path).root.checksum)
+
+    def test_recently_modified_file_is_not_cached(self):
+        with open(os.path.join(self.src_path, 'a.txt'), 'w') as f:
+            f.write('new')
+
+        hash_cache = HashCache()
+        Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache)
+
+        self.assertEqual(len(hash_cache.new_entries), 2)
+
+    def test_storage_persistence(self):
+        storage = FileSystemStorage(self.store_path)
+        hash_cache = storage.retrieve_hash_cache(self.src_path)
+        checkpoint = Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache)
+        storage.store(self.src_path, checkpoint)
+        storage.store_hash_cache(self.src_path, hash_cache)
+
+        hash_cache = storage.retrieve_hash_cache(self.src_path)
+        checkpoint_2 = Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache)
+
+        self.assertEqual(hash_cache.hits, 3)
+        self.assertEqual(hash_cache.misses, 0)
+        self.assertEqual(checkpoint.root.checksum, checkpoint_2.root.checksum)
+
+    def test_corrupt_cache_is_ignored(self):
+        storage = FileSystemStorage(self.store_path)
+        storage.store_hash_cache(self.src_path, HashCache())
+        with open(storage._hash_cache_file_path(self.src_path), 'w') as f:
+            f.write('{"version": 1, "entries": [[1, 2')
+
+        hash_cache = storage.retrieve_hash_cache(self.src_path)
+        self.assertEqual(len(hash_cache.entries), 0)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.diff import diff
+from bakker.storage import FileSystemStorage
+
+
+class TestHashedStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        os.makedirs(os.path.join(self.src_path, 'dir'))
+        for file_name, content in [('small', b'small'), ('dir/duplicate', b'small'),
+                                   ('compressible', b'compressible ' * 20000), ('random', os.urandom(300000)),
+                                   ('empty', b'')]:
+            with open(os.path.join(self.src_path, file_name), 'wb') as f:
+                f.write(content)
+            # older than the racy window of the hash cache
+            os.utime(os.path.join(self.src_path, file_name), (1000000000, 1000000000))
+        os.symlink('dir', os.path.join(self.src_path, 'link'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_stored(self, storage, checkpoint):
+        self.assertEqual(checkpoint.root.checksum, Checkpoint.build_checkpoint(self.src_path).root.checksum)
+        self.assertEqual(list(diff(Checkpoint.build_checkpoint(self.src_path), checkpoint)), [])
+        for _, _, file_names in os.walk(storage.file_path):
+            self.assertEqual([name for name in file_names if name.endswith(storage.TMP_FILE_EXT)], [])
+
+        dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        os.chmod(dst_path, checkpoint.root.permissions)
+        storage.retrieve(dst_path, checkpoint.meta)
+        self.assertEqual(list(diff(checkpoint, Checkpoint.build_checkpoint(dst_path))), [])
+
+    def test_storage_configurations(self):
+        configurations = [dict(), dict(packing=True), dict(compression='zlib'), dict(chunking=True),
+                          dict(packing=True, compression='zlib', fan_out=2)]
+        for i, configuration in enumerate(configurations):
+            storage = FileSystemStorage(os.path.join(self.tmp_dir.name, str(i)), **configuration)
+            storage.CHUNKING_MIN_FILE_SIZE = 100000
+            for workers in [None, 3]:
+                checkpoint = storage.create(self.src_path, workers=workers)
+                self.assert_stored(storage, checkpoint)
+
+            # the duplicate and the files stored by the second create were discarded
+            self.assertEqual(sum(storage.store_stats.files.values()), 5)
+
+    def test_create_with_hash_cache(self):
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'))
+        hash_cache = storage.retrieve_hash_cache(self.src_path)
+        storage.create(self.src_path, hash_cache=hash_cache)
+
+        # objects of files whose checksums come from the cache are stored again if they are missing
+        other_storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'other_store'))
+        checkpoint = other_storage.create(self.src_path, hash_cache=hash_cache)
+        self.assertEqual(hash_cache.hits, 5)
+        self.assert_stored(other_storage, checkpoint)
@@ -0,0 +1,123 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bakker.checkpoint import Checkpoint
+from bakker.diff import diff
+from bakker.ignore import IgnoreRules
+from bakker.storage import FileSystemStorage
+
+
+class TestIgnoreRules(unittest.TestCase):
+    def assertIgnored(self, patterns, path, is_dir=False, ignored=True):
+        self.assertEqual(bool(IgnoreRules(patterns).match(path, is_dir)), ignored, (patterns, path, is_dir))
+
+    def test_patterns(self):
+        self.assertIgnored(['*.pyc'], 'a/b/c.pyc')
+        self.assertIgnored(['*.pyc'], 'a/c.py', ignored=False)
+        self.assertIgnored(['build/'], 'a/build', is_dir=True)
+        self.assertIgnored(['build/'], 'a/build', ignored=False)
+        self.assertIgnored(['/build'], 'build', is_dir=True)
+        self.assertIgnored(['/build'], 'a/build', is_dir=True, ignored=False)
+        self.assertIgnored(['a/*.txt'], 'a/b.txt')
+        self.assertIgnored(['a/*.txt'], 'a/b/c.txt', ignored=False)
+        self.assertIgnored(['**/cache'], 'a/b/cache', is_dir=True)
+        self.assertIgnored(['a/**/c'], 'a/c')
+        self.assertIgnored(['a/**/c'], 'a/x/y/c')
+        self.assertIgnored(['a/**'], 'a/x/y')
+        self.assertIgnored(['file_[0-2]'], 'file_1')
+        self.assertIgnored(['file_[!0-2]'], 'file_1', ignored=False)
+        self.assertIgnored(['fil?'], 'file')
+        self.assertIgnored(['\\#file', '# comment', ''], '#file')
+        self.assertIgnored(['file  '], 'file')
+        self.assertIgnored(['file\\ '], 'file ')
+
+    def test_negation(self):
+        rules = IgnoreRules(['*.log', '!keep.log'])
+        self.assertTrue(rules.match('a.log', False))
+        self.assertFalse(rules.match('x/keep.log', False))
+        self.assertIsNone(rules.match('a.txt', False))
+        # the last matching pattern decides
+        self.assertTrue(IgnoreRules(['!keep.log', '*.log']).match('keep.log', False))
+
+
+class TestIgnore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        for dir_path in ['src', 'src/node_modules/package', 'src/lib', 'src/lib/build', 'src/lib/cache',
+                         'src/.venv/bin']:
+            os.makedirs(os.path.join(self.tmp_dir.name, dir_path))
+            for file_name in ['main.py', 'main.pyc', 'debug.log', 'keep.log']:
+                with open(os.path.join(self.tmp_dir.name, dir_path, file_name), 'w') as f:
+                    f.write(dir_path + file_name)
+        self.write_file('.bakkerignore', '# generated files\nnode_modules/\n*.pyc\n*.log\n!keep.log\n')
+        self.write_file('lib/.bakkerignore', 'build/\n/cache\n!main.pyc\n')
+        self.patterns = ['.venv/']
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_file(self, relative_path, content):
+        with open(os.path.join(self.src_path, relative_path), 'w') as f:
+            f.write(content)
+
+    def paths(self, checkpoint):
+        return sorted(path for _, path in checkpoint.iter())
+
+    def test_build_checkpoint(self):
+        listed_paths = []
+        scandir = os.scandir
+
+        def listing_scandir(path):
+            listed_paths.append(os.path.relpath(path, self.src_path))
+            return scandir(path)
+
+        with mock.patch('os.scandir', listing_scandir):
+            checkpoint = Checkpoint.build_checkpoint(self.src_path, ignore_patterns=self.patterns)
+        self.assertEqual(self.paths(checkpoint), ['', '.bakkerignore', 'keep.log', 'lib', 'lib/.bakkerignore',
+                                                  'lib/keep.log', 'lib/main.py', 'lib/main.pyc', 'main.py'])
+        # ignored directories are never listed
+        self.assertEqual(sorted(listed_paths), ['.', 'lib'])
+        self.assertEqual(checkpoint.ignore_patterns, self.patterns)
+
+    def test_walkers(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path, ignore_patterns=self.patterns)
+        scanned_checkpoint = Checkpoint.build_checkpoint(self.src_path, ignore_patterns=self.patterns,
+                                                         scan_processes=2)
+        self.assertEqual(list(diff(checkpoint, scanned_checkpoint)), [])
+
+        f = io.BytesIO()
+        meta = Checkpoint.write_checkpoint(self.src_path, f, ignore_patterns=self.patterns)
+        f.seek(0)
+        written_checkpoint = Checkpoint.load(f)
+        self.assertEqual(meta.checksum, checkpoint.root.checksum)
+        self.assertEqual(list(diff(checkpoint, written_checkpoint)), [])
+        self.assertEqual(written_checkpoint.ignore_patterns, self.patterns)
+
+    def test_recorded_patterns(self):
+        for checkpoint_format in FileSystemStorage.CHECKPOINT_FORMATS:
+            storage = FileSystemStorage(os.path.join(self.tmp_dir.name, checkpoint_format),
+                                        checkpoint_format=checkpoint_format)
+            checkpoint = storage.create(self.src_path, ignore_patterns=self.patterns)
+            storage = FileSystemStorage(os.path.join(self.tmp_dir.name, checkpoint_format))
+            self.assertEqual(storage.retrieve_checkpoint(checkpoint.meta).ignore_patterns, self.patterns)
+
+    def test_incremental_restore(self):
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'))
+        checkpoint = storage.create(self.src_path, ignore_patterns=self.patterns)
+        self.write_file('main.py', 'changed')
+        self.write_file('node_modules/package/main.py', 'changed')
+
+        stats = storage.retrieve_incremental(self.src_path, checkpoint.meta, delete=True)
+        self.assertEqual(stats.files_written, 1)
+        self.assertEqual(stats.paths_deleted, 0)
+        # the ignored paths are left alone
+        for relative_path in ['.venv/bin/main.py', 'lib/build/main.py', 'main.pyc', 'lib/debug.log']:
+            self.assertTrue(os.path.exists(os.path.join(self.src_path, relative_path)))
+        with open(os.path.join(self.src_path, 'node_modules/package/main.py')) as f:
+            self.assertEqual(f.read(), 'changed')
+        self.assertEqual(list(diff(checkpoint, Checkpoint.build_checkpoint(self.src_path,
+                                                                           ignore_patterns=self.patterns))), [])
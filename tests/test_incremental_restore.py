@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.diff import diff
+from bakker.storage import FileSystemStorage
+
+
+class TestIncrementalRestore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        for dir_name in ['static', 'changing', 'becomes_file']:
+            os.makedirs(os.path.join(self.src_path, dir_name))
+        self.write('static/file', 'static')
+        self.write('changing/file', 'old')
+        self.write('becomes_file/file', 'dir')
+        os.symlink('static/file', os.path.join(self.src_path, 'link'))
+
+        self.storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'))
+        self.checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        self.storage.store(self.src_path, self.checkpoint)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, file_name, content):
+        with open(os.path.join(self.src_path, file_name), 'w') as f:
+            f.write(content)
+
+    def modify_source(self):
+        self.write('changing/file', 'new content')
+        self.write('changing/extra', 'extra')
+        os.mkdir(os.path.join(self.src_path, 'extra_dir'))
+        self.write('extra_dir/file', 'extra')
+        os.chmod(os.path.join(self.src_path, 'static'), 0o700)
+        os.remove(os.path.join(self.src_path, 'becomes_file/file'))
+        os.rmdir(os.path.join(self.src_path, 'becomes_file'))
+        self.write('becomes_file', 'file')
+        os.remove(os.path.join(self.src_path, 'link'))
+        os.symlink('changing/file', os.path.join(self.src_path, 'link'))
+
+    def assert_restored(self):
+        self.assertEqual(list(diff(self.checkpoint, Checkpoint.build_checkpoint(self.src_path))), [])
+
+    def test_restore_without_delete(self):
+        self.modify_source()
+        stats = self.storage.retrieve_incremental(self.src_path, self.checkpoint.meta)
+
+        self.assertTrue(os.path.isfile(os.path.join(self.src_path, 'changing', 'extra')))
+        self.assertTrue(os.path.isdir(os.path.join(self.src_path, 'extra_dir')))
+        os.remove(os.path.join(self.src_path, 'changing', 'extra'))
+        os.remove(os.path.join(self.src_path, 'extra_dir', 'file'))
+        os.rmdir(os.path.join(self.src_path, 'extra_dir'))
+        self.assert_restored()
+
+        # changing/file, becomes_file/file and link
+        self.assertEqual(stats.files_written, 3)
+        self.assertEqual(stats.bytes_written, len('old') + len('dir'))
+        self.assertEqual(stats.bytes_skipped, len('static'))
+        self.assertEqual(stats.paths_deleted, 0)
+
+    def test_restore_with_delete(self):
+        self.modify_source()
+        stats = self.storage.retrieve_incremental(self.src_path, self.checkpoint.meta, delete=True)
+
+        self.assert_restored()
+        self.assertEqual(stats.paths_deleted, 2)
+        self.assertEqual(stats.bytes_deleted, 2 * len('extra'))
+
+    def test_unchanged_destination(self):
+        stats = self.storage.retrieve_incremental(self.src_path, self.checkpoint.meta, delete=True)
+
+        self.assert_restored()
+        self.assertEqual(stats.files_written, 0)
+        self.assertEqual(stats.bytes_skipped, len('static') + len('old') + len('dir'))
+
+    def test_empty_destination(self):
+        dst_path = os.path.join(self.tmp_dir.name, 'dst')
+        os.mkdir(dst_path)
+        stats = self.storage.retrieve_incremental(dst_path, self.checkpoint.meta)
+
+        self.assertEqual(list(diff(self.checkpoint, Checkpoint.build_checkpoint(dst_path))), [])
+        self.assertEqual(stats.files_written, 4)
+        self.assertEqual(stats.bytes_skipped, 0)
@@ -39,3 +39,15 @@ class TestIndexing(unittest.TestCase):
 
         self.assertEqual(checkpoint.root.children[file_name].permissions, file_permissions)
         self.assertEqual(checkpoint.root.children[symlink_name].permissions, symlink_permissions)
+
+    def test_parallel_checkpoint_building(self):
+        checkpoint = Checkpoint.build_checkpoint(self.TEST_RESOURCES_PATH)
+        parallel_checkpoints = [
+            Checkpoint.build_checkpoint(self.TEST_RESOURCES_PATH, workers=4),
+            Checkpoint.build_checkpoint(self.TEST_RESOURCES_PATH, workers=2, use_processes=True),
+        ]
+
+        nodes = sorted((path, node.checksum) for node, path in checkpoint.iter())
+        for parallel_checkpoint in parallel_checkpoints:
+            self.assertEqual(checkpoint.root.checksum, parallel_checkpoint.root.checksum)
+            self.assertEqual(nodes, sorted((path, node.checksum) for node, path in parallel_checkpoint.iter()))
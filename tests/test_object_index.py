@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.object_index import ObjectIndex
+from bakker.storage import FileSystemStorage
+
+
+class TestObjectIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_file_path = os.path.join(self.tmp_dir.name, 'objects.idx')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_add_and_flush(self):
+        checksums = ['{:016x}'.format(i * 7919) for i in range(1000)]
+        index = ObjectIndex(self.index_file_path, 8)
+        for checksum in checksums[:500]:
+            index.add(checksum)
+        index.flush()
+        for checksum in checksums[500:]:
+            index.add(checksum)
+        self.assertIn(checksums[0], index)
+        self.assertIn(checksums[-1], index)
+        index.flush()
+
+        index = ObjectIndex(self.index_file_path, 8)
+        self.assertTrue(all(checksum in index for checksum in checksums))
+        self.assertNotIn('{:016x}'.format(1), index)
+        self.assertEqual(len(index), len(checksums))
+        # checksums of another digest size are never indexed
+        index.add('01' * 16)
+        self.assertNotIn('01' * 16, index)
+
+    def test_full_digests(self):
+        index = ObjectIndex(self.index_file_path, 16)
+        index.add('01' * 16)
+        index.flush()
+        index = ObjectIndex(self.index_file_path, 16)
+        self.assertIn('01' * 16, index)
+        self.assertNotIn('01' * 8 + '02' * 8, index)
+        self.assertEqual(os.path.getsize(self.index_file_path), ObjectIndex.INDEX_HEADER.size + 16)
+        with self.assertRaises(IOError):
+            '01' * 8 in ObjectIndex(self.index_file_path, 8)
+
+    def test_rebuild(self):
+        index = ObjectIndex(self.index_file_path, 8)
+        index.add('00' * 8)
+        index.rebuild(['ff' * 8, '11' * 8, 'ff' * 8])
+        self.assertNotIn('00' * 8, index)
+        self.assertIn('ff' * 8, index)
+        self.assertEqual(os.path.getsize(self.index_file_path), ObjectIndex.INDEX_HEADER.size + 16)
+        self.assertEqual(len(ObjectIndex(self.index_file_path, 8)), 2)
+
+
+class TestStorageObjectIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        os.mkdir(self.src_path)
+        for i in range(10):
+            with open(os.path.join(self.src_path, 'file_{}'.format(i)), 'w') as f:
+                f.write(str(i) * 100000)
+        self.store_path = os.path.join(self.tmp_dir.name, 'store')
+        self.checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        FileSystemStorage(self.store_path, compression='zlib').store(self.src_path, self.checkpoint)
+        self.checksums = [node.checksum for node in self.checkpoint.root.children.values()]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def remove_objects(self):
+        for dir_path, _, file_names in os.walk(os.path.join(self.store_path, FileSystemStorage.FILE_DIR)):
+            for file_name in file_names:
+                os.remove(os.path.join(dir_path, file_name))
+
+    def test_stored_files_are_indexed(self):
+        self.remove_objects()
+        # answered by the index, without looking for the objects
+        storage = FileSystemStorage(self.store_path)
+        self.assertEqual(storage.has_files(self.checksums + ['00' * 8]), set(self.checksums))
+
+    def test_missing_index_is_rebuilt(self):
+        os.remove(os.path.join(self.store_path, FileSystemStorage.OBJECT_INDEX_FILE))
+        storage = FileSystemStorage(self.store_path)
+        self.assertTrue(storage.has_file(self.checksums[0]))
+        self.assertTrue(os.path.isfile(os.path.join(self.store_path, FileSystemStorage.OBJECT_INDEX_FILE)))
+
+        self.remove_objects()
+        self.assertTrue(all(FileSystemStorage(self.store_path).has_file(checksum) for checksum in self.checksums))
+
+    def test_objects_missing_from_the_index_are_found(self):
+        # e.g. stored by another process after the index was written
+        ObjectIndex(os.path.join(self.store_path, FileSystemStorage.OBJECT_INDEX_FILE), 8).rebuild([])
+        storage = FileSystemStorage(self.store_path)
+        self.assertTrue(storage.has_file(self.checksums[0]))
+        storage.flush()
+
+        self.remove_objects()
+        storage = FileSystemStorage(self.store_path)
+        self.assertTrue(storage.has_file(self.checksums[0]))
+        self.assertFalse(storage.has_file(self.checksums[1]))
+
+    def test_checksums_sharing_a_prefix(self):
+        store_path = os.path.join(self.tmp_dir.name, 'store_128')
+        storage = FileSystemStorage(store_path, hash_algorithm='xxh3_128')
+        checkpoint = storage.create(self.src_path)
+        checksum = checkpoint.lookup('file_0').checksum
+        other_checksum = checksum[:16] + ('0' if checksum[16] != '0' else '1') + checksum[17:]
+        self.assertTrue(storage.has_file(checksum))
+        self.assertFalse(storage.has_file(other_checksum))
+        self.assertFalse(FileSystemStorage(store_path).has_file(other_checksum))
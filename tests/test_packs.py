@@ -0,0 +1,68 @@
+import filecmp
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.packs import PackStore
+from bakker.storage import FileSystemStorage
+
+
+class TestPacks(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.tmp_dir.name, 'store')
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        os.makedirs(os.path.join(self.src_path, 'folder'))
+        for file_name, content in [('small_file.txt', b'small'), ('.hidden_file', b'hidden'),
+                                   ('folder/nested_file.txt', b'nested'), ('large_file', os.urandom(100000))]:
+            with open(os.path.join(self.src_path, file_name), 'wb') as f:
+                f.write(content)
+        os.symlink('small_file.txt', os.path.join(self.src_path, 'link'))
+
+    def test_pack_store(self):
+        packs = PackStore(self.store_path)
+        objects = {'{:016x}'.format(i * 7919): os.urandom(i) for i in range(100)}
+        for checksum, data in objects.items():
+            packs.add(checksum, data)
+        self.assertEqual(packs.read('{:016x}'.format(7919 * 5)), objects['{:016x}'.format(7919 * 5)])
+        packs.close()
+
+        packs = PackStore(self.store_path)
+        packs.add('ffffffffffffffff', b'second session')
+        packs.close()
+
+        packs = PackStore(self.store_path)
+        for checksum, data in objects.items():
+            self.assertEqual(packs.read(checksum), data)
+        self.assertEqual(packs.read('ffffffffffffffff'), b'second session')
+        self.assertNotIn('0000000000000001', packs)
+        packs.close()
+
+    def test_packed_storage(self):
+        storage = FileSystemStorage(self.store_path, packing=True)
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        storage.store(self.src_path, checkpoint)
+
+        # small files are packed, large files stay separate files
+        loose_files = os.listdir(storage.file_path)
+        self.assertIn(checkpoint.root.children['large_file'].checksum, loose_files)
+        self.assertNotIn(checkpoint.root.children['.hidden_file'].checksum, loose_files)
+
+        storage = FileSystemStorage(self.store_path, packing=True)
+        small_file = checkpoint.root.children['small_file.txt']
+        self.assertIn(small_file.checksum, storage.packs)
+        self.assertTrue(storage.has_file(small_file.checksum))
+
+        retrieve_path = os.path.join(self.tmp_dir.name, 'retrieve')
+        os.makedirs(retrieve_path)
+        storage.retrieve(retrieve_path, checkpoint.meta)
+        dir_comparison = filecmp.dircmp(self.src_path, retrieve_path)
+        self.assertEqual(dir_comparison.diff_files, [])
+        self.assertEqual(dir_comparison.left_only, [])
+        self.assertEqual(os.readlink(os.path.join(retrieve_path, 'link')), 'small_file.txt')
+        with open(os.path.join(retrieve_path, 'folder', 'nested_file.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'nested')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
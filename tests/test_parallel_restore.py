@@ -0,0 +1,68 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.diff import diff
+from bakker.restore import RestoreError
+from bakker.storage import FileSystemStorage
+
+
+class TestParallelRestore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        for i in range(5):
+            dir_path = os.path.join(self.src_path, 'dir_{}'.format(i), 'sub')
+            os.makedirs(dir_path)
+            for j in range(20):
+                with open(os.path.join(dir_path, 'file_{}'.format(j)), 'w') as f:
+                    f.write('{} {}'.format(i, j) * (j + 1))
+        os.symlink('dir_0', os.path.join(self.src_path, 'link'))
+        os.chmod(os.path.join(self.src_path, 'dir_1', 'sub'), 0o500)
+        os.chmod(os.path.join(self.src_path, 'dir_2'), 0o750)
+
+        self.storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'), packing=True)
+        self.checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        self.storage.store(self.src_path, self.checkpoint)
+
+    def tearDown(self):
+        for dir_path, dir_names, _ in os.walk(self.tmp_dir.name):
+            for dir_name in dir_names:
+                os.chmod(os.path.join(dir_path, dir_name), 0o700)
+        self.tmp_dir.cleanup()
+
+    def restore(self, workers):
+        dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        # restores leave the permissions of the destination itself alone
+        os.chmod(dst_path, self.checkpoint.root.permissions)
+        stats = self.storage.retrieve(dst_path, self.checkpoint.meta, workers)
+        return dst_path, stats
+
+    def test_parallel_restore_equals_serial_restore(self):
+        serial_path, serial_stats = self.restore(None)
+        parallel_path, parallel_stats = self.restore(4)
+
+        for dst_path in [serial_path, parallel_path]:
+            self.assertEqual(list(diff(self.checkpoint, Checkpoint.build_checkpoint(dst_path))), [])
+        self.assertEqual(stat.S_IMODE(os.lstat(os.path.join(parallel_path, 'dir_1', 'sub')).st_mode), 0o500)
+        self.assertEqual(serial_stats.files_written, 101)
+        self.assertEqual(parallel_stats.files_written, serial_stats.files_written)
+        self.assertEqual(parallel_stats.bytes_written, serial_stats.bytes_written)
+
+    def test_errors_are_aggregated(self):
+        # two files whose objects are gone from the storage
+        broken_nodes = [self.checkpoint.lookup(os.path.join('dir_3', 'sub', 'file_{}'.format(j))) for j in [1, 2]]
+        for node in broken_nodes:
+            node.checksum = '0' * 15 + str(broken_nodes.index(node))
+
+        dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        with self.assertRaises(RestoreError) as context:
+            self.storage.retrieve_tree(self.checkpoint.root, dst_path, workers=4)
+
+        self.assertEqual(sorted(path for path, _ in context.exception.errors),
+                         [os.path.join(dst_path, 'dir_3', 'sub', 'file_{}'.format(j)) for j in [1, 2]])
+        self.assertTrue(os.path.isfile(os.path.join(dst_path, 'dir_3', 'sub', 'file_3')))
+        # the permissions were still applied
+        self.assertEqual(stat.S_IMODE(os.lstat(os.path.join(dst_path, 'dir_1', 'sub')).st_mode), 0o500)
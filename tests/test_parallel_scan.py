@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bakker.cache import HashCache
+from bakker.checkpoint import Checkpoint
+from bakker.diff import diff
+from bakker.storage import FileSystemStorage
+
+
+class TestParallelScan(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        # wide at the top and deep below
+        for d in range(8):
+            dir_path = os.path.join(self.src_path, 'dir_{}'.format(d), *['level_{}'.format(i) for i in range(d)])
+            os.makedirs(dir_path)
+            for f in range(10):
+                file_path = os.path.join(dir_path, 'file_{}'.format(f))
+                with open(file_path, 'w') as file:
+                    file.write('{} {}'.format(d, f))
+                # older than the racy window of the hash cache
+                os.utime(file_path, (1000000000, 1000000000))
+        os.mkdir(os.path.join(self.src_path, 'empty'))
+        os.symlink('dir_1', os.path.join(self.src_path, 'link'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_same_checkpoint(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        for scan_processes in [1, 3]:
+            for workers in [None, 2]:
+                scanned_checkpoint = Checkpoint.build_checkpoint(self.src_path, workers=workers,
+                                                                 scan_processes=scan_processes)
+                self.assertEqual(scanned_checkpoint.root.checksum, checkpoint.root.checksum)
+                self.assertEqual(list(diff(checkpoint, scanned_checkpoint)), [])
+
+    def test_hash_cache(self):
+        hash_cache = HashCache()
+        Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache, scan_processes=2)
+        self.assertEqual(hash_cache.misses, 80)
+        checkpoint = Checkpoint.build_checkpoint(self.src_path, hash_cache=hash_cache, scan_processes=2)
+        self.assertEqual(hash_cache.hits, 80)
+        self.assertEqual(checkpoint.root.checksum, Checkpoint.build_checkpoint(self.src_path).root.checksum)
+
+    def test_scan_file(self):
+        file_path = os.path.join(self.src_path, 'dir_0', 'file_0')
+        self.assertEqual(Checkpoint.build_checkpoint(file_path, scan_processes=2).root.checksum,
+                         Checkpoint.build_checkpoint(file_path).root.checksum)
+
+    def test_storage_create(self):
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'))
+        checkpoint = storage.create(self.src_path, scan_processes=2)
+        dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        os.chmod(dst_path, checkpoint.root.permissions)
+        storage.retrieve(dst_path, checkpoint.meta)
+        self.assertEqual(list(diff(checkpoint, Checkpoint.build_checkpoint(dst_path))), [])
+
+    def test_worker_errors(self):
+        # the workers are forked, so they share the patched function
+        with mock.patch('bakker.scanning._scan_directory', side_effect=ValueError('scan failed')):
+            with self.assertRaises(ValueError):
+                Checkpoint.build_checkpoint(self.src_path, scan_processes=2)
+        with mock.patch('bakker.scanning._scan_directory', side_effect=lambda *args: os._exit(3)):
+            with self.assertRaises(RuntimeError):
+                Checkpoint.build_checkpoint(self.src_path, scan_processes=2)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.restore import NoMatchError
+from bakker.storage import FileSystemStorage
+from bakker.view import CheckpointView, PathNotFoundError
+
+
+class TestPartialRestore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        for dir_path in ['etc/app', 'etc/other', 'data/2024/logs']:
+            os.makedirs(os.path.join(self.src_path, dir_path))
+        self.contents = {
+            'etc/app/app.conf': b'setting = 1\n',
+            'etc/app/app.ini': b'[section]\n',
+            'etc/other/other.conf': b'other = 2\n',
+            'data/2024/logs/big.log': b'a line of a log file\n' * 300000,
+            'data/2024/random': os.urandom(20000),
+            'readme': b'read me\n',
+        }
+        for relative_path, content in self.contents.items():
+            with open(os.path.join(self.src_path, relative_path), 'wb') as f:
+                f.write(content)
+        os.symlink('app', os.path.join(self.src_path, 'etc', 'current'))
+        os.symlink('../readme', os.path.join(self.src_path, 'etc', 'readme'))
+        os.symlink('/etc/passwd', os.path.join(self.src_path, 'etc', 'absolute'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def restored_files(self, path):
+        return sorted(os.path.relpath(os.path.join(dir_path, name), path)
+                      for dir_path, dir_names, file_names in os.walk(path) for name in dir_names + file_names)
+
+    def test_glob(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+
+        def glob(pattern):
+            return sorted(path for _, path in checkpoint.glob(pattern))
+        self.assertEqual(glob('etc/app/app.conf'), ['etc/app/app.conf'])
+        self.assertEqual(glob('/etc/*/*.conf'), ['etc/app/app.conf', 'etc/other/other.conf'])
+        self.assertEqual(glob('**/*.log'), ['data/2024/logs/big.log'])
+        self.assertEqual(glob('data/**'), ['data', 'data/2024', 'data/2024/logs'])
+        self.assertEqual(glob('etc/app/missing'), [])
+        self.assertEqual(glob('readme/file'), [])
+        self.assertEqual(glob(''), [''])
+
+    def test_retrieve_paths(self):
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'))
+        checkpoint = storage.create(self.src_path)
+        dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        stats = storage.retrieve(dst_path, checkpoint.meta, paths=['etc/app', 'etc/app/*.conf', 'data/*/random'])
+        self.assertEqual(stats.files_written, 3)
+        self.assertEqual(self.restored_files(dst_path), ['data', 'data/2024', 'data/2024/random', 'etc', 'etc/app',
+                                                         'etc/app/app.conf', 'etc/app/app.ini'])
+        with open(os.path.join(dst_path, 'data/2024/random'), 'rb') as f:
+            self.assertEqual(f.read(), self.contents['data/2024/random'])
+
+        with self.assertRaises(NoMatchError):
+            storage.retrieve(dst_path, checkpoint.meta, paths=['readme', 'missing/*'])
+        self.assertFalse(os.path.exists(os.path.join(dst_path, 'readme')))
+
+    def test_view(self):
+        for options in [dict(), dict(compression='zlib'), dict(chunking=True), dict(packing=True)]:
+            storage = FileSystemStorage(tempfile.mkdtemp(dir=self.tmp_dir.name), **options)
+            storage.CHUNKING_MIN_FILE_SIZE = 1024 * 1024
+            checkpoint = storage.create(self.src_path)
+            view = CheckpointView(storage, checkpoint)
+
+            for relative_path, content in self.contents.items():
+                with view.open(relative_path) as f:
+                    self.assertEqual(f.read(), content, (options, relative_path))
+            with view.open('etc/current/app.conf') as f:
+                self.assertEqual(f.readline(), b'setting = 1\n')
+            with view.open('etc/readme') as f:
+                self.assertEqual(f.read(), b'read me\n')
+
+        self.assertEqual(view.listdir(), ['data', 'etc', 'readme'])
+        self.assertEqual(view.listdir('etc/current'), ['app.conf', 'app.ini'])
+        self.assertEqual(view.readlink('etc/current'), 'app')
+        self.assertEqual(view.stat('etc/current').st_mode, os.stat(os.path.join(self.src_path, 'etc/app')).st_mode)
+        self.assertEqual(view.stat('etc/current', follow_symlinks=False).st_mode,
+                         os.lstat(os.path.join(self.src_path, 'etc/current')).st_mode)
+        self.assertEqual(view.stat('readme').checksum, checkpoint.lookup('readme').checksum)
+        self.assertTrue(view.exists('etc/app/../other/other.conf'))
+        self.assertFalse(view.exists('etc/absolute'))
+        self.assertFalse(view.exists('../src'))
+        with self.assertRaises(PathNotFoundError):
+            view.open('etc/missing')
+        with self.assertRaises(IsADirectoryError):
+            view.open('etc/current')
+        with self.assertRaises(NotADirectoryError):
+            view.listdir('readme')
+
+        # a missing object is not a missing path
+        storage = FileSystemStorage(tempfile.mkdtemp(dir=self.tmp_dir.name))
+        checkpoint = storage.create(self.src_path)
+        os.remove(storage._find_object_file(storage.file_path, checkpoint.lookup('readme').checksum))
+        with self.assertRaises(FileNotFoundError) as context:
+            CheckpointView(storage, checkpoint).open('readme')
+        self.assertNotIsInstance(context.exception, PathNotFoundError)
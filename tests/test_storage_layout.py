@@ -0,0 +1,86 @@
+import filecmp
+import json
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint, DirectoryNode
+from bakker.storage import FileSystemStorage
+
+
+class TestStorageLayout(unittest.TestCase):
+    CURR_DIR = os.path.dirname(os.path.abspath(__file__))
+    TEST_RESOURCES_PATH = os.path.join(CURR_DIR, '../resources/tests/backup_indexing_test_folder')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.tmp_dir.name, 'store')
+        self.checkpoint = Checkpoint.build_checkpoint(self.TEST_RESOURCES_PATH)
+
+    def object_files(self):
+        file_path = os.path.join(self.store_path, FileSystemStorage.FILE_DIR)
+        return sorted(os.path.relpath(os.path.join(dir_path, file_name), file_path)
+                      for dir_path, _, file_names in os.walk(file_path) for file_name in file_names)
+
+    def assert_retrievable(self, storage):
+        for node, _ in self.checkpoint.iter():
+            if not isinstance(node, DirectoryNode):
+                self.assertTrue(storage.has_file(node.checksum))
+        retrieve_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        storage.retrieve(retrieve_path, self.checkpoint.meta)
+        self.assertEqual(filecmp.dircmp(self.TEST_RESOURCES_PATH, retrieve_path).diff_files, [])
+
+    def test_sharded_layout(self):
+        storage = FileSystemStorage(self.store_path, fan_out=2)
+        storage.store(self.TEST_RESOURCES_PATH, self.checkpoint)
+
+        for object_file in self.object_files():
+            shard_1, shard_2, name = object_file.split(os.sep)
+            self.assertEqual(shard_1 + shard_2, name[:4])
+        with open(os.path.join(self.store_path, FileSystemStorage.LAYOUT_FILE), 'r') as f:
+            self.assertEqual(json.load(f)['fan_out'], 2)
+
+        # the recorded layout is used, not the requested one
+        self.assert_retrievable(FileSystemStorage(self.store_path, fan_out=0))
+
+    def test_flat_store_without_layout_file(self):
+        storage = FileSystemStorage(self.store_path)
+        storage.store(self.TEST_RESOURCES_PATH, self.checkpoint)
+        os.remove(os.path.join(self.store_path, FileSystemStorage.LAYOUT_FILE))
+
+        storage = FileSystemStorage(self.store_path, fan_out=2)
+        self.assertEqual(storage.fan_out, 0)
+        self.assert_retrievable(storage)
+
+    def test_migration(self):
+        storage = FileSystemStorage(self.store_path)
+        storage.store(self.TEST_RESOURCES_PATH, self.checkpoint)
+        flat_object_files = self.object_files()
+
+        storage.migrate(2)
+        self.assertEqual(sorted(os.path.basename(f) for f in self.object_files()), flat_object_files)
+        self.assertEqual(FileSystemStorage(self.store_path).fan_out, 2)
+        self.assert_retrievable(FileSystemStorage(self.store_path))
+
+        storage.migrate(0)
+        self.assertEqual(self.object_files(), flat_object_files)
+
+    def test_interrupted_migration(self):
+        storage = FileSystemStorage(self.store_path)
+        storage.store(self.TEST_RESOURCES_PATH, self.checkpoint)
+
+        # simulate a migration that was interrupted before any object was moved
+        storage.previous_fan_out, storage.fan_out = 0, 2
+        storage._store_layout()
+
+        storage = FileSystemStorage(self.store_path)
+        self.assert_retrievable(storage)
+        with self.assertRaises(ValueError):
+            storage.migrate(1)
+
+        storage.migrate(2)
+        self.assertIsNone(FileSystemStorage(self.store_path).previous_fan_out)
+        self.assert_retrievable(storage)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
@@ -0,0 +1,82 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint, DirectoryNode
+from bakker.diff import diff
+from bakker.hashing import FileHasher
+from bakker.storage import FileSystemStorage
+from bakker import trees
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        for d in range(3):
+            os.makedirs(os.path.join(self.src_path, 'dir_{}'.format(d), 'sub'))
+            for f in range(5):
+                with open(os.path.join(self.src_path, 'dir_{}'.format(d), 'sub', 'file_{}'.format(f)), 'w') as file:
+                    file.write('{} {}'.format(d, f))
+        os.mkdir(os.path.join(self.src_path, 'empty'))
+        os.symlink('dir_0', os.path.join(self.src_path, 'link'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_build_nodes(self):
+        built_checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        paths = []
+        for node, relative_path in Checkpoint.build_nodes(self.src_path, FileHasher()):
+            self.assertEqual(node.checksum, built_checkpoint.lookup(relative_path).checksum)
+            # the children were yielded before
+            if isinstance(node, DirectoryNode):
+                for child_name in node.children:
+                    self.assertIn(os.path.join(relative_path, child_name), paths)
+            paths.append(relative_path)
+        self.assertEqual(paths[-1], '')
+        self.assertCountEqual(paths, [path for _, path in built_checkpoint.iter()])
+        # the children of completed directories are dropped
+        self.assertEqual(node.children, dict())
+
+    def test_write_checkpoint(self):
+        built_checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        trees.update_tree_keys(built_checkpoint.root)
+        for workers in [None, 3]:
+            f = io.BytesIO()
+            meta = Checkpoint.write_checkpoint(self.src_path, f, name='streamed', workers=workers)
+            f.seek(0)
+            checkpoint = Checkpoint.load(f)
+
+            self.assertEqual(meta.checksum, built_checkpoint.root.checksum)
+            self.assertEqual((checkpoint.time, checkpoint.name), (meta.time, 'streamed'))
+            self.assertEqual(list(diff(built_checkpoint, checkpoint)), [])
+            self.assertEqual(checkpoint.root.tree_key, built_checkpoint.root.tree_key)
+
+    def test_write_checkpoint_of_file(self):
+        file_path = os.path.join(self.src_path, 'dir_0', 'sub', 'file_0')
+        f = io.BytesIO()
+        meta = Checkpoint.write_checkpoint(file_path, f)
+        f.seek(0)
+        self.assertEqual(Checkpoint.load(f).root.checksum, meta.checksum)
+        self.assertEqual(meta.checksum, Checkpoint.build_checkpoint(file_path).root.checksum)
+
+    def test_dump_json(self):
+        checkpoint = Checkpoint.build_checkpoint(self.src_path, name='json')
+        f = io.StringIO()
+        checkpoint.dump_json(f)
+        self.assertEqual(json.loads(f.getvalue()), json.loads(checkpoint.to_json()))
+
+    def test_storage_create(self):
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'))
+        checkpoint = storage.create(self.src_path, name='streamed', workers=2)
+        self.assertEqual(list(diff(Checkpoint.build_checkpoint(self.src_path), checkpoint)), [])
+        self.assertEqual(os.listdir(storage.tree_path), [checkpoint.meta.to_string() + storage.BINARY_TREE_FILE_EXT])
+        self.assertEqual([meta.name for meta in storage.retrieve_checkpoint_metas()], ['streamed'])
+
+        dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+        os.chmod(dst_path, checkpoint.root.permissions)
+        storage.retrieve(dst_path, checkpoint.meta)
+        self.assertEqual(list(diff(checkpoint, Checkpoint.build_checkpoint(dst_path))), [])
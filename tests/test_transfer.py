@@ -0,0 +1,132 @@
+import errno
+import os
+import stat
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint
+from bakker.storage import FileSystemStorage
+from bakker.transfer import FileCopier, COPY_METHODS, REFLINK, COPY_FILE_RANGE, BUFFERED, HARDLINK, PACKED
+
+
+class CrossDeviceCopier(FileCopier):
+    def __init__(self, methods=None):
+        super().__init__(methods)
+        self.attempts = 0
+
+    def _copy_file_range(self, src_fd, dst_fd):
+        self.attempts += 1
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_file_path = os.path.join(self.tmp_dir.name, 'src')
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        with open(self.src_file_path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_copied(self, dst_file_path, permissions):
+        with open(dst_file_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(stat.S_IMODE(os.lstat(dst_file_path).st_mode), permissions)
+
+    def test_copy_methods(self):
+        for method in COPY_METHODS:
+            copier = FileCopier([method])
+            dst_file_path = os.path.join(self.tmp_dir.name, method)
+            used_method, size = copier.copy(self.src_file_path, dst_file_path, 0o640)
+
+            self.assert_copied(dst_file_path, 0o640)
+            self.assertEqual(os.stat(dst_file_path).st_mtime_ns, os.stat(self.src_file_path).st_mtime_ns)
+            self.assertEqual(size, len(self.data))
+            # a reflink falls back to the buffered copy on file systems that do not support it
+            self.assertIn(used_method, [method, BUFFERED] if method == REFLINK else [method])
+
+    def test_unsupported_method_falls_back(self):
+        copier = CrossDeviceCopier([COPY_FILE_RANGE])
+        for i in range(2):
+            dst_file_path = os.path.join(self.tmp_dir.name, str(i))
+            self.assertEqual(copier.copy(self.src_file_path, dst_file_path, 0o600), (BUFFERED, len(self.data)))
+            self.assert_copied(dst_file_path, 0o600)
+        # not tried again for the same devices
+        self.assertEqual(copier.attempts, 1)
+
+    def test_restore_keeps_times(self):
+        src_path = os.path.join(self.tmp_dir.name, 'tree')
+        os.mkdir(src_path)
+        for file_name, data in [('small', b'small'), ('large', self.data), ('text', b'compressible text\n' * 1000)]:
+            file_path = os.path.join(src_path, file_name)
+            with open(file_path, 'wb') as f:
+                f.write(data)
+            os.utime(file_path, ns=(2000 * 10**9, 1000 * 10**9))
+
+        for options in [dict(), dict(compression='zlib'), dict(chunking=True), dict(packing=True)]:
+            for create in [False, True]:
+                storage = FileSystemStorage(tempfile.mkdtemp(dir=self.tmp_dir.name), **options)
+                storage.CHUNKING_MIN_FILE_SIZE = 1024 * 1024
+                if create:
+                    checkpoint = storage.create(src_path)
+                else:
+                    checkpoint = Checkpoint.build_checkpoint(src_path)
+                    storage.store(src_path, checkpoint)
+                for incremental in [False, True]:
+                    dst_path = tempfile.mkdtemp(dir=self.tmp_dir.name)
+                    if incremental:
+                        storage.retrieve_incremental(dst_path, checkpoint.meta)
+                    else:
+                        storage.retrieve(dst_path, checkpoint.meta)
+                    for file_name in ['small', 'large', 'text']:
+                        self.assertEqual(os.stat(os.path.join(dst_path, file_name)).st_mtime_ns, 1000 * 10**9,
+                                         (options, create, incremental, file_name))
+
+    def test_hardlink_restore(self):
+        src_path = os.path.join(self.tmp_dir.name, 'tree')
+        os.mkdir(src_path)
+        for file_name, permissions in [('read_only', 0o440), ('writable', 0o644)]:
+            with open(os.path.join(src_path, file_name), 'w') as f:
+                f.write(file_name * 10000)
+            os.chmod(os.path.join(src_path, file_name), permissions)
+        with open(os.path.join(src_path, 'small'), 'w') as f:
+            f.write('small')
+
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'), packing=True, hardlink_restore=True)
+        checkpoint = Checkpoint.build_checkpoint(src_path)
+        storage.store(src_path, checkpoint)
+        dst_path = os.path.join(self.tmp_dir.name, 'dst')
+        os.mkdir(dst_path)
+        storage.retrieve(dst_path, checkpoint.meta)
+
+        self.assertEqual(os.lstat(os.path.join(dst_path, 'read_only')).st_nlink, 2)
+        self.assertEqual(stat.S_IMODE(os.lstat(os.path.join(dst_path, 'read_only')).st_mode), 0o440)
+        self.assertEqual(os.lstat(os.path.join(dst_path, 'writable')).st_nlink, 1)
+        self.assertEqual(stat.S_IMODE(os.lstat(os.path.join(dst_path, 'writable')).st_mode), 0o644)
+        self.assertEqual(storage.retrieve_stats.files[HARDLINK], 1)
+        self.assertEqual(storage.retrieve_stats.files[PACKED], 1)
+        self.assertEqual(sum(storage.store_stats.files.values()), 3)
+
+    def test_hardlink_restore_keeps_object_permissions(self):
+        src_path = os.path.join(self.tmp_dir.name, 'tree')
+        os.mkdir(src_path)
+        # the same content with two different read-only modes
+        for file_name, permissions in [('a', 0o400), ('b', 0o000)]:
+            with open(os.path.join(src_path, file_name), 'w') as f:
+                f.write('content' * 10000)
+            os.chmod(os.path.join(src_path, file_name), permissions)
+
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'), hardlink_restore=True)
+        checkpoint = Checkpoint.build_checkpoint(src_path)
+        storage.store(src_path, checkpoint)
+        object_file_path = storage._find_object_file(storage.file_path, checkpoint.lookup('a').checksum)
+        dst_path = os.path.join(self.tmp_dir.name, 'dst')
+        os.mkdir(dst_path)
+        storage.retrieve(dst_path, checkpoint.meta)
+
+        self.assertEqual(stat.S_IMODE(os.lstat(object_file_path).st_mode), FileSystemStorage.REMOTE_PERMISSIONS)
+        for file_name, permissions, links in [('a', 0o400, 1), ('b', 0o000, 1)]:
+            file_stat = os.lstat(os.path.join(dst_path, file_name))
+            self.assertEqual((stat.S_IMODE(file_stat.st_mode), file_stat.st_nlink), (permissions, links), file_name)
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from bakker.checkpoint import Checkpoint, DirectoryNode, StoredDirectoryNode
+from bakker.storage import FileSystemStorage
+from bakker import trees
+
+
+class TestTreeObjects(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        self.store_path = os.path.join(self.tmp_dir.name, 'store')
+        for dir_name in ['static/deep', 'changing']:
+            os.makedirs(os.path.join(self.src_path, dir_name))
+        for file_name in ['static/deep/file', 'changing/file', 'root_file']:
+            with open(os.path.join(self.src_path, file_name), 'w') as f:
+                f.write(file_name)
+        os.symlink('root_file', os.path.join(self.src_path, 'link'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def tree_objects(self):
+        tree_object_path = os.path.join(self.store_path, FileSystemStorage.TREE_OBJECT_DIR)
+        return [file_name for _, _, file_names in os.walk(tree_object_path) for file_name in file_names]
+
+    def check_tree_nodes(self, tree_node_a, tree_node_b):
+        self.assertEqual(tree_node_a.name, tree_node_b.name)
+        self.assertEqual(tree_node_a.checksum, tree_node_b.checksum)
+        self.assertEqual(tree_node_a.permissions, tree_node_b.permissions)
+        self.assertEqual(isinstance(tree_node_a, DirectoryNode), isinstance(tree_node_b, DirectoryNode))
+
+        if isinstance(tree_node_a, DirectoryNode):
+            self.assertEqual(set(tree_node_a.children), set(tree_node_b.children))
+            for name, child_node_a in tree_node_a.children.items():
+                self.check_tree_nodes(child_node_a, tree_node_b.children[name])
+
+    def test_unchanged_directories_are_stored_once(self):
+        storage = FileSystemStorage(self.store_path, checkpoint_format='tree')
+        checkpoint_1 = Checkpoint.build_checkpoint(self.src_path, 'first')
+        storage.store(self.src_path, checkpoint_1)
+        self.assertEqual(len(self.tree_objects()), 4)
+
+        with open(os.path.join(self.src_path, 'changing', 'file'), 'w') as f:
+            f.write('changed')
+        checkpoint_2 = Checkpoint.build_checkpoint(self.src_path, 'second')
+        storage.store(self.src_path, checkpoint_2)
+        # only the root and the changed directory
+        self.assertEqual(len(self.tree_objects()), 6)
+
+        storage = FileSystemStorage(self.store_path)
+        stored_checkpoint_1 = storage.retrieve_checkpoint(storage.find_by_name('first'))
+        stored_checkpoint_2 = storage.retrieve_checkpoint(storage.find_by_name('second'))
+        self.assertEqual(stored_checkpoint_1.time, checkpoint_1.time)
+        self.assertIsInstance(stored_checkpoint_1.root, StoredDirectoryNode)
+        self.check_tree_nodes(checkpoint_1.root, stored_checkpoint_1.root)
+        self.check_tree_nodes(checkpoint_2.root, stored_checkpoint_2.root)
+        self.assertIs(stored_checkpoint_1.root.children['static'].children,
+                      stored_checkpoint_2.root.children['static'].children)
+
+        retrieve_path = os.path.join(self.tmp_dir.name, 'retrieve')
+        os.mkdir(retrieve_path)
+        storage.retrieve(retrieve_path, stored_checkpoint_2.meta)
+        self.check_tree_nodes(checkpoint_2.root, Checkpoint.build_checkpoint(retrieve_path).root)
+
+    def test_renamed_directory_changes_tree_key(self):
+        checkpoint_1 = Checkpoint.build_checkpoint(self.src_path)
+        os.rename(os.path.join(self.src_path, 'static'), os.path.join(self.src_path, 'static_renamed'))
+        checkpoint_2 = Checkpoint.build_checkpoint(self.src_path)
+
+        # the directory checksum does not cover names as long as their order does not change, the tree key does
+        self.assertEqual(checkpoint_1.root.checksum, checkpoint_2.root.checksum)
+        tree_key_1 = trees.store_trees(checkpoint_1.root, lambda key: False, lambda key, data: None)
+        tree_key_2 = trees.store_trees(checkpoint_2.root, lambda key: False, lambda key, data: None)
+        self.assertNotEqual(tree_key_1, tree_key_2)
+
+    def test_packed_tree_objects(self):
+        storage = FileSystemStorage(self.store_path, checkpoint_format='tree', packing=True, compression='zlib')
+        checkpoint = Checkpoint.build_checkpoint(self.src_path)
+        storage.store(self.src_path, checkpoint)
+        self.assertEqual(self.tree_objects(), [])
+
+        storage = FileSystemStorage(self.store_path)
+        self.check_tree_nodes(checkpoint.root, storage.retrieve_checkpoint(checkpoint.meta).root)
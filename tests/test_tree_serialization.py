@@ -1,7 +1,10 @@
+import io
 import os
+import tempfile
 import unittest
 
-from bakker.checkpoint import Checkpoint, DirectoryNode
+from bakker.checkpoint import Checkpoint, DirectoryNode, FileNode, LazyDirectoryNode
+from bakker.compression import CODECS
 
 
 class TestTreeSerialization(unittest.TestCase):
@@ -23,9 +26,74 @@ class TestTreeSerialization(unittest.TestCase):
         new_tree = Checkpoint.from_json(self.tree.to_json())
         self.check_tree_nodes(self.tree.root, new_tree.root)
         
+    def test_binary_serialization(self):
+        f = io.BytesIO()
+        self.tree.dump(f)
+        f.seek(0)
+        new_tree = Checkpoint.load(f)
+
+        self.assertEqual(self.tree.time, new_tree.time)
+        self.assertEqual(self.tree.name, new_tree.name)
+        self.check_tree_nodes(self.tree.root, new_tree.root)
+        self.check_tree_nodes(new_tree.root, self.tree.root)
+
+    def test_compressed_binary_serialization(self):
+        f = io.BytesIO()
+        self.tree.name = 'named'
+        self.tree.dump(f, CODECS['zlib'])
+        f.seek(0)
+        new_tree = Checkpoint.load(f)
+
+        self.assertEqual(new_tree.name, 'named')
+        self.check_tree_nodes(self.tree.root, new_tree.root)
+
+    def test_lazy_binary_loading(self):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            checkpoint_file_path = os.path.join(tmp_path, 'checkpoint.ckpt')
+            with open(checkpoint_file_path, 'wb') as f:
+                self.tree.dump(f)
+            with open(checkpoint_file_path, 'rb') as f:
+                new_tree = Checkpoint.load(f)
+
+            self.assertIsInstance(new_tree.root, LazyDirectoryNode)
+            self.assertIsNone(new_tree.root._children)
+
+            node = new_tree.lookup(os.path.join('backup_indexing_test_folder', 'folder1', 'folder3', 'folder8', 'hello-2.10.tar.gz'))
+            expected_node = self.tree.lookup(os.path.join('backup_indexing_test_folder', 'folder1', 'folder3', 'folder8', 'hello-2.10.tar.gz'))
+            self.assertIsInstance(node, FileNode)
+            self.assertEqual(node.checksum, expected_node.checksum)
+            # only the directories on the path were searched, none of them was decoded completely
+            self.assertIsNone(new_tree.root._children)
+
+            self.assertIs(new_tree.lookup(''), new_tree.root)
+            self.assertIsNone(new_tree.lookup('does_not_exist'))
+            self.assertIsNone(new_tree.lookup(os.path.join('backup_indexing_test_folder', 'touched_file1.txt', 'child')))
+            self.check_tree_nodes(self.tree.root, new_tree.root)
+
+    def test_compact_nodes(self):
+        f = io.BytesIO()
+        self.tree.dump(f)
+        f.seek(0)
+        new_tree = Checkpoint.load(f)
+
+        for node, path in new_tree.iter():
+            self.assertFalse(hasattr(node, '__dict__'))
+            self.assertEqual(len(node.digest), 8)
+            self.assertEqual(node.checksum, node.digest.hex())
+            # the names of both trees are the same interned strings
+            self.assertIs(node.name, self.tree.lookup(path).name)
+
+        node = FileNode('name', 'ab' * 8, 0o644)
+        self.assertEqual(node.digest, b'\xab' * 8)
+        node.checksum = None
+        self.assertIsNone(node.digest)
+
     def check_tree_nodes(self, tree_node_a, tree_node_b):
         self.assertEqual(tree_node_a.name, tree_node_b.name)
-        self.assertEqual(tree_node_a.__class__, tree_node_b.__class__)
+        self.assertEqual(tree_node_a.checksum, tree_node_b.checksum)
+        self.assertEqual(tree_node_a.permissions, tree_node_b.permissions)
+        # loaded directories are LazyDirectoryNodes
+        self.assertTrue(isinstance(tree_node_a, tree_node_b.__class__) or isinstance(tree_node_b, tree_node_a.__class__))
 
         if isinstance(tree_node_a, DirectoryNode):
             for name, child_node_a in tree_node_a.children.items():
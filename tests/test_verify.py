@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from bakker.storage import FileSystemStorage
+from bakker.verify import Throttle, Verifier
+
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_path = os.path.join(self.tmp_dir.name, 'src')
+        os.makedirs(os.path.join(self.src_path, 'dir'))
+        for i in range(10):
+            with open(os.path.join(self.src_path, 'dir', 'file_{}'.format(i)), 'wb') as f:
+                f.write('file {}\n'.format(i).encode() * (i + 1))
+        with open(os.path.join(self.src_path, 'large'), 'wb') as f:
+            f.write(os.urandom(3 * 1024 * 1024))
+        os.symlink('dir', os.path.join(self.src_path, 'link'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_storage(self, **options):
+        storage = FileSystemStorage(os.path.join(self.tmp_dir.name, 'store'), **options)
+        storage.CHUNKING_MIN_FILE_SIZE = 1024 * 1024
+        checkpoint = storage.create(self.src_path, name='checkpoint')
+        return storage, checkpoint
+
+    def corrupt(self, file_path, offset=0):
+        os.chmod(file_path, 0o640)
+        with open(file_path, 'r+b') as f:
+            f.seek(offset)
+            data = f.read(1)
+            f.seek(offset)
+            f.write(bytes([data[0] ^ 1]))
+
+    def test_verify(self):
+        storage, checkpoint = self.create_storage()
+        verifier = Verifier(storage, workers=3, state_file_path=storage.verify_state_file_path)
+        report = verifier.verify()
+        self.assertTrue(report.complete)
+        self.assertEqual((report.files, report.corrupt, report.missing), (12, [], []))
+
+        corrupt_checksum = checkpoint.lookup('dir/file_3').checksum
+        missing_checksum = checkpoint.lookup('large').checksum
+        self.corrupt(storage._find_object_file(storage.file_path, corrupt_checksum))
+        os.remove(storage._find_object_file(storage.file_path, missing_checksum))
+        report = verifier.verify()
+        self.assertEqual((report.corrupt, report.missing), ([corrupt_checksum], [missing_checksum]))
+        self.assertEqual(verifier.find_references([corrupt_checksum]),
+                         {corrupt_checksum: [[checkpoint.meta.to_string(), os.path.join('dir', 'file_3')]]})
+        self.assertFalse(os.path.exists(storage.verify_state_file_path))
+
+    def test_resume(self):
+        storage, checkpoint = self.create_storage()
+        corrupt_checksum = max(checkpoint.lookup('dir/file_{}'.format(i)).checksum for i in range(10))
+        self.corrupt(storage._find_object_file(storage.file_path, corrupt_checksum))
+
+        def interrupt(report):
+            if report.files == 5:
+                raise KeyboardInterrupt()
+        with self.assertRaises(KeyboardInterrupt):
+            Verifier(storage, workers=2, state_file_path=storage.verify_state_file_path, progress=interrupt).verify()
+        self.assertTrue(os.path.exists(storage.verify_state_file_path))
+
+        verified = []
+        report = Verifier(storage, state_file_path=storage.verify_state_file_path,
+                          progress=lambda report: verified.append(report.position)).verify()
+        self.assertTrue(report.complete)
+        self.assertEqual(len(verified), 7)
+        self.assertEqual((report.files, report.corrupt), (12, [corrupt_checksum]))
+        self.assertFalse(os.path.exists(storage.verify_state_file_path))
+
+    def test_quarantine(self):
+        for options in [dict(), dict(packing=True), dict(chunking=True)]:
+            storage, checkpoint = self.create_storage(**options)
+            if options.get('packing'):
+                checksum = checkpoint.lookup('dir/file_0').checksum
+                pack_id, offset = storage.packs.lookup(checksum)[:2]
+                self.corrupt(storage.packs._pack_file_path(pack_id), offset)
+            elif options.get('chunking'):
+                checksum = checkpoint.lookup('large').checksum
+                manifest_file_path = storage._find_object_file(storage.manifest_path,
+                                                               checksum + storage.MANIFEST_FILE_EXT)
+                with open(manifest_file_path, 'r') as f:
+                    chunk_checksum = json.load(f)['chunks'][0][0]
+                self.corrupt(storage._find_object_file(storage.chunk_path, chunk_checksum))
+            else:
+                checksum = checkpoint.lookup('dir/file_0').checksum
+                self.corrupt(storage._find_object_file(storage.file_path, checksum))
+
+            report = Verifier(storage, quarantine=True).verify()
+            self.assertEqual(report.corrupt, [checksum], options)
+            self.assertFalse(storage.has_file(checksum))
+            if not options.get('packing'):
+                self.assertTrue(os.listdir(storage.quarantine_path))
+
+            # the next checkpoint stores the file again
+            storage.create(self.src_path)
+            self.assertEqual(Verifier(storage).verify().corrupt, [])
+            self.tmp_dir.cleanup()
+            self.setUp()
+
+    def test_throttle(self):
+        throttle = Throttle(1000)
+        start = time.monotonic()
+        for _ in range(4):
+            throttle.consume(50)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)